@@ -0,0 +1,139 @@
+"""
+Call Campaigns
+Creates INSPECTION_CALL tasks in bulk for the clients that need an
+inspection (the DueClientService criteria of clients_needing_inspection),
+skipping clients that already have an open task, and spreads them over the
+active CALL_CENTER agents: each task goes to the agent with the fewest open
+tasks, so agents that are behind get less new work.
+
+Clients are read in primary-key batches and each batch is written with one
+bulk_create in its own short transaction, so memory is bounded by
+``batch_size`` whatever the number of clients, and a run that is interrupted
+can be started again: clients that already got their task are skipped.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from datetime import date
+from .models import CallTask
+from .services import DueClientService
+import heapq
+
+User = get_user_model()
+
+# pg_advisory_xact_lock key: campaigns write their batches one at a time
+CAMPAIGN_LOCK = 0x43414c4c
+
+
+class CallCampaign:
+    """
+    One campaign run. ``count()`` and ``agents()`` only read; ``run()``
+    creates the tasks.
+    """
+
+    def __init__(self, assigned_by=None, priorities=None, city=None, limit=None, batch_size=2000, today=None):
+        priorities = list(priorities or [])
+        invalid = [value for value in priorities if value not in CallTask.Priority.values]
+        if invalid:
+            raise ValueError(f"Prioridad inválida: {', '.join(invalid)}")
+        if limit is not None and limit < 1:
+            raise ValueError('El límite debe ser mayor que cero')
+        self.assigned_by = assigned_by
+        self.priorities = priorities
+        self.city = city
+        self.limit = limit
+        self.batch_size = batch_size
+        self.today = today or date.today()
+
+    def clients(self):
+        """Due clients without an open task (NOT EXISTS, an anti-join), in primary-key order"""
+        open_tasks = CallTask.objects.filter(client_user=OuterRef('pk'), status__in=CallTask.OPEN_STATUSES)
+        clients = DueClientService.queryset(self.today).alias(
+            has_open_task=Exists(open_tasks)
+        ).filter(has_open_task=False)
+        if self.priorities:
+            clients = clients.filter(priority__in=self.priorities)
+        if self.city:
+            clients = clients.filter(city__iexact=self.city)
+        return clients.order_by('pk')
+
+    def count(self):
+        total = self.clients().count()
+        return min(total, self.limit) if self.limit is not None else total
+
+    def agents(self):
+        """Active CALL_CENTER agents with their open task counts, least loaded first"""
+        return list(User.objects.filter(
+            role=User.Role.CALL_CENTER, is_active=True
+        ).annotate(
+            open_tasks=Count('tasks_assigned', filter=Q(tasks_assigned__status__in=CallTask.OPEN_STATUSES))
+        ).only('id', 'first_name', 'middle_name', 'last_name', 'second_last_name').order_by('open_tasks', 'pk'))
+
+    def task(self, client, agent_id):
+        return CallTask(
+            task_type=CallTask.TaskType.INSPECTION_CALL,
+            client_name=client.get_full_name(),
+            client_phone=str(client.phone_number) if client.phone_number else '',
+            client_email=client.email,
+            client_dni=client.dni,
+            client_address=client.address or '',
+            client_user=client,
+            last_inspection_date=client.last_inspection_date,
+            next_inspection_due=client.next_inspection_due,
+            days_until_due=client.days_until_due,
+            priority=client.priority,
+            assigned_by=self.assigned_by,
+            assigned_to_id=agent_id,
+        )
+
+    def run(self, progress=None):
+        """
+        Create the tasks. ``progress(created, total)`` is called after every
+        batch.
+
+        Returns:
+            ``{'created': n, 'assigned': [{'id', 'name', 'tasks'}, ...]}``;
+            tasks are left unassigned when there is no active agent
+        """
+        total = self.count()
+        agents = self.agents()
+        # (open tasks, order, agent id): ties go round-robin in agent order
+        load = [(agent.open_tasks, index, agent.pk) for index, agent in enumerate(agents)]
+        heapq.heapify(load)
+        assigned = {agent.pk: 0 for agent in agents}
+
+        created = 0
+        last_pk = None
+        while self.limit is None or created < self.limit:
+            size = self.batch_size if self.limit is None else min(self.batch_size, self.limit - created)
+            with transaction.atomic():
+                # Another campaign's batch is either committed (and its
+                # clients filtered out below) or waits for this one
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CAMPAIGN_LOCK])
+                clients = self.clients()
+                if last_pk is not None:
+                    clients = clients.filter(pk__gt=last_pk)
+                clients = list(clients[:size])
+                if not clients:
+                    break
+                tasks = []
+                for client in clients:
+                    agent_id = None
+                    if load:
+                        open_tasks, index, agent_id = heapq.heappop(load)
+                        heapq.heappush(load, (open_tasks + 1, index, agent_id))
+                        assigned[agent_id] += 1
+                    tasks.append(self.task(client, agent_id))
+                CallTask.objects.bulk_create(tasks)
+            created += len(tasks)
+            last_pk = clients[-1].pk
+            if progress:
+                progress(created, max(total, created))
+        return {
+            'created': created,
+            'assigned': [
+                {'id': str(agent.pk), 'name': agent.get_full_name(), 'tasks': assigned[agent.pk]}
+                for agent in agents
+            ],
+        }
@@ -0,0 +1,102 @@
+"""
+Call Center Work Queue
+Hands each agent the next open CallTask instead of a fixed personal list.
+
+``CallQueue.claim(agent)`` picks the most urgent claimable task (priority,
+then days until due, in the order of calltask_queue_idx) with
+``SELECT ... FOR UPDATE SKIP LOCKED``: agents claiming at the same time each
+get a different row without waiting on each other, and no task is dialed
+twice. A claimed task is IN_PROGRESS and leased to its agent until
+``lease_expires_at``; ``renew()`` extends the lease while the call goes on
+and leaving IN_PROGRESS ends it.
+
+Claimable tasks are the open ones assigned to the agent or to nobody, whose
+last unanswered call is older than RETRY_MINUTES, plus IN_PROGRESS tasks
+whose lease expired (the agent left): those go back to the pool as they are.
+``release_expired()`` also resets them to PENDING so listings show them free.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from .models import CALL_PRIORITY_RANK, CallTask
+
+
+class CallQueue:
+    """
+    Claiming, renewing and releasing CallTask leases
+    """
+
+    @staticmethod
+    def options():
+        return {'LEASE_MINUTES': 15, 'RETRY_MINUTES': 60, **getattr(settings, 'CALL_QUEUE', {})}
+
+    @classmethod
+    def claimable(cls, agent, now=None):
+        """Tasks ``agent`` may claim, in dispatch order"""
+        now = now or timezone.now()
+        options = cls.options()
+        retry_before = now - timedelta(minutes=options['RETRY_MINUTES'])
+        waiting = Q(status=CallTask.Status.PENDING) | Q(
+            Q(last_call_date__isnull=True) | Q(last_call_date__lte=retry_before),
+            status=CallTask.Status.NO_ANSWER,
+        )
+        abandoned = Q(status=CallTask.Status.IN_PROGRESS, lease_expires_at__lte=now)
+        return CallTask.objects.filter(
+            Q(waiting, Q(assigned_to=agent) | Q(assigned_to__isnull=True)) | abandoned,
+            # Implies the condition of calltask_queue_idx
+            status__in=CallTask.OPEN_STATUSES,
+        ).order_by(CALL_PRIORITY_RANK, 'days_until_due', 'id')
+
+    @classmethod
+    def claim(cls, agent):
+        """
+        Lease the next task to ``agent`` and count the call attempt.
+
+        Returns:
+            The claimed CallTask, or None when the queue is empty
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            task = cls.claimable(agent, now).select_for_update(skip_locked=True).first()
+            if task is None:
+                return None
+            task.status = CallTask.Status.IN_PROGRESS
+            task.assigned_to = agent
+            task.lease_expires_at = now + timedelta(minutes=cls.options()['LEASE_MINUTES'])
+            task.last_call_date = now
+            task.call_attempts += 1
+            task.save(update_fields=[
+                'status', 'assigned_to', 'lease_expires_at', 'last_call_date', 'call_attempts', 'updated_at',
+            ])
+        return task
+
+    @classmethod
+    def renew(cls, task_id, agent):
+        """
+        Extend the lease ``agent`` holds on a task.
+
+        Returns:
+            The new expiry, or None when the agent no longer holds the task
+        """
+        expires = timezone.now() + timedelta(minutes=cls.options()['LEASE_MINUTES'])
+        renewed = CallTask.objects.filter(
+            pk=task_id, assigned_to=agent, status=CallTask.Status.IN_PROGRESS, lease_expires_at__gt=timezone.now(),
+        ).update(lease_expires_at=expires, updated_at=timezone.now())
+        return expires if renewed else None
+
+    @staticmethod
+    def release_expired():
+        """
+        Put tasks with an expired lease back in the queue as PENDING and
+        unassigned. Returns the number of tasks released.
+        """
+        return CallTask.objects.filter(
+            status=CallTask.Status.IN_PROGRESS, lease_expires_at__lte=timezone.now(),
+        ).update(
+            status=CallTask.Status.PENDING,
+            assigned_to=None,
+            lease_expires_at=None,
+            updated_at=timezone.now(),
+        )
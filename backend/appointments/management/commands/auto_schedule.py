@@ -0,0 +1,60 @@
+"""
+Assign inspectors and slots to pending appointments and scheduled call tasks
+
+Prints the plan as a diff; nothing is written without --apply:
+    python manage.py auto_schedule --days 14
+    python manage.py auto_schedule --apply
+"""
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+from appointments.scheduling import AutoScheduler
+import json
+import time
+
+
+class Command(BaseCommand):
+    help = 'Plan (and with --apply, write) inspector assignments for pending work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to schedule (YYYY-MM-DD), tomorrow by default')
+        parser.add_argument('--days', type=int, help='Days in the horizon (AUTO_SCHEDULING HORIZON_DAYS)')
+        parser.add_argument('--apply', action='store_true', help='Write the plan')
+        parser.add_argument('--json', action='store_true', help='Print the plan as JSON')
+        parser.add_argument('--quiet', action='store_true', help='Only print the summary')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Invalid --start date: {options['start']}")
+
+        scheduler = AutoScheduler(start=start, days=options['days'])
+        began = time.perf_counter()
+        plan = scheduler.plan()
+        planned_in = time.perf_counter() - began
+        summary = scheduler.summary(plan)
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'summary': summary,
+                'plan': [
+                    {key: item[key] for key in ('kind', 'id', 'client_name', 'before', 'after')}
+                    for item in plan
+                ],
+            }, default=str, indent=2))
+        elif not options['quiet']:
+            for line in scheduler.diff(plan):
+                self.stdout.write(line)
+
+        message = (
+            f"{summary['placed']}/{summary['items']} placed "
+            f"({summary['rescheduled']} appointments, {summary['created']} from tasks), "
+            f"{summary['unplaced']} without a slot, planned in {planned_in:.2f} s"
+        )
+        if not options['apply']:
+            self.stderr.write(f"{message}. Dry run: use --apply to write it")
+            return
+        written = scheduler.apply(plan)
+        self.stderr.write(self.style.SUCCESS(f"{message}. {written} appointments written"))
@@ -0,0 +1,55 @@
+"""
+Create call tasks for every client that needs an inspection
+
+Clients with an open task are skipped; tasks go to the least loaded active
+CALL_CENTER agents:
+    python manage.py call_campaign --dry-run
+    python manage.py call_campaign --priority URGENT --priority HIGH --city Bogotá
+"""
+from django.core.management.base import BaseCommand, CommandError
+from appointments.campaigns import CallCampaign
+import time
+
+
+class Command(BaseCommand):
+    help = 'Create INSPECTION_CALL tasks in bulk for due and overdue clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--priority', action='append', dest='priorities',
+                            help='Only clients with this priority (repeatable)')
+        parser.add_argument('--city', help='Only clients of this city')
+        parser.add_argument('--limit', type=int, help='Maximum number of tasks to create')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the clients')
+
+    def handle(self, *args, **options):
+        try:
+            campaign = CallCampaign(
+                priorities=options['priorities'],
+                city=options['city'],
+                limit=options['limit'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            agents = campaign.agents()
+            self.stdout.write(
+                f"{campaign.count()} clients would get a task, spread over {len(agents)} agents"
+            )
+            return
+
+        began = time.perf_counter()
+
+        def progress(created, total):
+            self.stderr.write(f"{created}/{total} tasks created ({time.perf_counter() - began:.1f} s)")
+
+        result = campaign.run(progress=progress)
+        for agent in result['assigned']:
+            self.stdout.write(f"{agent['name']}: {agent['tasks']}")
+        if result['created'] and not result['assigned']:
+            self.stderr.write(self.style.WARNING('No active CALL_CENTER agents: tasks left unassigned'))
+        self.stderr.write(self.style.SUCCESS(
+            f"{result['created']} tasks created in {time.perf_counter() - began:.1f} s"
+        ))
@@ -0,0 +1,30 @@
+"""
+Rebuild the inspector availability bitmaps from the appointments table
+
+Run once after migrating, then nightly (cron, Celery beat...):
+    python manage.py rebuild_availability --days 90
+"""
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+from appointments.services import AvailabilityService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild InspectorAvailability bitmaps for a range of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD), today by default')
+        parser.add_argument('--days', type=int, default=90, help='Number of days to rebuild')
+        parser.add_argument('--inspector', help='Only rebuild this inspector (id)')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Invalid --start date: {options['start']}")
+        written = AvailabilityService.rebuild(
+            start=start, days=options['days'], inspector_id=options['inspector']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Availability rebuilt: {written} inspector-days busy"))
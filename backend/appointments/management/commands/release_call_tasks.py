@@ -0,0 +1,17 @@
+"""
+Put call tasks whose lease expired back in the queue
+
+Claims already skip past expired leases; this resets them to PENDING and
+unassigned so task listings show them as free. Meant for cron:
+    python manage.py release_call_tasks
+"""
+from django.core.management.base import BaseCommand
+from appointments.dispatch import CallQueue
+
+
+class Command(BaseCommand):
+    help = 'Release call tasks whose agent lease expired'
+
+    def handle(self, *args, **options):
+        released = CallQueue.release_expired()
+        self.stdout.write(self.style.SUCCESS(f"{released} tasks released"))
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:10
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0004_add_task_type_to_calltask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['scheduled_date', 'scheduled_time', 'id'], name='appt_schedule_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='appointment',
+            name='appointment_schedul_59e8bc_idx',
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InspectorAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Día')),
+                ('busy', models.BigIntegerField(default=0, verbose_name='Franjas Ocupadas')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Última Actualización')),
+                ('inspector', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_days', to=settings.AUTH_USER_MODEL, verbose_name='Inspector')),
+            ],
+            options={
+                'verbose_name': 'Disponibilidad de Inspector',
+                'verbose_name_plural': 'Disponibilidad de Inspectores',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inspectoravailability',
+            constraint=models.UniqueConstraint(fields=('day', 'inspector'), name='availability_day_inspector_uniq'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:56
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0006_inspector_availability'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='calltask',
+            index=models.Index(
+                condition=models.Q(('status__in', ['PENDING', 'IN_PROGRESS', 'NO_ANSWER'])),
+                fields=['client_user'],
+                name='calltask_open_client_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-17 00:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0007_calltask_open_client_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calltask',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reserva Hasta'),
+        ),
+        AddIndexConcurrently(
+            model_name='calltask',
+            index=models.Index(
+                models.Case(
+                    models.When(priority='URGENT', then=models.Value(0)),
+                    models.When(priority='HIGH', then=models.Value(1)),
+                    models.When(priority='MEDIUM', then=models.Value(2)),
+                    models.When(priority='LOW', then=models.Value(3)),
+                    default=models.Value(4),
+                ),
+                models.F('days_until_due'),
+                models.F('id'),
+                condition=models.Q(('status__in', ['PENDING', 'IN_PROGRESS', 'NO_ANSWER'])),
+                name='calltask_queue_idx',
+            ),
+        ),
+    ]
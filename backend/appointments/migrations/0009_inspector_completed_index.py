@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-17 00:31
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0008_calltask_queue'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(
+                condition=models.Q(('status', 'COMPLETED')),
+                fields=['inspector', 'scheduled_date', 'scheduled_time', 'id'],
+                name='appt_inspector_completed_idx',
+            ),
+        ),
+    ]
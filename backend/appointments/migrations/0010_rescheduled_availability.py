@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 09:12
+
+from django.db import migrations
+
+
+def refresh_rescheduled_days(apps, schema_editor):
+    """
+    RESCHEDULED appointments now hold their slot: recompute the stored
+    bitmaps of the inspector-days that have one
+    """
+    # The bitmaps are derived data, rebuilt with the current service
+    from appointments.services import AvailabilityService
+
+    Appointment = apps.get_model('appointments', 'Appointment')
+    days = {}
+    for inspector_id, day in Appointment.objects.filter(
+        status='RESCHEDULED', inspector__isnull=False
+    ).order_by().values_list('inspector_id', 'scheduled_date').distinct():
+        days.setdefault(inspector_id, []).append(day)
+    for inspector_id, inspector_days in days.items():
+        AvailabilityService.refresh(inspector_id, inspector_days)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_inspector_completed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_rescheduled_days, migrations.RunPython.noop),
+    ]
@@ -101,9 +101,17 @@ class Appointment(models.Model):
         verbose_name_plural = 'Citas'
         ordering = ['-scheduled_date', '-scheduled_time']
         indexes = [
-            models.Index(fields=['scheduled_date', 'scheduled_time']),
+            # Also the keyset pagination key (core.utils.pagination)
+            models.Index(fields=['scheduled_date', 'scheduled_time', 'id'], name='appt_schedule_id_idx'),
             models.Index(fields=['status']),
             models.Index(fields=['inspector']),
+            # One inspector's completed work in schedule order: history pages
+            # and punctuality statistics (appointments.services.PunctualityService)
+            models.Index(
+                fields=['inspector', 'scheduled_date', 'scheduled_time', 'id'],
+                condition=models.Q(status='COMPLETED'),
+                name='appt_inspector_completed_idx',
+            ),
         ]
     
     def __str__(self):
@@ -162,6 +170,20 @@ class Appointment(models.Model):
         return int(diff.total_seconds() / 60)
 
 
+# Orden de atención de las prioridades de CallTask (índice calltask_queue_idx)
+CALL_PRIORITY_RANK = models.Case(
+    *(
+        models.When(priority=value, then=models.Value(rank))
+        for rank, value in enumerate(['URGENT', 'HIGH', 'MEDIUM', 'LOW'])
+    ),
+    default=models.Value(4),
+)
+
+# Estados de CallTask en los que el cliente todavía debe ser contactado.
+# Fuera de la clase para que los índices parciales de Meta usen la misma lista
+CALL_TASK_OPEN_STATUSES = ['PENDING', 'IN_PROGRESS', 'NO_ANSWER']
+
+
 class CallTask(models.Model):
     """
     Tareas asignadas por Call Center Admin a Call Centers normales
@@ -186,6 +208,9 @@ class CallTask(models.Model):
         INSPECTION_CALL = 'INSPECTION_CALL', 'Llamada de Inspección'
         RESCHEDULE = 'RESCHEDULE', 'Reprogramación'
     
+    # Tareas en las que el cliente todavía debe ser contactado
+    OPEN_STATUSES = tuple(map(Status, CALL_TASK_OPEN_STATUSES))
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
     # Tipo de tarea
@@ -266,6 +291,8 @@ class CallTask(models.Model):
     notes = models.TextField('Notas', blank=True, null=True)
     call_attempts = models.PositiveIntegerField('Intentos de Llamada', default=0)
     last_call_date = models.DateTimeField('Última Llamada', null=True, blank=True)
+    # Fin de la reserva de la tarea por su agente (appointments.dispatch)
+    lease_expires_at = models.DateTimeField('Reserva Hasta', null=True, blank=True)
     
     # Cita resultante (si se agenda)
     resulting_appointment = models.ForeignKey(
@@ -290,7 +317,48 @@ class CallTask(models.Model):
             models.Index(fields=['assigned_to']),
             models.Index(fields=['priority']),
             models.Index(fields=['next_inspection_due']),
+            # "Does this client already have an open task?" (appointments.campaigns)
+            models.Index(
+                fields=['client_user'],
+                condition=models.Q(status__in=CALL_TASK_OPEN_STATUSES),
+                name='calltask_open_client_idx',
+            ),
+            # Dispatch order of the work queue (appointments.dispatch)
+            models.Index(
+                CALL_PRIORITY_RANK, models.F('days_until_due'), models.F('id'),
+                condition=models.Q(status__in=CALL_TASK_OPEN_STATUSES),
+                name='calltask_queue_idx',
+            ),
         ]
     
     def __str__(self):
         return f"Tarea: {self.client_name} - {self.get_status_display()}"
+
+
+class InspectorAvailability(models.Model):
+    """
+    Ocupación de un inspector en un día, como mapa de bits de franjas de
+    30 minutos: el bit n es la franja que empieza n * 30 minutos después de
+    la medianoche. Se mantiene desde las citas (appointments.services).
+    """
+    
+    inspector = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='availability_days',
+        verbose_name='Inspector'
+    )
+    day = models.DateField('Día')
+    busy = models.BigIntegerField('Franjas Ocupadas', default=0)
+    updated_at = models.DateTimeField('Última Actualización', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Disponibilidad de Inspector'
+        verbose_name_plural = 'Disponibilidad de Inspectores'
+        constraints = [
+            # Day first: one day's rows are read together by available_inspectors
+            models.UniqueConstraint(fields=['day', 'inspector'], name='availability_day_inspector_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.inspector_id} - {self.day}"
@@ -0,0 +1,489 @@
+"""
+Auto-Scheduling Engine
+Assigns inspectors and time slots in bulk to the work waiting for one:
+
+- PENDING appointments without an inspector (their requested date and
+  time are kept when some inspector is free then)
+- NEEDS_RESCHEDULE appointments
+- CallTasks in APPOINTMENT_SCHEDULED with no resulting appointment yet
+  (a RESCHEDULE task follows its source appointment instead)
+
+Placement is greedy, earliest day first, over the working slots of the
+AUTO_SCHEDULING setting. It respects the availability bitmaps, each
+inspector's expected duration and the daily capacity. Inspectors already
+working in the same neighborhood that day are preferred so routes stay
+grouped; otherwise the least loaded inspector not working in another city
+that day is used. Everything is loaded up front in a handful of queries
+and planned in memory.
+
+``plan()`` only reads; ``apply(plan)`` writes it with bulk queries,
+skipping rows edited and slots booked since planning.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Q, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from .models import Appointment, CallTask, InspectorAvailability
+from .services import SLOT_MINUTES, DEFAULT_DURATION_MINUTES, AvailabilityService
+from .signals import appointments_bulk_changed
+import math
+
+User = get_user_model()
+
+PRIORITY_RANK = {
+    CallTask.Priority.URGENT: 0,
+    CallTask.Priority.HIGH: 1,
+    CallTask.Priority.MEDIUM: 2,
+    CallTask.Priority.LOW: 3,
+}
+
+# Appointments that do not take one of the inspector's daily visits
+FREE_STATUSES = (Appointment.Status.CANCELLED, Appointment.Status.NEEDS_RESCHEDULE)
+
+# Fields compared before writing, to skip rows edited since planning
+APPOINTMENT_STATE = ('inspector_id', 'scheduled_date', 'scheduled_time', 'status')
+
+
+def _area(city, neighborhood):
+    return ((city or '').strip().lower(), (neighborhood or '').strip().lower())
+
+
+def _slot(value):
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def _clock(slot):
+    return time(*divmod(slot * SLOT_MINUTES, 60))
+
+
+class AutoScheduler:
+    """
+    Plan and apply inspector assignments for pending work
+    """
+
+    def __init__(self, start=None, days=None, options=None):
+        options = {**getattr(settings, 'AUTO_SCHEDULING', {}), **(options or {})}
+        self.start = start or timezone.localdate() + timedelta(days=1)
+        self.horizon = days or options.get('HORIZON_DAYS', 14)
+        self.capacity = options.get('DAILY_CAPACITY', 8)
+        workdays = set(options.get('WORKDAYS', range(7)))
+        self.days = [
+            day for day in (self.start + timedelta(days=offset) for offset in range(self.horizon))
+            if day.weekday() in workdays
+        ]
+        self.first_slot = _slot(datetime.strptime(options.get('WORKDAY_START', '08:00'), '%H:%M'))
+        self.last_slot = _slot(datetime.strptime(options.get('WORKDAY_END', '17:00'), '%H:%M'))
+
+    # ----------------------------------------------------------- loading
+
+    def load(self):
+        """Read the work to place and the inspectors' state for the horizon"""
+        self.inspectors = {
+            row['id']: row for row in User.objects.filter(
+                role=User.Role.INSPECTOR, is_active=True
+            ).order_by('id').values('id', 'first_name', 'last_name')
+        }
+        durations = AvailabilityService.expected_durations(list(self.inspectors))
+        self.slots_needed = {
+            inspector_id: math.ceil(durations.get(inspector_id, DEFAULT_DURATION_MINUTES) / SLOT_MINUTES)
+            for inspector_id in self.inspectors
+        }
+
+        horizon = {'day__in': self.days, 'inspector_id__in': list(self.inspectors)}
+        self.busy = dict(
+            ((row[0], row[1]), row[2]) for row in InspectorAvailability.objects.filter(
+                **horizon
+            ).values_list('inspector_id', 'day', 'busy')
+        )
+
+        booked = Appointment.objects.filter(
+            scheduled_date__in=self.days, inspector_id__in=list(self.inspectors)
+        ).exclude(status__in=FREE_STATUSES).order_by()
+        self.load_count = {
+            (row['inspector_id'], row['scheduled_date']): row['count']
+            for row in booked.values('inspector_id', 'scheduled_date').annotate(count=Count('pk'))
+        }
+        # Inspectors working each (day, area), and the cities of each inspector-day
+        self.areas = {}
+        self.cities = {}
+        for inspector_id, day, city, neighborhood in booked.values_list(
+            'inspector_id', 'scheduled_date', 'city', 'neighborhood'
+        ).distinct():
+            self._mark_area(inspector_id, day, _area(city, neighborhood))
+
+        # Inspectors of each day bucketed by load, least loaded first
+        self.by_load = {day: [dict() for _ in range(self.capacity)] for day in self.days}
+        for day in self.days:
+            for inspector_id in self.inspectors:
+                count = self.load_count.get((inspector_id, day), 0)
+                if count < self.capacity:
+                    self.by_load[day][count][inspector_id] = None
+
+        appointments = self._appointment_items()
+        self.items = appointments + self._task_items(appointments)
+
+    def _appointment_items(self):
+        rows = Appointment.objects.filter(
+            Q(status=Appointment.Status.PENDING, inspector__isnull=True)
+            | Q(status=Appointment.Status.NEEDS_RESCHEDULE)
+        ).order_by().values(
+            'id', 'client_name', 'city', 'neighborhood', 'user_id', *APPOINTMENT_STATE
+        )
+        items = []
+        for row in rows:
+            pending = row['status'] == Appointment.Status.PENDING
+            keep_date = pending and row['scheduled_date'] >= self.start
+            items.append({
+                'kind': 'appointment',
+                'id': row['id'],
+                'client_name': row['client_name'],
+                'area': _area(row['city'], row['neighborhood']),
+                'earliest': row['scheduled_date'] if keep_date else self.start,
+                'preferred': row['scheduled_time'] if keep_date else None,
+                'rank': (PRIORITY_RANK[CallTask.Priority.MEDIUM], 0),
+                'before': {field: row[field] for field in (*APPOINTMENT_STATE, 'user_id')},
+                'tasks': [],
+            })
+        return items
+
+    def _task_items(self, appointment_items):
+        rows = CallTask.objects.filter(
+            status=CallTask.Status.APPOINTMENT_SCHEDULED, resulting_appointment__isnull=True
+        ).order_by().values(
+            'id', 'client_name', 'priority', 'days_until_due', 'source_appointment_id',
+            'client_user__city', 'client_user__neighborhood',
+        )
+        appointments = {item['id']: item for item in appointment_items}
+        items = []
+        for row in rows:
+            source = row['source_appointment_id']
+            if source is not None:
+                # Rescheduling tasks are done by placing their appointment
+                if source in appointments:
+                    appointments[source]['tasks'].append(row['id'])
+                continue
+            items.append({
+                'kind': 'task',
+                'id': row['id'],
+                'client_name': row['client_name'],
+                'area': _area(row['client_user__city'], row['client_user__neighborhood']),
+                'earliest': self.start,
+                'preferred': None,
+                'rank': (PRIORITY_RANK.get(row['priority'], 2), row['days_until_due']),
+                'before': None,
+                'tasks': [row['id']],
+            })
+        return items
+
+    # ---------------------------------------------------------- planning
+
+    def plan(self):
+        """
+        Place every item. Returns the plan: one dict per item with
+        ``before``/``after`` states (``after`` None when it did not fit)
+        """
+        if not hasattr(self, 'items'):
+            self.load()
+        self.items.sort(key=lambda item: (
+            item['earliest'], item['preferred'] is None, item['rank'], item['area'], str(item['id'])
+        ))
+        for item in self.items:
+            item['after'] = self.place(item)
+        return self.items
+
+    def place(self, item):
+        for day in self.days:
+            if day < item['earliest']:
+                continue
+            if item['preferred'] is not None and day == item['earliest']:
+                placed = self._place_on(item, day, exact=True)
+                if placed:
+                    return placed
+            placed = self._place_on(item, day)
+            if placed:
+                return placed
+        return None
+
+    def _place_on(self, item, day, exact=False):
+        """
+        Inspectors already in the neighborhood first; then, least loaded
+        first, those free or working in the same city; then the rest
+        """
+        city = item['area'][0]
+        neighbors = self.areas.get((day, item['area']), {})
+        for inspector_id in list(neighbors):
+            placed = self._try(item, inspector_id, day, exact)
+            if placed:
+                return placed
+        elsewhere = []
+        for bucket in self.by_load[day]:
+            for inspector_id in list(bucket):
+                if inspector_id in neighbors:
+                    continue
+                cities = self.cities.get((inspector_id, day))
+                if cities and city not in cities:
+                    elsewhere.append(inspector_id)
+                    continue
+                placed = self._try(item, inspector_id, day, exact)
+                if placed:
+                    return placed
+        for inspector_id in elsewhere:
+            placed = self._try(item, inspector_id, day, exact)
+            if placed:
+                return placed
+        return None
+
+    def _try(self, item, inspector_id, day, exact):
+        key = (inspector_id, day)
+        count = self.load_count.get(key, 0)
+        if count >= self.capacity:
+            return None
+        minutes = self.slots_needed[inspector_id] * SLOT_MINUTES
+        busy = self.busy.get(key, 0)
+        for start in self._starts(item, minutes, exact):
+            mask = AvailabilityService.window_mask(start, minutes)
+            if not busy & mask:
+                break
+        else:
+            return None
+
+        self.busy[key] = busy | mask
+        self.load_count[key] = count + 1
+        buckets = self.by_load[day]
+        buckets[count].pop(inspector_id, None)
+        if count + 1 < self.capacity:
+            buckets[count + 1][inspector_id] = None
+        self._mark_area(inspector_id, day, item['area'])
+        return {'inspector_id': inspector_id, 'scheduled_date': day, 'scheduled_time': start}
+
+    def _starts(self, item, minutes, exact):
+        """Candidate start times within the working day"""
+        last = self.last_slot * SLOT_MINUTES - minutes
+        if exact:
+            preferred = item['preferred']
+            offset = preferred.hour * 60 + preferred.minute
+            return [preferred] if self.first_slot * SLOT_MINUTES <= offset <= last else []
+        return [_clock(slot) for slot in range(self.first_slot, last // SLOT_MINUTES + 1)]
+
+    def _mark_area(self, inspector_id, day, area):
+        self.areas.setdefault((day, area), {})[inspector_id] = None
+        self.cities.setdefault((inspector_id, day), set()).add(area[0])
+
+    # ------------------------------------------------------------ output
+
+    def inspector_name(self, inspector_id):
+        row = self.inspectors.get(inspector_id)
+        return f"{row['first_name']} {row['last_name']}".strip() if row else '-'
+
+    def diff(self, plan):
+        """Human-readable lines of a plan"""
+        lines = []
+        for item in plan:
+            label = f"{item['kind']} {item['id']} ({item['client_name']})"
+            after = item['after']
+            if after is None:
+                lines.append(f"! {label}: no slot in the horizon")
+                continue
+            target = (
+                f"{self.inspector_name(after['inspector_id'])} "
+                f"{after['scheduled_date']} {after['scheduled_time']:%H:%M}"
+            )
+            before = item['before']
+            if before is None:
+                lines.append(f"+ {label}: {target}")
+            else:
+                lines.append(
+                    f"~ {label}: {self.inspector_name(before['inspector_id'])} "
+                    f"{before['scheduled_date']} {before['scheduled_time']:%H:%M} -> {target}"
+                )
+        return lines
+
+    @staticmethod
+    def summary(plan):
+        placed = [item for item in plan if item['after']]
+        return {
+            'items': len(plan),
+            'placed': len(placed),
+            'unplaced': len(plan) - len(placed),
+            'created': sum(1 for item in placed if item['kind'] == 'task'),
+            'rescheduled': sum(1 for item in placed if item['kind'] == 'appointment'),
+        }
+
+    # ------------------------------------------------------------ writes
+
+    def apply(self, plan):
+        """
+        Write a plan in one transaction. Rows changed since planning are
+        skipped, and so are placements that no longer fit their
+        inspector-day (see ``_recheck``). Returns the number of appointments
+        written.
+        """
+        placed = [item for item in plan if item['after']]
+        moves = {item['id']: item for item in placed if item['kind'] == 'appointment'}
+        new = {item['id']: item for item in placed if item['kind'] == 'task'}
+        now = timezone.now()
+        changes = []
+
+        with transaction.atomic():
+            # Source rows first, then the target inspectors: the order
+            # appointment writes take their locks in (row, then refresh())
+            current = {
+                row['pk']: row for row in Appointment.objects.select_for_update().filter(
+                    pk__in=list(moves)
+                ).values('pk', *APPOINTMENT_STATE)
+            }
+            unchanged = {
+                pk for pk, row in current.items()
+                if all(row[field] == moves[pk]['before'][field] for field in APPOINTMENT_STATE)
+            }
+            tasks = {
+                task.pk: task for task in CallTask.objects.select_for_update(of=('self',)).select_related(
+                    'client_user'
+                ).filter(
+                    pk__in=[*new, *(task_id for pk in unchanged for task_id in moves[pk]['tasks'])],
+                    resulting_appointment__isnull=True,
+                )
+            }
+            fitting = self._recheck([
+                item for item in placed
+                if (item['id'] in unchanged if item['kind'] == 'appointment' else item['id'] in tasks)
+            ])
+
+            assignments = []
+            rescheduled = []
+            links = {}
+            created = []
+            for item in fitting:
+                after = item['after']
+                if item['kind'] == 'task':
+                    appointment = self._appointment_for(tasks[item['id']], after)
+                    created.append(appointment)
+                    links[item['id']] = appointment.pk
+                    changes.append((None, self._state(appointment)))
+                    continue
+                row = current[item['id']]
+                assignments.append((
+                    row['pk'], after['inspector_id'], after['scheduled_date'], after['scheduled_time'], now,
+                ))
+                state = {**item['before'], **after}
+                if row['status'] == Appointment.Status.NEEDS_RESCHEDULE:
+                    rescheduled.append(row['pk'])
+                    state['status'] = Appointment.Status.RESCHEDULED
+                changes.append((item['before'], state))
+                links.update((task_id, row['pk']) for task_id in item['tasks'] if task_id in tasks)
+
+            self._update_rows(
+                Appointment, ('inspector', 'scheduled_date', 'scheduled_time', 'updated_at'), assignments
+            )
+            # Same trail as a manual reschedule_appointment
+            Appointment.objects.filter(pk__in=rescheduled).update(
+                status=Appointment.Status.RESCHEDULED,
+                notes=Concat(
+                    Coalesce('notes', Value('')),
+                    Value(f"\n[Reprogramada el {timezone.localdate()}]"),
+                    output_field=TextField(),
+                ),
+            )
+            Appointment.objects.bulk_create(created, batch_size=1000)
+            self._update_rows(
+                CallTask, ('resulting_appointment', 'updated_at'),
+                [(task_id, appointment_id, now) for task_id, appointment_id in links.items()],
+            )
+
+            if changes:
+                appointments_bulk_changed.send(sender=Appointment, changes=changes)
+        return len(changes)
+
+    def _recheck(self, items):
+        """
+        The items whose placement still fits, in plan order. Bookings made
+        since planning count: the target inspectors are locked, as
+        AvailabilityService.refresh does, before their bitmaps and daily
+        counts are read again.
+        """
+        targets = {(item['after']['inspector_id'], item['after']['scheduled_date']) for item in items}
+        inspector_ids = sorted({inspector_id for inspector_id, _ in targets})
+        days = {day for _, day in targets}
+        list(User.objects.select_for_update().filter(pk__in=inspector_ids).order_by('pk').values_list('pk'))
+        busy = {
+            (inspector_id, day): value for inspector_id, day, value in InspectorAvailability.objects.filter(
+                inspector_id__in=inspector_ids, day__in=days
+            ).values_list('inspector_id', 'day', 'busy')
+        }
+        counts = {
+            (row['inspector_id'], row['scheduled_date']): row['count']
+            for row in Appointment.objects.filter(
+                inspector_id__in=inspector_ids, scheduled_date__in=days
+            ).exclude(status__in=FREE_STATUSES).order_by().values(
+                'inspector_id', 'scheduled_date'
+            ).annotate(count=Count('pk'))
+        }
+
+        fitting = []
+        for item in items:
+            after = item['after']
+            key = (after['inspector_id'], after['scheduled_date'])
+            slots = self.slots_needed.get(key[0], math.ceil(DEFAULT_DURATION_MINUTES / SLOT_MINUTES))
+            mask = AvailabilityService.window_mask(after['scheduled_time'], slots * SLOT_MINUTES)
+            if counts.get(key, 0) >= self.capacity or busy.get(key, 0) & mask:
+                continue
+            busy[key] = busy.get(key, 0) | mask
+            counts[key] = counts.get(key, 0) + 1
+            fitting.append(item)
+        return fitting
+
+    @staticmethod
+    def _update_rows(model, fields, rows):
+        """
+        Set ``fields`` on many rows by primary key: ``rows`` are
+        ``(pk, *values)``. One executemany instead of bulk_update, whose
+        CASE expressions grow with the square of the batch.
+        """
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        meta = model._meta
+        columns = [meta.get_field(name) for name in fields]
+        sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+            quote(meta.db_table),
+            ', '.join(f'{quote(field.column)} = %s' for field in columns),
+            quote(meta.pk.column),
+        )
+        params = [
+            [field.get_db_prep_save(value, connection) for field, value in zip(columns, values)]
+            + [meta.pk.get_db_prep_value(pk, connection)]
+            for pk, *values in rows
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    @staticmethod
+    def _appointment_for(task, after):
+        """Appointment booked for a CallTask's client"""
+        client = task.client_user
+        return Appointment(
+            client_name=task.client_name,
+            client_phone=task.client_phone,
+            client_email=task.client_email,
+            client_dni=task.client_dni,
+            user=client,
+            address=task.client_address,
+            neighborhood=client.neighborhood if client else None,
+            city=client.city if client and client.city else Appointment._meta.get_field('city').default,
+            created_by_id=task.assigned_to_id or task.assigned_by_id,
+            status=Appointment.Status.PENDING,
+            **after
+        )
+
+    @staticmethod
+    def _state(appointment):
+        return {
+            'inspector_id': appointment.inspector_id,
+            'scheduled_date': appointment.scheduled_date,
+            'scheduled_time': appointment.scheduled_time,
+            'status': appointment.status,
+            'user_id': appointment.user_id,
+        }
@@ -1,4 +1,5 @@
 # appointments/serializers.py
+from django.db.models import F
 from rest_framework import serializers
 from .models import Appointment
 from users.serializers import UserSerializer
@@ -54,6 +55,46 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return 0
 
 
+class AppointmentListSerializer(AppointmentSerializer):
+    """
+    AppointmentSerializer for listings: the related names and inspection
+    progress come as annotations of the same query instead of one lookup
+    per row. Use with ``prepare_queryset``.
+    """
+    
+    @staticmethod
+    def prepare_queryset(queryset):
+        """Join the inspector, creator and inspection columns the listing reads"""
+        return queryset.annotate(
+            inspector_first_name=F('inspector__first_name'),
+            inspector_last_name=F('inspector__last_name'),
+            created_by_first_name=F('created_by__first_name'),
+            created_by_last_name=F('created_by__last_name'),
+            inspection_status_value=F('inspection__status'),
+            inspection_percentage=F('inspection__form_completed_percentage'),
+        )
+    
+    def get_inspector_name(self, obj):
+        if obj.inspector_id:
+            return f"{obj.inspector_first_name} {obj.inspector_last_name}"
+        return None
+    
+    def get_created_by_name(self, obj):
+        if obj.created_by_id:
+            return f"{obj.created_by_first_name} {obj.created_by_last_name}"
+        return None
+    
+    def get_inspection_status(self, obj):
+        if obj.inspection_id:
+            return obj.inspection_status_value
+        return None
+    
+    def get_inspection_completed_percentage(self, obj):
+        if obj.inspection_id:
+            return obj.inspection_percentage
+        return 0
+
+
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
@@ -133,11 +174,11 @@ class CallTaskSerializer(serializers.ModelSerializer):
             'assigned_to', 'assigned_to_name',
             'status', 'status_display',
             'priority', 'priority_display',
-            'notes', 'call_attempts', 'last_call_date',
+            'notes', 'call_attempts', 'last_call_date', 'lease_expires_at',
             'resulting_appointment',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'assigned_by']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'assigned_by', 'lease_expires_at']
     
     def get_assigned_by_name(self, obj):
         if obj.assigned_by:
@@ -0,0 +1,105 @@
+"""
+Signals dropping cached appointment listings and calendars and keeping the
+inspector availability bitmaps in sync when appointments change
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from core.cache import CacheManager
+from .models import Appointment
+from .services import AvailabilityService
+
+AVAILABILITY_FIELDS = ('inspector_id', 'scheduled_date', 'scheduled_time', 'status')
+
+# Sent after bulk writes that bypass the model signals (auto-scheduling) with
+# ``changes``: ``(old, new)`` dicts of inspector_id, scheduled_date,
+# scheduled_time, status and user_id, ``old`` None for created appointments
+appointments_bulk_changed = Signal()
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_listings(sender, instance, **kwargs):
+    """Drop every cached appointment listing once the write commits"""
+    transaction.on_commit(lambda: CacheManager.invalidate_view_cache('appointments'))
+
+
+def _availability_snapshot(values):
+    """
+    Fields deciding which slots an appointment holds, from loaded values.
+    Reads ``__dict__`` values so deferred fields never trigger a query;
+    returns False when some field is not loaded.
+    """
+    if any(field not in values for field in AVAILABILITY_FIELDS):
+        return False
+    return tuple(
+        Appointment._meta.get_field(field).to_python(values[field]) if field.startswith('scheduled_')
+        else values[field]
+        for field in AVAILABILITY_FIELDS
+    )
+
+
+@receiver(post_init, sender=Appointment)
+def remember_availability_snapshot(sender, instance, **kwargs):
+    instance._availability_snapshot = _availability_snapshot(instance.__dict__)
+
+
+@receiver(pre_save, sender=Appointment)
+@receiver(pre_delete, sender=Appointment)
+def load_missing_availability_snapshot(sender, instance, **kwargs):
+    """Fetch the stored fields when the instance was loaded with deferred fields"""
+    if not instance._state.adding and getattr(instance, '_availability_snapshot', None) is False:
+        stored = Appointment._base_manager.filter(pk=instance.pk).values(*AVAILABILITY_FIELDS).first()
+        instance._availability_snapshot = _availability_snapshot(stored) if stored else None
+
+
+def _refresh_availability(*snapshots):
+    """Recompute the inspector-days an appointment left and entered"""
+    days = {}
+    for snapshot in snapshots:
+        if snapshot:
+            inspector_id, scheduled_date = snapshot[:2]
+            days.setdefault(inspector_id, set()).add(scheduled_date)
+    for inspector_id, inspector_days in days.items():
+        AvailabilityService.refresh(inspector_id, inspector_days)
+
+
+def _invalidate_calendars(*snapshots):
+    """Drop the cached inspector months an appointment left and entered, once committed"""
+    inspector_days = [snapshot[:2] for snapshot in snapshots if snapshot]
+    transaction.on_commit(lambda: CacheManager.invalidate_calendars(inspector_days))
+
+
+@receiver(post_save, sender=Appointment)
+def update_availability_on_save(sender, instance, created, **kwargs):
+    if kwargs.get('raw'):
+        return
+    old = None if created else getattr(instance, '_availability_snapshot', None)
+    new = _availability_snapshot(instance.__dict__)
+    if new is False:
+        # Saved with update_fields on a partially loaded instance
+        stored = Appointment._base_manager.filter(pk=instance.pk).values(*AVAILABILITY_FIELDS).first()
+        new = _availability_snapshot(stored) if stored else None
+    if old != new:
+        _refresh_availability(old or None, new)
+    _invalidate_calendars(old or None, new)
+    instance._availability_snapshot = new
+
+
+@receiver(post_delete, sender=Appointment)
+def update_availability_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_availability_snapshot', None) or None
+    _refresh_availability(old)
+    _invalidate_calendars(old)
+
+
+@receiver(appointments_bulk_changed)
+def sync_bulk_appointment_changes(sender, changes, **kwargs):
+    """Recompute the touched inspector-days and drop the cached listings and months"""
+    inspector_days = [
+        (values['inspector_id'], values['scheduled_date'])
+        for change in changes for values in change if values
+    ]
+    _refresh_availability(*inspector_days)
+    _invalidate_calendars(*inspector_days)
+    transaction.on_commit(lambda: CacheManager.invalidate_view_cache('appointments'))
@@ -0,0 +1,74 @@
+"""
+Background tasks for Appointments app
+
+A call campaign can create tens of thousands of tasks, far longer than a
+request may take, so the endpoint only queues it. The job state (PENDING,
+RUNNING with created/total, then COMPLETED with the assignment or FAILED
+with the error) is kept in the cache under the job id for clients to poll.
+"""
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from core.cache import CacheManager
+from .campaigns import CallCampaign
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class CampaignStatus:
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    COMPLETED = 'COMPLETED'
+    FAILED = 'FAILED'
+
+    IN_PROGRESS = (PENDING, RUNNING)
+
+
+def campaign_state(job_id, status, **fields):
+    state = {'job_id': job_id, 'status': status, 'created': 0, 'total': None,
+             'assigned': [], 'error': '', **fields}
+    CacheManager.cache_campaign(job_id, state)
+    return state
+
+
+def enqueue_campaign(campaign):
+    """Queue a validated CallCampaign; returns its initial job state"""
+    job_id = str(uuid.uuid4())
+    state = campaign_state(job_id, CampaignStatus.PENDING)
+    try:
+        run_call_campaign.delay(
+            job_id,
+            str(campaign.assigned_by.pk) if campaign.assigned_by else None,
+            campaign.priorities,
+            campaign.city,
+            campaign.limit,
+        )
+    except Exception as e:
+        # Broker down: fail the job now instead of leaving it PENDING
+        logger.error(f"Cannot queue call campaign {job_id}: {str(e)}")
+        state = campaign_state(job_id, CampaignStatus.FAILED, error=f'No se pudo encolar la campaña: {e}')
+    return state
+
+
+@shared_task(ignore_result=True)
+def run_call_campaign(job_id, assigned_by_id, priorities, city, limit):
+    """Create the tasks of a queued campaign, recording progress after each batch"""
+    def progress(created, total):
+        campaign_state(job_id, CampaignStatus.RUNNING, created=created, total=total)
+
+    try:
+        assigned_by = User.objects.filter(pk=assigned_by_id).first() if assigned_by_id else None
+        campaign = CallCampaign(assigned_by=assigned_by, priorities=priorities, city=city, limit=limit)
+        campaign_state(job_id, CampaignStatus.RUNNING, total=campaign.count())
+        result = campaign.run(progress)
+    except Exception as e:
+        # Batches already written stay: running the campaign again skips their clients
+        logger.exception(f"Call campaign {job_id} failed: {str(e)}")
+        campaign_state(job_id, CampaignStatus.FAILED, error=str(e))
+        return
+    logger.info(f"Call campaign {job_id}: {result['created']} tasks created")
+    campaign_state(job_id, CampaignStatus.COMPLETED, created=result['created'],
+                   total=result['created'], assigned=result['assigned'])
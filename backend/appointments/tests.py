@@ -0,0 +1,1009 @@
+"""
+Tests for Appointments app
+"""
+import csv
+import importlib
+import io
+import json
+import pytest
+import uuid
+from datetime import date, datetime, time, timedelta
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.celery import app as celery_app
+from inspections.models import Inspection
+from dashboard.models import DashboardRollup
+from .models import Appointment, CallTask, InspectorAvailability
+from .campaigns import CallCampaign
+from .dispatch import CallQueue
+from .scheduling import AutoScheduler
+from .serializers import AppointmentSerializer
+from .services import AvailabilityService, CalendarService
+from .tasks import run_call_campaign
+from .views import (
+    AppointmentPagination, appointment_list_create, available_inspectors, call_task_campaign,
+    call_task_campaign_status, call_task_next, call_task_renew_lease, clients_needing_inspection,
+    inspector_schedule, team_schedule,
+)
+
+User = get_user_model()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def eager(monkeypatch):
+    """Run queued jobs in-process, with no broker"""
+    monkeypatch.setitem(celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', True)
+
+
+@pytest.fixture
+def factory():
+    return APIRequestFactory()
+
+
+@pytest.fixture
+def admin_user(db):
+    return User.objects.create_user(
+        username='admin',
+        email='admin@test.com',
+        password='testpass123',
+        first_name='Admin',
+        last_name='Test',
+        role=User.Role.ADMIN
+    )
+
+
+@pytest.fixture
+def inspector_user(db):
+    return User.objects.create_user(
+        username='inspector',
+        email='inspector@test.com',
+        password='testpass123',
+        first_name='Inspector',
+        last_name='Test',
+        role=User.Role.INSPECTOR,
+        license_number='LIC-12345'
+    )
+
+
+@pytest.fixture
+def appointments(db, inspector_user):
+    """One appointment per status for the inspector, starting tomorrow"""
+    return [
+        Appointment.objects.create(
+            client_name=f'Cliente {index}',
+            client_phone='3000000000',
+            address=f'Calle {index}',
+            scheduled_date=date.today() + timedelta(days=index + 1),
+            scheduled_time=time(8 + index % 8),
+            inspector=inspector_user,
+            status=status_value,
+        )
+        for index, status_value in enumerate(Appointment.Status.values)
+    ]
+
+
+@pytest.fixture
+def due_clients(db):
+    """Clients at every priority, plus some that are not due"""
+    today = date.today()
+    due_in = {
+        'vencido': -10, 'urgente': 20, 'pronto': 60, 'lejano': 150, 'fuera': 400,
+    }
+    created = {}
+    for name, days in due_in.items():
+        created[name] = User.objects.create_user(
+            username=name, email=f'{name}@test.com', password='testpass123',
+            first_name=name.title(), role=User.Role.USER,
+            next_inspection_due=today + timedelta(days=days),
+        )
+    for name, days_ago in (('antiguo', 5 * 365), ('reciente', 100)):
+        created[name] = User.objects.create_user(
+            username=name, email=f'{name}@test.com', password='testpass123',
+            first_name=name.title(), role=User.Role.USER,
+            last_inspection_date=today - timedelta(days=days_ago),
+        )
+    # save() fills next_inspection_due from the last inspection
+    User.objects.filter(pk__in=[created['antiguo'].pk, created['reciente'].pk]).update(next_inspection_due=None)
+    User.objects.create_user(
+        username='inactivo', email='inactivo@test.com', password='testpass123', role=User.Role.USER,
+        is_active=False, next_inspection_due=today - timedelta(days=5),
+    )
+    User.objects.create_user(
+        username='nunca', email='nunca@test.com', password='testpass123', role=User.Role.USER,
+    )
+    return created
+
+
+def list_appointments(factory, user, query='', **headers):
+    request = factory.get(f'/api/appointments/{query}', **headers)
+    force_authenticate(request, user=user)
+    return appointment_list_create(request)
+
+
+@pytest.mark.django_db
+class TestAppointmentListCache:
+    """Test the rendered response cache of appointment_list_create"""
+
+    def test_cached_response_is_rendered_bytes(self, factory, admin_user, appointments,
+                                               django_assert_num_queries):
+        """A warm listing is served without queries, with validators"""
+        first = list_appointments(factory, admin_user)
+
+        with django_assert_num_queries(0):
+            second = list_appointments(factory, admin_user)
+
+        assert second.status_code == 200
+        assert second.content == first.content
+        assert second['ETag']
+        assert second['Last-Modified']
+
+    def test_query_string_is_part_of_the_key(self, factory, admin_user, appointments):
+        """Different filters never share an entry; parameter order does not matter"""
+        pending = list_appointments(factory, admin_user, '?status=PENDING')
+        completed = list_appointments(factory, admin_user, '?status=COMPLETED')
+
+        assert pending.content != completed.content
+        assert b'PENDING' in pending.content
+        assert b'"PENDING"' not in completed.content
+
+        query = f'?status=PENDING&date_from={date.today()}'
+        reordered = f'?date_from={date.today()}&status=PENDING'
+        assert list_appointments(factory, admin_user, query)['ETag'] == \
+            list_appointments(factory, admin_user, reordered)['ETag']
+
+    def test_scope_separates_inspectors(self, factory, inspector_user, appointments):
+        """Per-user roles get their own entries"""
+        other = User.objects.create_user(
+            username='other', email='other@test.com', password='testpass123',
+            first_name='Other', last_name='Inspector', role=User.Role.INSPECTOR,
+            license_number='LIC-99999'
+        )
+        mine = list_appointments(factory, inspector_user)
+        theirs = list_appointments(factory, other)
+
+        assert b'Cliente 0' in mine.content
+        assert b'Cliente 0' not in theirs.content
+
+    def test_if_none_match_returns_304(self, factory, admin_user, appointments):
+        etag = list_appointments(factory, admin_user)['ETag']
+
+        response = list_appointments(factory, admin_user, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+
+    def test_write_invalidates_listing(self, factory, admin_user, appointments,
+                                       django_capture_on_commit_callbacks):
+        """Saving an appointment drops the cached listings"""
+        list_appointments(factory, admin_user)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            appointments[0].client_name = 'Cliente Renombrado'
+            appointments[0].save()
+
+        assert b'Cliente Renombrado' in list_appointments(factory, admin_user).content
+
+
+@pytest.mark.django_db
+class TestAppointmentPagination:
+    """Test keyset pagination of appointment_list_create"""
+
+    @pytest.fixture
+    def same_slot(self, appointments, inspector_user):
+        """Appointments sharing one date and time, ordered only by id"""
+        return [
+            Appointment.objects.create(
+                client_name=f'Mismo Horario {index}',
+                client_phone='3000000000',
+                address='Calle 99',
+                scheduled_date=date.today() + timedelta(days=3),
+                scheduled_time=time(10),
+                inspector=inspector_user,
+            )
+            for index in range(3)
+        ]
+
+    def walk(self, factory, user, url, direction):
+        ids = []
+        while url:
+            response = list_appointments(factory, user, url[url.index('?'):])
+            body = json.loads(response.content)
+            ids.extend(row['id'] for row in body['results'])
+            url = body[direction]
+        return ids
+
+    def test_cursor_pages_cover_every_row_once(self, factory, admin_user, same_slot):
+        """Next links walk the schedule in order, ties broken by id"""
+        expected = [
+            str(pk) for pk in Appointment.objects.order_by(
+                '-scheduled_date', '-scheduled_time', '-id'
+            ).values_list('id', flat=True)
+        ]
+
+        forward = self.walk(factory, admin_user, '/api/appointments/?cursor=&page_size=2', 'next')
+        assert forward == expected
+
+        first_page = list_appointments(factory, admin_user, '?cursor=&page_size=100')
+        assert json.loads(first_page.content)['previous'] is None
+
+    def test_previous_link_returns_the_same_page(self, factory, admin_user, same_slot):
+        first = json.loads(list_appointments(factory, admin_user, '?cursor=&page_size=3').content)
+        second_url = first['next']
+        second = json.loads(list_appointments(factory, admin_user, second_url[second_url.index('?'):]).content)
+        back_url = second['previous']
+        back = json.loads(list_appointments(factory, admin_user, back_url[back_url.index('?'):]).content)
+
+        assert [row['id'] for row in back['results']] == [row['id'] for row in first['results']]
+
+    def test_deep_pages_seek_without_offset(self, factory, admin_user, same_slot):
+        """A cursor page is a bounded index seek: no OFFSET, no COUNT"""
+        first = json.loads(list_appointments(factory, admin_user, '?cursor=&page_size=2').content)
+        query = first['next'][first['next'].index('?'):]
+
+        with CaptureQueriesContext(connection) as queries:
+            list_appointments(factory, admin_user, query)
+
+        sql = ' '.join(entry['sql'] for entry in queries.captured_queries)
+        assert 'OFFSET' not in sql
+        assert 'COUNT(' not in sql
+        assert 'ROW(' in sql
+
+    def test_unpaginated_listing_unchanged(self, factory, admin_user, appointments):
+        """Without pagination parameters the legacy full list is returned"""
+        body = json.loads(list_appointments(factory, admin_user).content)
+
+        assert body['success'] is True
+        assert len(body['appointments']) == len(appointments)
+
+    def test_offset_mode_offers_a_cursor(self, factory, admin_user, same_slot):
+        body = json.loads(list_appointments(factory, admin_user, '?page=1&page_size=2').content)
+
+        assert body['count'] == Appointment.objects.count()
+        assert body['next_cursor']
+
+    def test_no_cursor_from_another_order(self, factory, admin_user, same_slot):
+        """A cursor taken from pages sorted by something else would skip or repeat rows"""
+        request = Request(factory.get('/api/appointments/?page=1&page_size=2'))
+        paginator = AppointmentPagination()
+
+        paginator.paginate_queryset(Appointment.objects.order_by('client_name'), request)
+
+        assert paginator.get_paginated_response([]).data['next_cursor'] is None
+
+    def test_malformed_cursor_is_404(self, factory, admin_user, appointments):
+        assert list_appointments(factory, admin_user, '?cursor=not-a-cursor').status_code == 404
+
+
+@pytest.mark.django_db
+class TestAppointmentListQueries:
+    """Test that appointment_list_create does not query per row"""
+
+    def add_appointments(self, admin_user, inspector_user, count):
+        start = Appointment.objects.count()
+        for index in range(start, start + count):
+            inspection = Inspection.objects.create(
+                inspector=inspector_user,
+                address=f'Calle {index}',
+                form_completed_percentage=index,
+            )
+            Appointment.objects.create(
+                client_name=f'Cliente {index}',
+                client_phone='3000000000',
+                address=f'Calle {index}',
+                scheduled_date=date.today() + timedelta(days=index + 1),
+                scheduled_time=time(9),
+                inspector=inspector_user,
+                created_by=admin_user,
+                inspection=inspection,
+            )
+
+    def count_queries(self, factory, user, query=''):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = list_appointments(factory, user, query)
+        assert response.status_code == 200
+        return len(queries)
+
+    @pytest.mark.parametrize('query', ['', '?page=1&page_size=100', '?cursor=&page_size=100'])
+    def test_query_count_independent_of_rows(self, factory, admin_user, inspector_user, query):
+        self.add_appointments(admin_user, inspector_user, 2)
+        few = self.count_queries(factory, admin_user, query)
+
+        self.add_appointments(admin_user, inspector_user, 8)
+        many = self.count_queries(factory, admin_user, query)
+
+        assert many == few
+
+    def test_rows_match_the_detail_serializer(self, factory, admin_user, inspector_user, appointments):
+        """Annotated names and inspection progress equal the per-object values"""
+        self.add_appointments(admin_user, inspector_user, 2)
+
+        body = json.loads(list_appointments(factory, admin_user).content)
+        expected = json.loads(json.dumps(
+            AppointmentSerializer(Appointment.objects.all(), many=True).data, default=str
+        ))
+
+        assert body['appointments'] == expected
+
+
+@pytest.mark.django_db
+class TestInspectorAvailability:
+    """Test the availability bitmaps behind available_inspectors"""
+
+    @pytest.fixture
+    def other_inspector(self, db):
+        return User.objects.create_user(
+            username='inspector2',
+            email='inspector2@test.com',
+            password='testpass123',
+            first_name='Otro',
+            last_name='Inspector',
+            role=User.Role.INSPECTOR,
+        )
+
+    @pytest.fixture
+    def day(self):
+        return date.today() + timedelta(days=2)
+
+    def book(self, inspector, day, start, **fields):
+        return Appointment.objects.create(
+            client_name='Cliente',
+            client_phone='3000000000',
+            address='Calle 1',
+            scheduled_date=day,
+            scheduled_time=start,
+            inspector=inspector,
+            **fields
+        )
+
+    def ask(self, factory, user, day, start, duration=None):
+        query = f'?date={day.isoformat()}&time={start}'
+        if duration:
+            query += f'&duration={duration}'
+        request = factory.get(f'/api/appointments/available-inspectors/{query}')
+        force_authenticate(request, user=user)
+        return available_inspectors(request)
+
+    def free_ids(self, response):
+        return [row['id'] for row in response.data['inspectors']]
+
+    def test_window_mask_covers_touched_slots(self):
+        assert AvailabilityService.window_mask(time(10), 60) == 0b11 << 20
+        assert AvailabilityService.window_mask(time(10, 15), 60) == 0b111 << 20
+        with pytest.raises(ValueError):
+            AvailabilityService.window_mask(time(23, 30), 60)
+
+    def test_overlapping_window_is_busy(self, factory, admin_user, inspector_user, other_inspector, day):
+        """A 10:00 booking blocks a 10:30 window, not only the exact 10:00 slot"""
+        self.book(inspector_user, day, time(10))
+
+        free = self.free_ids(self.ask(factory, admin_user, day, '10:30'))
+        assert free == [str(other_inspector.id)]
+
+        free = self.free_ids(self.ask(factory, admin_user, day, '11:00'))
+        assert str(inspector_user.id) in free
+
+    def test_long_history_extends_bookings(self, factory, admin_user, inspector_user, day):
+        """The expected duration comes from the inspector's completed work"""
+        started = timezone.make_aware(datetime(2024, 1, 10, 9))
+        self.book(
+            inspector_user, date(2024, 1, 10), time(9),
+            status=Appointment.Status.COMPLETED,
+            actual_start_time=started, actual_end_time=started + timedelta(minutes=150),
+        )
+        self.book(inspector_user, day, time(10))
+
+        assert self.free_ids(self.ask(factory, admin_user, day, '12:00')) == []
+        assert self.free_ids(self.ask(factory, admin_user, day, '12:30')) == [str(inspector_user.id)]
+
+    def test_nearest_is_the_tightest_day(self, factory, admin_user, inspector_user, other_inspector, day):
+        self.book(inspector_user, day, time(8))
+        self.book(other_inspector, day, time(13))
+
+        body = self.ask(factory, admin_user, day, '14:00').data
+
+        assert body['nearest']['id'] == str(other_inspector.id)
+        assert [row['gap_minutes'] for row in body['inspectors']] == [0, 300]
+
+    def test_writes_keep_the_bitmap_current(self, inspector_user, other_inspector, day):
+        appointment = self.book(inspector_user, day, time(10))
+        assert InspectorAvailability.objects.get(inspector=inspector_user, day=day).busy
+
+        appointment.inspector = other_inspector
+        appointment.save()
+        assert InspectorAvailability.objects.get(inspector=inspector_user, day=day).busy == 0
+        assert InspectorAvailability.objects.get(inspector=other_inspector, day=day).busy
+
+        appointment.status = Appointment.Status.CANCELLED
+        appointment.save()
+        assert InspectorAvailability.objects.get(inspector=other_inspector, day=day).busy == 0
+
+    def test_rebuild_repairs_drift(self, inspector_user, day):
+        appointment = self.book(inspector_user, day, time(10))
+        Appointment.objects.filter(pk=appointment.pk).update(scheduled_time=time(15))
+
+        call_command('rebuild_availability', '--days', '5', stdout=io.StringIO())
+
+        busy = InspectorAvailability.objects.get(inspector=inspector_user, day=day).busy
+        assert busy == AvailabilityService.window_mask(time(15), 60)
+
+    def test_rescheduled_appointment_holds_its_slot(self, inspector_user, day):
+        """Bitmaps stored before RESCHEDULED counted as booked are repaired by the migration"""
+        appointment = self.book(inspector_user, day, time(10), status=Appointment.Status.RESCHEDULED)
+        mask = AvailabilityService.window_mask(time(10), 60)
+        assert InspectorAvailability.objects.get(inspector=inspector_user, day=day).busy == mask
+
+        InspectorAvailability.objects.filter(inspector=inspector_user).update(busy=0)
+        migration = importlib.import_module('appointments.migrations.0010_rescheduled_availability')
+        migration.refresh_rescheduled_days(django_apps, None)
+
+        assert InspectorAvailability.objects.get(inspector=appointment.inspector, day=day).busy == mask
+
+    def test_invalid_window_is_400(self, factory, admin_user, day):
+        assert self.ask(factory, admin_user, day, '23:30', duration=60).status_code == 400
+        assert self.ask(factory, admin_user, day, 'noon').status_code == 400
+
+
+@pytest.mark.django_db
+class TestAutoScheduler:
+    """Test the batch auto-scheduling engine"""
+
+    OPTIONS = {
+        'WORKDAY_START': '08:00',
+        'WORKDAY_END': '12:00',
+        'WORKDAYS': [0, 1, 2, 3, 4, 5, 6],
+        'DAILY_CAPACITY': 3,
+    }
+
+    @pytest.fixture
+    def start(self):
+        return date.today() + timedelta(days=1)
+
+    @pytest.fixture
+    def second_inspector(self, db):
+        return User.objects.create_user(
+            username='inspector2',
+            email='inspector2@test.com',
+            password='testpass123',
+            first_name='Segundo',
+            last_name='Inspector',
+            role=User.Role.INSPECTOR,
+        )
+
+    def needs_reschedule(self, count, neighborhood='Centro', **fields):
+        return [
+            Appointment.objects.create(
+                client_name=f'Cliente {neighborhood} {index}',
+                client_phone='3000000000',
+                address=f'Calle {index}',
+                neighborhood=neighborhood,
+                scheduled_date=date.today() - timedelta(days=1),
+                scheduled_time=time(9),
+                status=Appointment.Status.NEEDS_RESCHEDULE,
+                **fields
+            )
+            for index in range(count)
+        ]
+
+    def scheduler(self, start, days=3):
+        return AutoScheduler(start=start, days=days, options=self.OPTIONS)
+
+    def test_capacity_and_bookings_are_respected(self, inspector_user, start):
+        """An existing 08:00 booking and the daily capacity push work to later slots and days"""
+        Appointment.objects.create(
+            client_name='Reservada', client_phone='3000000000', address='Calle 0',
+            scheduled_date=start, scheduled_time=time(8), inspector=inspector_user,
+        )
+        self.needs_reschedule(4)
+
+        plan = self.scheduler(start).plan()
+
+        slots = sorted((item['after']['scheduled_date'], item['after']['scheduled_time']) for item in plan)
+        assert slots == [
+            (start, time(9)), (start, time(10)),
+            (start + timedelta(days=1), time(8)), (start + timedelta(days=1), time(9)),
+        ]
+
+    def test_neighborhoods_stay_with_one_inspector(self, inspector_user, second_inspector, start):
+        self.needs_reschedule(2, neighborhood='Centro')
+        self.needs_reschedule(2, neighborhood='La Granja')
+
+        plan = self.scheduler(start).plan()
+
+        by_area = {}
+        for item in plan:
+            by_area.setdefault(item['area'], set()).add(item['after']['inspector_id'])
+        assert all(len(inspectors) == 1 for inspectors in by_area.values())
+        assert by_area[('montería', 'centro')] != by_area[('montería', 'la granja')]
+
+    def test_pending_keeps_requested_slot(self, inspector_user, start):
+        requested = Appointment.objects.create(
+            client_name='Con Hora', client_phone='3000000000', address='Calle 5',
+            scheduled_date=start, scheduled_time=time(10, 15),
+        )
+
+        item, = self.scheduler(start).plan()
+
+        assert item['id'] == requested.id
+        assert item['after'] == {
+            'inspector_id': inspector_user.id, 'scheduled_date': start, 'scheduled_time': time(10, 15),
+        }
+
+    def test_dry_run_writes_nothing(self, inspector_user, start):
+        self.needs_reschedule(2)
+
+        output = io.StringIO()
+        call_command('auto_schedule', '--start', start.isoformat(), stdout=output, stderr=io.StringIO())
+
+        assert output.getvalue().count('~ appointment') == 2
+        assert Appointment.objects.filter(status=Appointment.Status.NEEDS_RESCHEDULE).count() == 2
+
+    def test_apply_books_tasks_and_syncs_derived_state(self, admin_user, inspector_user, start):
+        moved, = self.needs_reschedule(1)
+        task = CallTask.objects.create(
+            client_name='Desde Tarea', client_phone='3000000001', client_address='Carrera 7',
+            assigned_by=admin_user, status=CallTask.Status.APPOINTMENT_SCHEDULED,
+            priority=CallTask.Priority.URGENT,
+        )
+
+        scheduler = self.scheduler(start)
+        assert scheduler.apply(scheduler.plan()) == 2
+
+        moved.refresh_from_db()
+        task.refresh_from_db()
+        assert moved.status == Appointment.Status.RESCHEDULED
+        assert moved.inspector_id == inspector_user.id
+        booked = task.resulting_appointment
+        assert booked.inspector_id == inspector_user.id and booked.address == 'Carrera 7'
+
+        busy = InspectorAvailability.objects.get(inspector=inspector_user, day=start).busy
+        for appointment in (moved, booked):
+            assert busy & AvailabilityService.window_mask(appointment.scheduled_time, 60)
+        assert DashboardRollup.objects.filter(
+            source=DashboardRollup.Source.APPOINTMENT, inspector_id=inspector_user.id, day=start,
+        ).count() == 2
+
+    def test_rows_changed_after_planning_are_skipped(self, inspector_user, start):
+        moved, = self.needs_reschedule(1)
+        scheduler = self.scheduler(start)
+        plan = scheduler.plan()
+        Appointment.objects.filter(pk=moved.pk).update(status=Appointment.Status.CANCELLED)
+
+        assert scheduler.apply(plan) == 0
+
+    def test_slots_booked_after_planning_are_skipped(self, inspector_user, start):
+        """A booking made between plan() and apply() is not double-booked"""
+        first, second = self.needs_reschedule(2)
+        scheduler = self.scheduler(start, days=1)
+        plan = scheduler.plan()
+        taken = next(item['after'] for item in plan if item['id'] == first.id)
+        Appointment.objects.create(
+            client_name='Llamada', client_phone='3000000000', address='Calle 9',
+            inspector=inspector_user, scheduled_date=taken['scheduled_date'],
+            scheduled_time=taken['scheduled_time'],
+        )
+
+        assert scheduler.apply(plan) == 1
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert first.status == Appointment.Status.NEEDS_RESCHEDULE
+        assert second.status == Appointment.Status.RESCHEDULED
+
+    def test_daily_capacity_is_checked_again(self, inspector_user, start):
+        """Bookings made since planning count against the daily capacity"""
+        self.needs_reschedule(1)
+        scheduler = self.scheduler(start, days=1)
+        plan = scheduler.plan()
+        for hour in (9, 10, 11):
+            Appointment.objects.create(
+                client_name='Llamada', client_phone='3000000000', address='Calle 9',
+                inspector=inspector_user, scheduled_date=start, scheduled_time=time(hour, 30),
+                status=Appointment.Status.CONFIRMED,
+            )
+
+        assert scheduler.apply(plan) == 0
+
+
+@pytest.mark.django_db
+class TestInspectorCalendar:
+    """Test the cached month calendars of inspector_schedule and team_schedule"""
+
+    @pytest.fixture
+    def month_start(self):
+        return date.today().replace(day=1)
+
+    @pytest.fixture
+    def team(self, db):
+        return [
+            User.objects.create_user(
+                username=f'equipo{index}',
+                email=f'equipo{index}@test.com',
+                password='testpass123',
+                first_name=f'Equipo {index}',
+                role=User.Role.INSPECTOR,
+            )
+            for index in range(3)
+        ]
+
+    def book(self, inspector, day, status_value=Appointment.Status.PENDING, hour=9):
+        return Appointment.objects.create(
+            client_name='Cliente', client_phone='3000000000', address='Calle 1',
+            scheduled_date=day, scheduled_time=time(hour), inspector=inspector, status=status_value,
+        )
+
+    def get(self, factory, view, user, url, **kwargs):
+        request = factory.get(url)
+        force_authenticate(request, user=user)
+        return view(request, **kwargs)
+
+    def appointment_queries(self, queries):
+        return [entry['sql'] for entry in queries.captured_queries if 'appointments_appointment' in entry['sql']]
+
+    def test_month_from_one_query_then_cache(self, factory, admin_user, inspector_user, month_start):
+        self.book(inspector_user, month_start, hour=10)
+        self.book(inspector_user, month_start, Appointment.Status.COMPLETED, hour=8)
+        self.book(inspector_user, month_start, Appointment.Status.CANCELLED)
+        url = f'/api/appointments/inspector-schedule/{inspector_user.id}/'
+
+        with CaptureQueriesContext(connection) as queries:
+            first = self.get(factory, inspector_schedule, admin_user, url, inspector_id=inspector_user.id)
+        assert len(self.appointment_queries(queries)) == 1
+
+        day = first.data['calendar'][0]
+        assert [row['time'] for row in day['appointments']] == ['08:00', '10:00']
+        assert day['appointments'][0]['status_display'] == 'Completada'
+        assert first.data['stats']['total'] == 2
+        assert first.data['stats']['completed'] == 1
+        assert first.data['stats']['pending'] == 1
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get(factory, inspector_schedule, admin_user, url, inspector_id=inspector_user.id)
+        assert self.appointment_queries(queries) == []
+        assert second.data['calendar'] == first.data['calendar']
+
+    def test_writes_drop_the_cached_month(self, factory, admin_user, inspector_user, month_start,
+                                          django_capture_on_commit_callbacks):
+        url = f'/api/appointments/inspector-schedule/{inspector_user.id}/'
+        assert self.get(factory, inspector_schedule, admin_user, url, inspector_id=inspector_user.id).data['stats']['total'] == 0
+
+        with django_capture_on_commit_callbacks(execute=True):
+            appointment = self.book(inspector_user, month_start)
+        assert self.get(factory, inspector_schedule, admin_user, url, inspector_id=inspector_user.id).data['stats']['total'] == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            appointment.status = Appointment.Status.CANCELLED
+            appointment.save()
+        assert self.get(factory, inspector_schedule, admin_user, url, inspector_id=inspector_user.id).data['stats']['total'] == 0
+
+    def test_team_calendar_queries_only_missing_inspectors(self, factory, admin_user, team, month_start):
+        for index, inspector in enumerate(team):
+            for hour in range(index + 1):
+                self.book(inspector, month_start, hour=8 + hour)
+        # One inspector-month already cached
+        CalendarService.buckets([team[0].id], month_start.year, month_start.month)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(factory, team_schedule, admin_user, '/api/appointments/team-schedule/')
+
+        sql = self.appointment_queries(queries)
+        assert len(sql) == 1
+        assert str(team[1].id) in sql[0] or team[1].id.hex in sql[0]
+        assert str(team[0].id) not in sql[0] and team[0].id.hex not in sql[0]
+        totals = {row['id']: row['stats']['total'] for row in response.data['inspectors']}
+        assert totals == {str(inspector.id): index + 1 for index, inspector in enumerate(team)}
+        assert 'appointments' not in response.data['inspectors'][0]['calendar'][0]
+
+    def test_team_calendar_is_bounded(self, factory, admin_user, team, monkeypatch):
+        from . import views
+        monkeypatch.setattr(views, 'MAX_TEAM_INSPECTORS', 2)
+
+        response = self.get(factory, team_schedule, admin_user, '/api/appointments/team-schedule/')
+        assert response.status_code == 400
+
+        ids = ','.join(str(inspector.id) for inspector in team[:2])
+        response = self.get(factory, team_schedule, admin_user, f'/api/appointments/team-schedule/?inspectors={ids}')
+        assert len(response.data['inspectors']) == 2
+
+    def test_team_calendar_needs_a_staff_role(self, factory, inspector_user):
+        anonymous = team_schedule(factory.get('/api/appointments/team-schedule/'))
+        assert anonymous.status_code == 401
+        response = self.get(factory, team_schedule, inspector_user, '/api/appointments/team-schedule/')
+        assert response.status_code == 403
+
+    def test_invalid_month_is_400(self, factory, admin_user, inspector_user):
+        url = f'/api/appointments/inspector-schedule/{inspector_user.id}/?month=13'
+        assert self.get(factory, inspector_schedule, admin_user, url, inspector_id=inspector_user.id).status_code == 400
+
+
+@pytest.mark.django_db
+class TestDueClients:
+    """Test the database-ordered clients_needing_inspection list and its exports"""
+
+    def get(self, factory, user, query=''):
+        request = factory.get(f'/api/appointments/clients-needing-inspection/{query}')
+        force_authenticate(request, user=user)
+        return clients_needing_inspection(request)
+
+    def test_priority_order_from_one_query(self, factory, admin_user, due_clients):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(factory, admin_user)
+        assert len(queries) == 1
+
+        rows = response.data['clients']
+        assert response.data['total'] == 5
+        assert [row['full_name'] for row in rows] == ['Vencido', 'Antiguo', 'Urgente', 'Pronto', 'Lejano']
+        assert [(row['status'], row['priority']) for row in rows] == [
+            ('OVERDUE', 'URGENT'), ('OVERDUE', 'HIGH'), ('WARNING', 'HIGH'), ('WARNING', 'MEDIUM'), ('OK', 'LOW'),
+        ]
+        assert rows[0]['days_until_due'] == -10
+        assert rows[1]['days_until_due'] == -5 * 365
+        assert rows[1]['next_inspection_due'] is None
+
+    def test_cursor_pages_follow_the_priority_order(self, factory, admin_user, due_clients):
+        expected = self.get(factory, admin_user).data['clients']
+
+        seen = []
+        response = self.get(factory, admin_user, '?cursor=&page_size=2')
+        while True:
+            seen.extend(response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.get(factory, admin_user, '?' + response.data['next'].split('?', 1)[1])
+        assert seen == expected
+
+        page = self.get(factory, admin_user, '?page=2&page_size=2').data
+        assert page['count'] == 5
+        assert page['results'] == expected[2:4]
+
+    def test_exports_stream_every_client(self, factory, admin_user, due_clients):
+        expected = self.get(factory, admin_user).data['clients']
+
+        response = self.get(factory, admin_user, '?export=ndjson')
+        assert response.streaming
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert [json.loads(line) for line in lines] == expected
+
+        response = self.get(factory, admin_user, '?export=csv')
+        assert response['Content-Type'].startswith('text/csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        assert [row['id'] for row in rows] == [row['id'] for row in expected]
+        assert rows[0]['priority'] == 'URGENT'
+
+    def test_invalid_export_and_role(self, factory, admin_user, inspector_user):
+        assert self.get(factory, admin_user, '?export=xlsx').status_code == 400
+        assert self.get(factory, inspector_user).status_code == 403
+
+
+def get_status(user, job_id):
+    request = APIRequestFactory().get(f'/api/appointments/tasks/campaign/{job_id}/')
+    force_authenticate(request, user=user)
+    return call_task_campaign_status(request, job_id=job_id)
+
+
+@pytest.mark.django_db
+class TestCallCampaign:
+    """Test bulk call task creation for due clients"""
+
+    @pytest.fixture
+    def agents(self, db):
+        return [
+            User.objects.create_user(
+                username=f'agente{index}', email=f'agente{index}@test.com', password='testpass123',
+                first_name=f'Agente {index}', role=User.Role.CALL_CENTER,
+            )
+            for index in range(2)
+        ]
+
+    def open_task(self, client, agent):
+        return CallTask.objects.create(
+            client_name=client.get_full_name(), client_phone='3000000000', client_address='Calle 1',
+            client_user=client, assigned_to=agent, status=CallTask.Status.NO_ANSWER,
+        )
+
+    def test_tasks_for_due_clients_without_open_task(self, due_clients, agents):
+        self.open_task(due_clients['vencido'], agents[0])
+        # A closed task does not block a new one
+        closed = self.open_task(due_clients['antiguo'], agents[0])
+        CallTask.objects.filter(pk=closed.pk).update(status=CallTask.Status.CLIENT_REFUSED)
+
+        result = CallCampaign(batch_size=2).run()
+
+        assert result['created'] == 4
+        tasks = CallTask.objects.filter(task_type=CallTask.TaskType.INSPECTION_CALL).exclude(
+            status__in=[CallTask.Status.NO_ANSWER, CallTask.Status.CLIENT_REFUSED]
+        )
+        by_client = {task.client_user_id: task for task in tasks}
+        assert set(by_client) == {due_clients[name].pk for name in ('antiguo', 'urgente', 'pronto', 'lejano')}
+        assert by_client[due_clients['urgente'].pk].priority == CallTask.Priority.HIGH
+        assert by_client[due_clients['urgente'].pk].days_until_due == 20
+        assert by_client[due_clients['antiguo'].pk].priority == CallTask.Priority.HIGH
+        assert by_client[due_clients['lejano'].pk].priority == CallTask.Priority.LOW
+
+        # Everyone has an open task now
+        assert CallCampaign().run()['created'] == 0
+
+    def test_least_loaded_agent_first(self, due_clients, agents):
+        self.open_task(due_clients['vencido'], agents[0])
+        self.open_task(due_clients['urgente'], agents[0])
+
+        result = CallCampaign().run()
+
+        assert result['created'] == 3
+        assert {agent['id']: agent['tasks'] for agent in result['assigned']} == {
+            str(agents[0].pk): 0, str(agents[1].pk): 3,
+        }
+        open_counts = [
+            CallTask.objects.filter(assigned_to=agent, status__in=CallTask.OPEN_STATUSES).count()
+            for agent in agents
+        ]
+        assert open_counts == [2, 3]
+
+    def test_batches_are_bounded(self, due_clients, agents):
+        calls = []
+        with CaptureQueriesContext(connection) as queries:
+            result = CallCampaign(batch_size=2, limit=4).run(progress=lambda *args: calls.append(args))
+
+        assert result['created'] == 4
+        assert calls == [(2, 4), (4, 4)]
+        inserts = [entry['sql'] for entry in queries.captured_queries if entry['sql'].startswith('INSERT')]
+        assert len(inserts) == 2
+
+    def test_endpoint(self, factory, admin_user, inspector_user, due_clients, agents, eager):
+        def post(user, data):
+            request = factory.post('/api/appointments/tasks/campaign/', data, format='json')
+            force_authenticate(request, user=user)
+            return call_task_campaign(request)
+
+        assert post(inspector_user, {}).status_code == 403
+        assert post(admin_user, {'priorities': ['NOW']}).status_code == 400
+
+        response = post(admin_user, {'priorities': 'URGENT,HIGH', 'dry_run': True})
+        assert response.data['clients'] == 3
+        assert response.data['agents'] == 2
+        assert not CallTask.objects.exists()
+
+        response = post(admin_user, {'priorities': ['URGENT', 'HIGH']})
+        assert response.status_code == 202
+        assert set(CallTask.objects.values_list('assigned_by', flat=True)) == {admin_user.pk}
+
+        job_id = response.data['job']['job_id']
+        assert get_status(inspector_user, job_id).status_code == 403
+        assert get_status(admin_user, uuid.uuid4()).status_code == 404
+        status = get_status(admin_user, job_id)
+        assert status.data['job']['status'] == 'COMPLETED'
+        assert status.data['job']['created'] == 3
+        assert sum(agent['tasks'] for agent in status.data['job']['assigned']) == 3
+        assert not status.has_header('Retry-After')
+
+    def test_endpoint_queues_the_run(self, factory, admin_user, due_clients, agents, monkeypatch):
+        """The request only queues the campaign; a broker failure fails the job"""
+        def post():
+            request = factory.post('/api/appointments/tasks/campaign/', {'limit': 2}, format='json')
+            force_authenticate(request, user=admin_user)
+            return call_task_campaign(request)
+
+        queued = []
+        monkeypatch.setattr(run_call_campaign, 'delay', lambda *args: queued.append(args))
+        response = post()
+
+        assert response.status_code == 202
+        assert response.data['job']['status'] == 'PENDING'
+        assert queued == [(response.data['job']['job_id'], str(admin_user.pk), [], None, 2)]
+        assert not CallTask.objects.exists()
+        assert get_status(admin_user, response.data['job']['job_id'])['Retry-After'] == '2'
+
+        def unreachable(*args):
+            raise ConnectionError('broker down')
+        monkeypatch.setattr(run_call_campaign, 'delay', unreachable)
+        response = post()
+        assert response.data['job']['status'] == 'FAILED'
+        assert 'broker down' in response.data['job']['error']
+
+    def test_command(self, due_clients, agents):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('call_campaign', '--priority', 'URGENT', stdout=out, stderr=err)
+        assert '1 tasks created' in err.getvalue()
+        assert CallTask.objects.get().client_user == due_clients['vencido']
+
+
+@pytest.mark.django_db
+class TestCallQueue:
+    """Test SKIP LOCKED claiming and leases of the call center work queue"""
+
+    @pytest.fixture
+    def agents(self, db):
+        return [
+            User.objects.create_user(
+                username=f'cola{index}', email=f'cola{index}@test.com', password='testpass123',
+                first_name=f'Cola {index}', role=User.Role.CALL_CENTER,
+            )
+            for index in range(2)
+        ]
+
+    def task(self, name, priority=CallTask.Priority.MEDIUM, days=0, **fields):
+        return CallTask.objects.create(
+            client_name=name, client_phone='3000000000', client_address='Calle 1',
+            priority=priority, days_until_due=days, **fields
+        )
+
+    def test_claims_in_priority_order(self, agents):
+        low = self.task('baja', CallTask.Priority.LOW, -100)
+        later = self.task('urgente tarde', CallTask.Priority.URGENT, 5)
+        first = self.task('urgente', CallTask.Priority.URGENT, -3)
+        high = self.task('alta', CallTask.Priority.HIGH, -50)
+        # Someone else's work is not offered
+        self.task('ajena', CallTask.Priority.URGENT, -999, assigned_to=agents[1])
+
+        claimed = [CallQueue.claim(agents[0]) for _ in range(5)]
+
+        assert [task.pk if task else None for task in claimed] == [first.pk, later.pk, high.pk, low.pk, None]
+        first.refresh_from_db()
+        assert first.status == CallTask.Status.IN_PROGRESS
+        assert first.assigned_to == agents[0]
+        assert first.call_attempts == 1
+        assert first.lease_expires_at > timezone.now()
+
+    def test_locked_rows_are_skipped(self, agents):
+        first = self.task('primera', CallTask.Priority.URGENT)
+        second = self.task('segunda', CallTask.Priority.HIGH)
+
+        with CaptureQueriesContext(connection) as queries:
+            claimed = CallQueue.claim(agents[0])
+        assert claimed == first
+        assert any('SKIP LOCKED' in entry['sql'] for entry in queries.captured_queries)
+        assert CallQueue.claim(agents[1]) == second
+
+    def test_expired_leases_return_to_the_pool(self, agents):
+        task = self.task('abandonada')
+        assert CallQueue.claim(agents[0]) == task
+        assert CallQueue.claim(agents[1]) is None
+
+        CallTask.objects.filter(pk=task.pk).update(lease_expires_at=timezone.now() - timedelta(minutes=1))
+        assert CallQueue.renew(task.pk, agents[0]) is None
+        reclaimed = CallQueue.claim(agents[1])
+        assert reclaimed == task
+        assert reclaimed.assigned_to == agents[1]
+        assert reclaimed.call_attempts == 2
+
+        CallTask.objects.filter(pk=task.pk).update(lease_expires_at=timezone.now() - timedelta(minutes=1))
+        assert CallQueue.release_expired() == 1
+        task.refresh_from_db()
+        assert (task.status, task.assigned_to, task.lease_expires_at) == (CallTask.Status.PENDING, None, None)
+
+    def test_unanswered_calls_wait_before_retry(self, agents, settings):
+        settings.CALL_QUEUE = {'RETRY_MINUTES': 30}
+        task = self.task('sin respuesta', status=CallTask.Status.NO_ANSWER, last_call_date=timezone.now())
+        assert CallQueue.claim(agents[0]) is None
+
+        CallTask.objects.filter(pk=task.pk).update(last_call_date=timezone.now() - timedelta(minutes=31))
+        assert CallQueue.claim(agents[0]) == task
+
+    def test_endpoints(self, factory, inspector_user, agents):
+        task = self.task('api')
+
+        def post(view, user, **kwargs):
+            request = factory.post('/api/appointments/tasks/next/')
+            force_authenticate(request, user=user)
+            return view(request, **kwargs)
+
+        assert post(call_task_next, inspector_user).status_code == 403
+        response = post(call_task_next, agents[0])
+        assert response.data['task']['id'] == str(task.pk)
+        assert response.data['task']['lease_expires_at']
+        assert post(call_task_next, agents[1]).data['task'] is None
+
+        assert post(call_task_renew_lease, agents[0], task_id=task.pk).status_code == 200
+        assert post(call_task_renew_lease, agents[1], task_id=task.pk).status_code == 409
@@ -14,6 +14,7 @@ urlpatterns = [
     # Inspector Schedule/Calendar
     path('inspector-schedule/', views.inspector_schedule, name='inspector-schedule-self'),
     path('inspector-schedule/<uuid:inspector_id>/', views.inspector_schedule, name='inspector-schedule'),
+    path('team-schedule/', views.team_schedule, name='team-schedule'),
     
     # Reschedule
     path('needs-reschedule/', views.appointments_needing_reschedule, name='needs-reschedule'),
@@ -21,6 +22,10 @@ urlpatterns = [
     
     # Call Tasks (Call Center Admin)
     path('tasks/', views.call_task_list_create, name='task-list-create'),
+    path('tasks/campaign/', views.call_task_campaign, name='task-campaign'),
+    path('tasks/campaign/<uuid:job_id>/', views.call_task_campaign_status, name='task-campaign-status'),
+    path('tasks/next/', views.call_task_next, name='task-next'),
+    path('tasks/<uuid:task_id>/lease/', views.call_task_renew_lease, name='task-renew-lease'),
     path('tasks/<uuid:task_id>/', views.call_task_detail, name='task-detail'),
     path('clients-needing-inspection/', views.clients_needing_inspection, name='clients-needing-inspection'),
     path('call-centers/', views.list_call_centers, name='list-call-centers'),
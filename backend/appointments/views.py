@@ -5,14 +5,30 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from .models import Appointment
-from .serializers import AppointmentSerializer, AppointmentCreateSerializer, AppointmentUpdateSerializer
+from .services import AvailabilityService, CalendarService, DEFAULT_DURATION_MINUTES
+from .serializers import (
+    AppointmentSerializer, AppointmentCreateSerializer, AppointmentUpdateSerializer,
+    AppointmentListSerializer,
+)
 from datetime import datetime, timedelta
+from core.cache import CacheManager, cache_view, role_scope
+from core.utils.pagination import KeysetPagination
+import uuid
 
 User = get_user_model()
 
+# Inspectores por consulta de team_schedule
+MAX_TEAM_INSPECTORS = 200
+
+
+class AppointmentPagination(KeysetPagination):
+    """Pages of appointments in schedule order (appt_schedule_id_idx)"""
+    keyset_ordering = ('-scheduled_date', '-scheduled_time', '-id')
+
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@cache_view(key_prefix='appointments', scope=role_scope('ADMIN', 'CALL_CENTER'))
 def appointment_list_create(request):
     """
     GET: List all appointments (filtered by user role)
@@ -50,7 +66,18 @@ def appointment_list_create(request):
         if inspector_id:
             appointments = appointments.filter(inspector_id=inspector_id)
         
-        serializer = AppointmentSerializer(appointments, many=True)
+        # One query for the rows and their related names, however many rows
+        appointments = AppointmentListSerializer.prepare_queryset(appointments)
+        
+        # Paginated on request (?cursor= or ?page=); the full list is kept
+        # for existing clients
+        if AppointmentPagination.requested(request):
+            paginator = AppointmentPagination()
+            page = paginator.paginate_queryset(appointments, request)
+            serializer = AppointmentListSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        
+        serializer = AppointmentListSerializer(appointments, many=True)
         return Response({
             'success': True,
             'appointments': serializer.data
@@ -243,7 +270,10 @@ def appointment_detail(request, appointment_id):
 @permission_classes([IsAuthenticated])
 def available_inspectors(request):
     """
-    Get list of available inspectors for a given date and time
+    Get list of available inspectors for a given date and time window
+    
+    Query params: date, time, duration (minutes, default 60). Inspectors
+    are ordered by how close their nearest booked work is that day.
     """
     
     scheduled_date = request.GET.get('date')
@@ -255,17 +285,17 @@ def available_inspectors(request):
             'error': 'Fecha y hora son requeridas'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get all active inspectors
-    inspectors = User.objects.filter(role='INSPECTOR', is_active=True)
-    
-    # Filter out inspectors with conflicting appointments
-    busy_inspectors = Appointment.objects.filter(
-        scheduled_date=scheduled_date,
-        scheduled_time=scheduled_time,
-        status__in=['PENDING', 'CONFIRMED', 'IN_PROGRESS']
-    ).values_list('inspector_id', flat=True)
-    
-    available = inspectors.exclude(id__in=busy_inspectors)
+    try:
+        day = datetime.strptime(scheduled_date, '%Y-%m-%d').date()
+        start = datetime.strptime(scheduled_time[:5], '%H:%M').time()
+        duration = int(request.GET.get('duration', DEFAULT_DURATION_MINUTES))
+        # One lookup on the day's availability bitmaps
+        available = AvailabilityService.free_inspectors(day, start, duration)
+    except ValueError:
+        return Response({
+            'success': False,
+            'error': 'Fecha, hora o duración inválidas'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     # Serialize inspector data
     inspector_data = [{
@@ -273,11 +303,14 @@ def available_inspectors(request):
         'name': f"{inspector.first_name} {inspector.last_name}",
         'email': inspector.email,
         'phone': str(inspector.phone_number) if inspector.phone_number else '',
-        'license_number': inspector.license_number
+        'license_number': inspector.license_number,
+        'gap_minutes': inspector.gap_minutes
     } for inspector in available]
     
     return Response({
         'success': True,
+        'duration_minutes': duration,
+        'nearest': inspector_data[0] if inspector_data else None,
         'inspectors': inspector_data
     })
 
@@ -319,90 +352,51 @@ def update_appointment_status(request, appointment_id):
 # ==================== CALL TASK VIEWS (Call Center Admin) ====================
 from .models import CallTask
 from .serializers import CallTaskSerializer, CallTaskCreateSerializer
+from .campaigns import CallCampaign
+from .dispatch import CallQueue
+from .services import DueClientService
+from .tasks import CampaignStatus, enqueue_campaign
+from core.utils.export import EXPORT_FORMATS, stream_rows
 from datetime import date
 
 
+class DueClientPagination(KeysetPagination):
+    """Pages of due clients, most urgent first"""
+    keyset_ordering = DueClientService.ORDERING
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def clients_needing_inspection(request):
     """
-    Lista de clientes que necesitan inspección próximamente.
+    Lista de clientes que necesitan inspección próximamente, por prioridad.
     Solo para CALL_CENTER_ADMIN y ADMIN.
+
+    Paginada con ?page= o ?cursor=; ?export=ndjson|csv descarga la lista
+    completa en streaming para campañas de llamadas.
     """
     if request.user.role not in ['ADMIN', 'CALL_CENTER_ADMIN']:
         return Response({"error": "No autorizado"}, status=403)
     
-    # Obtener usuarios con próxima inspección dentro de 6 meses
-    from datetime import timedelta
-    today = date.today()
-    six_months_later = today + timedelta(days=180)
-    
-    # Clientes que necesitan inspección (próximos a vencer o vencidos)
-    clients = User.objects.filter(
-        role='USER',
-        is_active=True,
-        next_inspection_due__isnull=False,
-        next_inspection_due__lte=six_months_later
-    ).order_by('next_inspection_due')
-    
-    # También incluir clientes sin próxima inspección pero con última inspección hace más de 4 años
-    four_years_ago = today - timedelta(days=4*365)
-    clients_old = User.objects.filter(
-        role='USER',
-        is_active=True,
-        next_inspection_due__isnull=True,
-        last_inspection_date__lte=four_years_ago
-    )
-    
-    # Clientes sin inspección registrada
-    clients_never = User.objects.filter(
-        role='USER',
-        is_active=True,
-        last_inspection_date__isnull=True
-    )
-    
-    clients_data = []
-    
-    # Procesar clientes próximos a vencer
-    for client in clients:
-        days_until = (client.next_inspection_due - today).days
-        clients_data.append({
-            'id': str(client.id),
-            'full_name': client.get_full_name(),
-            'email': client.email,
-            'phone': str(client.phone_number) if client.phone_number else '',
-            'dni': client.dni,
-            'address': client.address or '',
-            'city': client.city or '',
-            'last_inspection_date': client.last_inspection_date.isoformat() if client.last_inspection_date else None,
-            'next_inspection_due': client.next_inspection_due.isoformat() if client.next_inspection_due else None,
-            'days_until_due': days_until,
-            'status': 'OVERDUE' if days_until < 0 else ('WARNING' if days_until <= 90 else 'OK'),
-            'priority': 'URGENT' if days_until < 0 else ('HIGH' if days_until <= 30 else ('MEDIUM' if days_until <= 90 else 'LOW'))
-        })
+    # Días, estado y prioridad se calculan y ordenan en la base de datos
+    clients = DueClientService.queryset()
     
-    # Procesar clientes con inspección antigua
-    for client in clients_old:
-        days_since = (today - client.last_inspection_date).days if client.last_inspection_date else 9999
-        clients_data.append({
-            'id': str(client.id),
-            'full_name': client.get_full_name(),
-            'email': client.email,
-            'phone': str(client.phone_number) if client.phone_number else '',
-            'dni': client.dni,
-            'address': client.address or '',
-            'city': client.city or '',
-            'last_inspection_date': client.last_inspection_date.isoformat() if client.last_inspection_date else None,
-            'next_inspection_due': None,
-            'days_until_due': -days_since,
-            'status': 'OVERDUE',
-            'priority': 'HIGH'
-        })
+    export_format = request.GET.get('export')
+    if export_format:
+        if export_format not in EXPORT_FORMATS:
+            return Response({
+                'success': False,
+                'error': f"Formato de exportación inválido, use: {', '.join(EXPORT_FORMATS)}"
+            }, status=400)
+        rows = (DueClientService.row(client) for client in clients.iterator(chunk_size=2000))
+        return stream_rows(rows, export_format, f'clientes-inspeccion-{date.today().isoformat()}')
     
-    # Ordenar por prioridad
-    priority_order = {'URGENT': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
-    clients_data.sort(key=lambda x: (priority_order.get(x['priority'], 4), x['days_until_due']))
+    if DueClientPagination.requested(request):
+        paginator = DueClientPagination()
+        page = paginator.paginate_queryset(clients, request)
+        return paginator.get_paginated_response([DueClientService.row(client) for client in page])
     
+    clients_data = [DueClientService.row(client) for client in clients]
     return Response({
         'success': True,
         'total': len(clients_data),
@@ -456,6 +450,107 @@ def call_task_list_create(request):
         return Response({'success': False, 'errors': serializer.errors}, status=400)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def call_task_campaign(request):
+    """
+    Encola la creación en lote de tareas de llamada para los clientes que
+    necesitan inspección (los de clients_needing_inspection sin una tarea
+    abierta), repartidas entre los Call Center activos con menos tareas
+    abiertas. Responde 202 con el job a consultar en tasks/campaign/<job_id>/.
+    Solo para CALL_CENTER_ADMIN y ADMIN.
+
+    Body: priorities (lista), city, limit, dry_run
+    """
+    if request.user.role not in ['ADMIN', 'CALL_CENTER_ADMIN']:
+        return Response({"error": "Solo Call Center Admin puede crear campañas"}, status=403)
+    
+    priorities = request.data.get('priorities') or []
+    if isinstance(priorities, str):
+        priorities = [value.strip() for value in priorities.split(',') if value.strip()]
+    try:
+        limit = request.data.get('limit')
+        campaign = CallCampaign(
+            assigned_by=request.user,
+            priorities=priorities,
+            city=request.data.get('city') or None,
+            limit=int(limit) if limit not in (None, '') else None,
+        )
+    except (TypeError, ValueError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+    
+    if str(request.data.get('dry_run', '')).lower() in ('1', 'true'):
+        return Response({
+            'success': True,
+            'dry_run': True,
+            'clients': campaign.count(),
+            'agents': len(campaign.agents()),
+        })
+    
+    # Un worker crea las tareas por lotes; la petición no espera
+    job = enqueue_campaign(campaign)
+    return Response({
+        'success': True,
+        'job': job,
+        'message': 'Campaña en cola'
+    }, status=202)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def call_task_campaign_status(request, job_id):
+    """
+    Estado de una campaña encolada: PENDING, RUNNING (created/total),
+    COMPLETED (created, assigned) o FAILED (error).
+    Solo para CALL_CENTER_ADMIN y ADMIN.
+    """
+    if request.user.role not in ['ADMIN', 'CALL_CENTER_ADMIN']:
+        return Response({"error": "Solo Call Center Admin puede consultar campañas"}, status=403)
+    
+    job = CacheManager.get_campaign(job_id)
+    if job is None:
+        return Response({'success': False, 'error': 'Campaña no encontrada'}, status=404)
+    
+    response = Response({'success': True, 'job': job})
+    if job['status'] in CampaignStatus.IN_PROGRESS:
+        # Hint for pollers
+        response['Retry-After'] = '2'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def call_task_next(request):
+    """
+    Reserva para el agente la siguiente tarea de la cola (la más urgente
+    libre, suya o sin asignar) y la marca IN_PROGRESS hasta lease_expires_at.
+    Solo para CALL_CENTER y CALL_CENTER_ADMIN.
+    """
+    if request.user.role not in ['CALL_CENTER', 'CALL_CENTER_ADMIN']:
+        return Response({"error": "No autorizado"}, status=403)
+    
+    task = CallQueue.claim(request.user)
+    if task is None:
+        return Response({'success': True, 'task': None, 'message': 'No hay tareas pendientes'})
+    return Response({'success': True, 'task': CallTaskSerializer(task).data})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def call_task_renew_lease(request, task_id):
+    """
+    Extiende la reserva de una tarea mientras el agente sigue con ella.
+    409 si la reserva venció y la tarea volvió a la cola.
+    """
+    expires = CallQueue.renew(task_id, request.user)
+    if expires is None:
+        return Response({
+            'success': False,
+            'error': 'La tarea ya no está reservada por este agente'
+        }, status=409)
+    return Response({'success': True, 'lease_expires_at': expires})
+
+
 @api_view(['GET', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def call_task_detail(request, task_id):
@@ -492,6 +587,9 @@ def call_task_detail(request, task_id):
             from django.utils import timezone
             task.last_call_date = timezone.now()
             task.call_attempts += 1
+        elif 'status' in request.data:
+            # Fuera de IN_PROGRESS la tarea ya no está reservada
+            task.lease_expires_at = None
         
         task.save()
         serializer = CallTaskSerializer(task)
@@ -593,9 +691,6 @@ def inspector_schedule(request, inspector_id=None):
     Si no se especifica inspector_id, retorna el del inspector actual.
     Parámetros opcionales: month, year para filtrar por mes.
     """
-    from datetime import datetime, timedelta
-    from calendar import monthrange
-    
     # Determinar qué inspector consultar
     if inspector_id:
         if request.user.role not in ['ADMIN', 'CALL_CENTER_ADMIN', 'CALL_CENTER', 'INSPECTOR']:
@@ -610,64 +705,13 @@ def inspector_schedule(request, inspector_id=None):
             return Response({"error": "Debe especificar un inspector"}, status=400)
         inspector = request.user
     
-    # Obtener mes y año (default: mes actual)
-    today = date.today()
-    month = int(request.query_params.get('month', today.month))
-    year = int(request.query_params.get('year', today.year))
-    
-    # Calcular rango de fechas del mes
-    first_day = date(year, month, 1)
-    last_day = date(year, month, monthrange(year, month)[1])
-    
-    # Obtener citas del inspector en el rango
-    appointments = Appointment.objects.filter(
-        inspector=inspector,
-        scheduled_date__gte=first_day,
-        scheduled_date__lte=last_day
-    ).exclude(
-        status__in=['CANCELLED']
-    ).order_by('scheduled_date', 'scheduled_time')
-    
-    # Organizar por día
-    schedule_by_day = {}
-    for apt in appointments:
-        day_key = apt.scheduled_date.isoformat()
-        if day_key not in schedule_by_day:
-            schedule_by_day[day_key] = []
-        
-        schedule_by_day[day_key].append({
-            'id': str(apt.id),
-            'time': apt.scheduled_time.strftime('%H:%M'),
-            'client_name': apt.client_name,
-            'address': apt.address,
-            'status': apt.status,
-            'status_display': apt.get_status_display(),
-        })
-    
-    # Crear lista de todos los días del mes con su info
-    calendar_data = []
-    current = first_day
-    while current <= last_day:
-        day_str = current.isoformat()
-        day_appointments = schedule_by_day.get(day_str, [])
-        
-        calendar_data.append({
-            'date': day_str,
-            'day': current.day,
-            'weekday': current.strftime('%A'),
-            'weekday_short': current.strftime('%a'),
-            'is_today': current == today,
-            'is_past': current < today,
-            'appointments_count': len(day_appointments),
-            'appointments': day_appointments,
-            'is_busy': len(day_appointments) >= 8,  # Más de 8 citas = día ocupado
-        })
-        current += timedelta(days=1)
+    month_params = _month_params(request)
+    if month_params is None:
+        return Response({"error": "Mes o año inválido"}, status=400)
+    year, month = month_params
     
-    # Estadísticas del mes
-    total_appointments = appointments.count()
-    completed = appointments.filter(status='COMPLETED').count()
-    pending = appointments.filter(status__in=['PENDING', 'CONFIRMED']).count()
+    # Días y estadísticas desde la caché por inspector-mes (una consulta si falta)
+    buckets = CalendarService.buckets([inspector.id], year, month)[inspector.id]
     
     return Response({
         'success': True,
@@ -677,17 +721,72 @@ def inspector_schedule(request, inspector_id=None):
         },
         'month': month,
         'year': year,
-        'month_name': first_day.strftime('%B'),
-        'calendar': calendar_data,
-        'stats': {
-            'total': total_appointments,
-            'completed': completed,
-            'pending': pending,
-            'available_slots': (monthrange(year, month)[1] * 8) - total_appointments  # 8 slots por día
-        }
+        'month_name': date(year, month, 1).strftime('%B'),
+        'calendar': CalendarService.days(year, month, buckets),
+        'stats': CalendarService.stats(year, month, buckets),
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def team_schedule(request):
+    """
+    Calendario del mes de varios inspectores (hasta MAX_TEAM_INSPECTORS).
+    Parámetros opcionales: month, year, inspectors (ids separados por coma;
+    por defecto todos los activos), appointments=1 para incluir las citas.
+    """
+    if request.user.role not in ['ADMIN', 'CALL_CENTER_ADMIN', 'CALL_CENTER']:
+        return Response({"error": "No autorizado"}, status=403)
+    
+    month_params = _month_params(request)
+    if month_params is None:
+        return Response({"error": "Mes o año inválido"}, status=400)
+    year, month = month_params
+    
+    inspectors = User.objects.filter(role='INSPECTOR', is_active=True).order_by('first_name', 'last_name')
+    requested = [value for value in request.query_params.get('inspectors', '').split(',') if value]
+    if requested:
+        try:
+            inspectors = inspectors.filter(id__in=[uuid.UUID(value) for value in requested])
+        except ValueError:
+            return Response({"error": "Inspector inválido"}, status=400)
+    inspectors = list(inspectors.only('id', 'first_name', 'last_name', 'username')[:MAX_TEAM_INSPECTORS + 1])
+    if len(inspectors) > MAX_TEAM_INSPECTORS:
+        return Response({
+            "error": f"Máximo {MAX_TEAM_INSPECTORS} inspectores por consulta"
+        }, status=400)
+    
+    include_appointments = request.query_params.get('appointments') in ('1', 'true')
+    buckets = CalendarService.buckets([inspector.id for inspector in inspectors], year, month)
+    
+    return Response({
+        'success': True,
+        'month': month,
+        'year': year,
+        'month_name': date(year, month, 1).strftime('%B'),
+        'inspectors': [{
+            'id': str(inspector.id),
+            'name': f"{inspector.first_name} {inspector.last_name}".strip() or inspector.username,
+            'calendar': CalendarService.days(
+                year, month, buckets[inspector.id], include_appointments=include_appointments
+            ),
+            'stats': CalendarService.stats(year, month, buckets[inspector.id]),
+        } for inspector in inspectors],
+    })
+
+
+def _month_params(request):
+    """``(year, month)`` from the query string (default: current month), or None if invalid"""
+    today = date.today()
+    try:
+        month = int(request.query_params.get('month', today.month))
+        year = int(request.query_params.get('year', today.year))
+        date(year, month, 1)
+    except ValueError:
+        return None
+    return year, month
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_call_centers(request):
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Auto-Scheduling Benchmark
+Plans and applies NEEDS_RESCHEDULE appointments spread over neighborhoods
+for a fleet of inspectors with the AUTO_SCHEDULING settings.
+
+Usage:
+    python benchmarks/auto_schedule.py --appointments 10000 --inspectors 200
+
+Needs a PostgreSQL database. Everything is written inside one transaction
+that is rolled back at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from datetime import time as clock, timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from appointments.models import Appointment
+from appointments.scheduling import AutoScheduler
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def populate(inspectors, appointments, neighborhoods):
+    User.objects.bulk_create([
+        User(
+            username=f'bench-inspector-{index}',
+            email=f'bench-inspector-{index}@example.com',
+            first_name='Bench',
+            last_name=str(index),
+            role=User.Role.INSPECTOR,
+            password='!',
+        )
+        for index in range(inspectors)
+    ])
+    yesterday = timezone.localdate() - timedelta(days=1)
+    Appointment.objects.bulk_create([
+        Appointment(
+            client_name=f'Bench {index}',
+            client_phone='3000000000',
+            address=f'Calle {index}',
+            neighborhood=f'Barrio {random.randrange(neighborhoods)}',
+            scheduled_date=yesterday,
+            scheduled_time=clock(9),
+            status=Appointment.Status.NEEDS_RESCHEDULE,
+        )
+        for index in range(appointments)
+    ], batch_size=5000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--appointments', type=int, default=10000)
+    parser.add_argument('--inspectors', type=int, default=200)
+    parser.add_argument('--neighborhoods', type=int, default=60)
+    parser.add_argument('--days', type=int, default=14)
+    args = parser.parse_args()
+
+    random.seed(1)
+    try:
+        with transaction.atomic():
+            populate(args.inspectors, args.appointments, args.neighborhoods)
+            scheduler = AutoScheduler(days=args.days)
+
+            began = time.perf_counter()
+            scheduler.load()
+            print(f"Load:  {time.perf_counter() - began:.2f} s")
+
+            began = time.perf_counter()
+            plan = scheduler.plan()
+            summary = scheduler.summary(plan)
+            print(f"Plan:  {time.perf_counter() - began:.2f} s  "
+                  f"({summary['placed']:,}/{summary['items']:,} placed)")
+
+            visits = {}
+            for item in plan:
+                if item['after']:
+                    key = (item['after']['inspector_id'], item['after']['scheduled_date'])
+                    visits.setdefault(key, set()).add(item['area'])
+            if visits:
+                areas = sum(len(value) for value in visits.values()) / len(visits)
+                print(f"       {areas:.2f} neighborhoods per inspector-day on average")
+
+            began = time.perf_counter()
+            written = scheduler.apply(plan)
+            print(f"Apply: {time.perf_counter() - began:.2f} s  ({written:,} appointments)")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
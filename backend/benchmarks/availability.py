@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Inspector Availability Benchmark
+Answers "who is free from <time> for 60 minutes" with the legacy
+exact-slot query, an overlap query on appointments, and the availability
+bitmaps, on a synthetic fleet of inspectors with a few bookings per day.
+
+Usage:
+    python benchmarks/availability.py --inspectors 500 --days 90
+
+Needs a PostgreSQL database. Everything is written inside one transaction
+that is rolled back at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from datetime import datetime, timedelta, time as clock
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from appointments.models import Appointment
+from appointments.services import BOOKED_STATUSES, DEFAULT_DURATION_MINUTES, AvailabilityService
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def populate(inspectors, days, per_day):
+    users = User.objects.bulk_create([
+        User(
+            username=f'bench-inspector-{index}',
+            email=f'bench-inspector-{index}@example.com',
+            first_name='Bench',
+            last_name=str(index),
+            role=User.Role.INSPECTOR,
+            password='!',
+        )
+        for index in range(inspectors)
+    ])
+    today = timezone.localdate()
+    appointments = []
+    for user in users:
+        for offset in range(days):
+            for hour in random.sample(range(7, 18), per_day):
+                appointments.append(Appointment(
+                    client_name='Bench',
+                    client_phone='3000000000',
+                    address='Calle 1',
+                    scheduled_date=today + timedelta(days=offset),
+                    scheduled_time=clock(hour, random.choice((0, 30))),
+                    inspector=user,
+                ))
+    # bulk_create skips the signals: the bitmaps are built by rebuild()
+    Appointment.objects.bulk_create(appointments, batch_size=5000)
+    return len(appointments)
+
+
+def legacy(day, start, minutes):
+    """The previous query: only exact-time conflicts"""
+    busy = Appointment.objects.filter(
+        scheduled_date=day, scheduled_time=start, status__in=BOOKED_STATUSES
+    ).values_list('inspector_id', flat=True)
+    return list(User.objects.filter(role='INSPECTOR', is_active=True).exclude(id__in=busy))
+
+
+def overlap(day, start, minutes):
+    """Interval overlap on appointments, assuming DEFAULT_DURATION_MINUTES each"""
+    begin = datetime.combine(day, start)
+    busy = Appointment.objects.filter(
+        scheduled_date=day,
+        status__in=BOOKED_STATUSES,
+        scheduled_time__gt=(begin - timedelta(minutes=DEFAULT_DURATION_MINUTES)).time(),
+        scheduled_time__lt=(begin + timedelta(minutes=minutes)).time(),
+    ).values_list('inspector_id', flat=True)
+    return list(User.objects.filter(role='INSPECTOR', is_active=True).exclude(id__in=busy))
+
+
+def timed(func, cases):
+    samples = []
+    for day, start in cases:
+        began = time.perf_counter()
+        func(day, start, 60)
+        samples.append((time.perf_counter() - began) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--inspectors', type=int, default=500)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--per-day', type=int, default=4, help='Bookings per inspector and day')
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(1)
+    today = timezone.localdate()
+    cases = [
+        (today + timedelta(days=random.randrange(args.days)), clock(random.randrange(7, 17), random.choice((0, 30))))
+        for _ in range(args.queries)
+    ]
+
+    try:
+        with transaction.atomic():
+            began = time.perf_counter()
+            count = populate(args.inspectors, args.days, args.per_day)
+            print(f"{args.inspectors} inspectors x {args.days} days: {count:,} appointments "
+                  f"({time.perf_counter() - began:.1f} s)")
+
+            began = time.perf_counter()
+            written = AvailabilityService.rebuild(start=today, days=args.days)
+            print(f"Rebuild:          {written:,} bitmaps in {time.perf_counter() - began:.2f} s")
+
+            median, p99 = timed(legacy, cases)
+            print(f"Exact-slot query: median {median:.2f} ms  p99 {p99:.2f} ms  (misses overlaps)")
+            median, p99 = timed(overlap, cases)
+            print(f"Overlap query:    median {median:.2f} ms  p99 {p99:.2f} ms")
+            median, p99 = timed(AvailabilityService.free_inspectors, cases)
+            print(f"Bitmap lookup:    median {median:.2f} ms  p99 {p99:.2f} ms  (ranked, with gaps)")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
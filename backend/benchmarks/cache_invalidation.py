@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Cache Invalidation Benchmark
+Compares invalidating one namespace with a generation bump against the
+SCAN-based delete_pattern, with the keyspace filled with unrelated keys.
+
+Usage:
+    python benchmarks/cache_invalidation.py --cache-alias bench --keys 1000000
+
+Point ``--cache-alias`` at a CACHES entry of its own (e.g. a separate Redis
+DB): the fill writes up to a million keys. Only the keys written by the run
+are deleted afterwards, but ``default`` also holds sessions, rate-limit
+windows and job state, so it has to be named explicitly.
+
+delete_pattern is only measured on backends that provide it (django-redis);
+on LocMem only the generation bump is timed, and keyspaces larger than its
+MAX_ENTRIES are refused since culling would evict the filler keys.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from django.core.cache import caches
+import core.cache
+from core.cache import CacheManager
+
+BATCH = 10000
+
+
+def filler_keys(total):
+    for start in range(0, total, BATCH):
+        yield [f"bench:filler:{index}" for index in range(start, min(start + BATCH, total))]
+
+
+def fill(cache, total, namespace_keys):
+    """
+    Fill the cache with ``total`` keys, ``namespace_keys`` of them under
+    user:bench; returns the namespace keys written
+    """
+    for keys in filler_keys(total):
+        cache.set_many(dict.fromkeys(keys, 0), CacheManager.TIMEOUT_LONG)
+    written = []
+    for index in range(namespace_keys):
+        written.append(f"{CacheManager.PREFIX_USER}:bench:{index}")
+        written.append(CacheManager.versioned_key('user:bench', index))
+        cache.set(written[-2], index, CacheManager.TIMEOUT_LONG)
+        cache.set(written[-1], index, CacheManager.TIMEOUT_LONG)
+    return written
+
+
+def cleanup(cache, total, namespace_keys):
+    """Delete only the keys this run wrote"""
+    for keys in filler_keys(total):
+        cache.delete_many(keys)
+    cache.delete_many(namespace_keys + [CacheManager._generation_key('user:bench')])
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--keys', type=int, default=1_000_000, help='Keys in the keyspace')
+    parser.add_argument('--namespace-keys', type=int, default=100, help='Keys in the invalidated namespace')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cache-alias', help='CACHES alias to run against (a dedicated one)')
+    args = parser.parse_args()
+
+    if args.cache_alias is None:
+        parser.error("--cache-alias is required; use a dedicated cache, 'default' only if you mean it")
+    cache = caches[args.cache_alias]
+    if not hasattr(cache, 'delete_pattern') and args.keys + 2 * args.namespace_keys > cache._max_entries:
+        parser.error(
+            f"{type(cache).__name__} keeps at most {cache._max_entries:,} keys (MAX_ENTRIES); "
+            f"{args.keys:,} would be evicted while filling and the timings would be meaningless"
+        )
+    # CacheManager reads and writes through core.cache.cache
+    core.cache.cache = cache
+
+    print(f"Backend: {type(cache).__name__} ({args.cache_alias})")
+    print(f"Filling {args.keys:,} keys...")
+    namespace_keys = fill(cache, args.keys, args.namespace_keys)
+    try:
+        run(cache, args)
+    finally:
+        cleanup(cache, args.keys, namespace_keys)
+
+
+def run(cache, args):
+    median, worst = timed(lambda: CacheManager.bump_generation('user:bench'), args.repeat)
+    print(f"Generation bump:  median {median:.3f} ms  max {worst:.3f} ms")
+
+    if hasattr(cache, 'delete_pattern'):
+        def pattern_delete():
+            CacheManager.delete_pattern(f"{CacheManager.PREFIX_USER}:bench:*")
+
+        median, worst = timed(pattern_delete, max(1, args.repeat // 4))
+        print(f"delete_pattern:   median {median:.3f} ms  max {worst:.3f} ms")
+    else:
+        print("delete_pattern:   not supported by this backend")
+
+
+if __name__ == '__main__':
+    main()
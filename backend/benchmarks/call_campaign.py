@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Call Campaign Benchmark
+Creates call tasks for a synthetic base of due clients with CallCampaign
+(anti-join, batched bulk_create) and, on a sample, one client at a time
+with an exists() check and a save() per task.
+
+Usage:
+    python benchmarks/call_campaign.py --clients 100000 --agents 40
+
+Needs a PostgreSQL database. Everything is written inside one transaction
+that is rolled back at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import resource
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from appointments.campaigns import CallCampaign
+from appointments.models import CallTask
+from appointments.services import DueClientService
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def populate(clients, agents):
+    today = date.today()
+    User.objects.bulk_create([
+        User(
+            username=f'bench-agent-{index}',
+            email=f'bench-agent-{index}@example.com',
+            first_name='Agent',
+            last_name=str(index),
+            role=User.Role.CALL_CENTER,
+            password='!',
+        )
+        for index in range(agents)
+    ])
+    User.objects.bulk_create([
+        User(
+            username=f'bench-client-{index}',
+            email=f'bench-client-{index}@example.com',
+            first_name='Bench',
+            last_name=str(index),
+            role=User.Role.USER,
+            password='!',
+            next_inspection_due=today + timedelta(days=random.randrange(-200, 180)),
+        )
+        for index in range(clients)
+    ], batch_size=5000)
+
+
+def one_at_a_time(sample):
+    """The manual flow: check for an open task, then create one"""
+    agents = list(User.objects.filter(role=User.Role.CALL_CENTER, is_active=True))
+    for index, client in enumerate(DueClientService.queryset()[:sample]):
+        if CallTask.objects.filter(client_user=client, status__in=CallTask.OPEN_STATUSES).exists():
+            continue
+        CallTask.objects.create(
+            client_name=client.get_full_name(), client_phone='', client_address='',
+            client_user=client, days_until_due=client.days_until_due, priority=client.priority,
+            assigned_to=agents[index % len(agents)],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--agents', type=int, default=40)
+    parser.add_argument('--sample', type=int, default=2000, help='Clients for the one-at-a-time run')
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    try:
+        with transaction.atomic():
+            began = time.perf_counter()
+            populate(args.clients, args.agents)
+            print(f"{args.clients:,} due clients, {args.agents} agents ({time.perf_counter() - began:.1f} s)")
+
+            with transaction.atomic():
+                began = time.perf_counter()
+                one_at_a_time(args.sample)
+                elapsed = time.perf_counter() - began
+                print(f"One at a time:  {args.sample:,} tasks in {elapsed:.2f} s "
+                      f"({args.sample / elapsed:,.0f} tasks/s)")
+                transaction.set_rollback(True)
+
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            began = time.perf_counter()
+            result = CallCampaign(batch_size=args.batch_size).run()
+            elapsed = time.perf_counter() - began
+            grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+            loads = [agent['tasks'] for agent in result['assigned']]
+            print(f"CallCampaign:   {result['created']:,} tasks in {elapsed:.2f} s "
+                  f"({result['created'] / elapsed:,.0f} tasks/s), peak RSS +{grown / 1024:.1f} MiB, "
+                  f"{min(loads)}-{max(loads)} per agent")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Call Queue Benchmark
+Simulates concurrent call center agents pulling tasks from the work queue,
+claiming with SELECT ... FOR UPDATE SKIP LOCKED (CallQueue.claim) and with
+a plain FOR UPDATE, and reports throughput, empty claims while work was
+left and tasks claimed twice.
+
+Usage:
+    python benchmarks/call_queue.py --agents 50 --tasks 5000
+
+Needs a PostgreSQL database accepting one connection per agent. Agents are
+separate processes, like web workers, with their own connections, so the
+rows are committed; they are deleted at the end.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from appointments.dispatch import CallQueue
+from appointments.models import CallTask
+
+User = get_user_model()
+
+
+def populate(agents, tasks):
+    users = User.objects.bulk_create([
+        User(
+            username=f'bench-agent-{index}',
+            email=f'bench-agent-{index}@example.com',
+            first_name='Agent',
+            last_name=str(index),
+            role=User.Role.CALL_CENTER,
+            password='!',
+        )
+        for index in range(agents)
+    ])
+    CallTask.objects.bulk_create([
+        CallTask(
+            client_name='Bench',
+            client_phone='3000000000',
+            client_address='bench-queue',
+            priority=random.choice(CallTask.Priority.values),
+            days_until_due=random.randrange(-200, 180),
+        )
+        for _ in range(tasks)
+    ], batch_size=5000)
+    return users
+
+
+def plain_claim(agent):
+    """CallQueue.claim with a blocking FOR UPDATE"""
+    now = timezone.now()
+    with transaction.atomic():
+        task = CallQueue.claimable(agent, now).select_for_update().first()
+        if task is None:
+            return None
+        CallTask.objects.filter(pk=task.pk).update(
+            status=CallTask.Status.IN_PROGRESS, assigned_to=agent, lease_expires_at=now + timedelta(minutes=15),
+            call_attempts=task.call_attempts + 1,
+        )
+    return task
+
+
+def agent_loop(agent, claim, remaining, claimed, empty, latencies):
+    samples = []
+    try:
+        while True:
+            began = time.perf_counter()
+            task = claim(agent)
+            samples.append((time.perf_counter() - began) * 1000)
+            if task is None:
+                with remaining.get_lock():
+                    if remaining.value <= 0:
+                        return
+                # An empty answer while tasks are left is a lost claim
+                with empty.get_lock():
+                    empty.value += 1
+                continue
+            CallTask.objects.filter(pk=task.pk).update(status=CallTask.Status.COMPLETED, lease_expires_at=None)
+            with remaining.get_lock():
+                remaining.value -= 1
+            with claimed.get_lock():
+                claimed.value += 1
+    finally:
+        latencies.put(samples)
+        connection.close()
+
+
+def run(label, claim, agents, tasks):
+    CallTask.objects.filter(client_address='bench-queue').update(
+        status=CallTask.Status.PENDING, assigned_to=None, lease_expires_at=None, call_attempts=0,
+    )
+    # Forked agents must not share the parent's connection
+    connection.close()
+    remaining = multiprocessing.Value('i', tasks)
+    claimed, empty = multiprocessing.Value('i', 0), multiprocessing.Value('i', 0)
+    latencies = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=agent_loop, args=(agent, claim, remaining, claimed, empty, latencies))
+        for agent in agents
+    ]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    samples = sorted(sample for _ in workers for sample in latencies.get())
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - began
+    twice = CallTask.objects.filter(client_address='bench-queue', call_attempts__gt=1).count()
+    print(f"{label:<12} {claimed.value:,} claims in {elapsed:.2f} s ({claimed.value / elapsed:,.0f}/s), "
+          f"{empty.value:,} empty claims, {twice} tasks claimed twice")
+    print(f"{'':<12} claim latency median {samples[len(samples) // 2]:.1f} ms  "
+          f"p99 {samples[int(len(samples) * 0.99) - 1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=5000)
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method('fork')
+    random.seed(1)
+    agents = populate(args.agents, args.tasks)
+    try:
+        print(f"{args.agents} agents, {args.tasks:,} tasks")
+        run('SKIP LOCKED', CallQueue.claim, agents, args.tasks)
+        run('FOR UPDATE', plain_claim, agents, args.tasks)
+    finally:
+        CallTask.objects.filter(client_address='bench-queue').delete()
+        User.objects.filter(pk__in=[agent.pk for agent in agents]).delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Due Clients Benchmark
+Lists the clients that need an inspection the legacy way (every row into
+Python, sorted in memory) and with DueClientService (ordered and paginated
+by the database), and streams the full NDJSON export.
+
+Usage:
+    python benchmarks/due_clients.py --clients 200000
+
+Needs a PostgreSQL database. Everything is written inside one transaction
+that is rolled back at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from appointments.services import DueClientService
+from core.utils.export import stream_rows
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def populate(clients):
+    today = date.today()
+    users = []
+    for index in range(clients):
+        # Due dates spread over five years, a few clients with only an old inspection
+        stale = index % 50 == 0
+        users.append(User(
+            username=f'bench-client-{index}',
+            email=f'bench-client-{index}@example.com',
+            first_name='Bench',
+            last_name=str(index),
+            role=User.Role.USER,
+            password='!',
+            last_inspection_date=today - timedelta(days=random.randrange(1, 6 * 365)) if stale else None,
+            next_inspection_due=None if stale else today + timedelta(days=random.randrange(-200, 5 * 365)),
+        ))
+    User.objects.bulk_create(users, batch_size=5000)
+
+
+def legacy():
+    """The previous view body: two queries, rows built and sorted in Python"""
+    today = date.today()
+    clients = User.objects.filter(
+        role='USER', is_active=True, next_inspection_due__isnull=False,
+        next_inspection_due__lte=today + timedelta(days=180),
+    ).order_by('next_inspection_due')
+    stale = User.objects.filter(
+        role='USER', is_active=True, next_inspection_due__isnull=True,
+        last_inspection_date__lte=today - timedelta(days=4 * 365),
+    )
+    rows = []
+    for client in clients:
+        days = (client.next_inspection_due - today).days
+        rows.append({
+            'id': str(client.id), 'full_name': client.get_full_name(), 'days_until_due': days,
+            'priority': 'URGENT' if days < 0 else ('HIGH' if days <= 30 else ('MEDIUM' if days <= 90 else 'LOW')),
+        })
+    for client in stale:
+        rows.append({
+            'id': str(client.id), 'full_name': client.get_full_name(),
+            'days_until_due': -(today - client.last_inspection_date).days, 'priority': 'HIGH',
+        })
+    order = {'URGENT': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+    rows.sort(key=lambda row: (order[row['priority']], row['days_until_due']))
+    return rows[:50]
+
+
+def first_page():
+    return [DueClientService.row(client) for client in DueClientService.queryset()[:50]]
+
+
+def export():
+    rows = (DueClientService.row(client) for client in DueClientService.queryset().iterator(chunk_size=2000))
+    return sum(len(chunk) for chunk in stream_rows(rows, 'ndjson', 'bench').streaming_content)
+
+
+def measure(label, func):
+    tracemalloc.start()
+    began = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed * 1000:9.1f} ms   peak {peak / 2**20:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    try:
+        with transaction.atomic():
+            began = time.perf_counter()
+            populate(args.clients)
+            print(f"{args.clients:,} clients ({time.perf_counter() - began:.1f} s)")
+            due = DueClientService.queryset().count()
+            print(f"{due:,} due or overdue")
+
+            measure('Legacy (50 of all)', legacy)
+            measure('First page (50)', first_page)
+            measure('NDJSON export (all)', export)
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
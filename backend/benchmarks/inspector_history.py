@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Inspector History Benchmark
+Computes the punctuality statistics and history of a veteran inspector the
+legacy way (model properties per row, two passes in Python) and with
+PunctualityService (one aggregate query plus one keyset page), and ranks
+every inspector with the leaderboard query.
+
+Usage:
+    python benchmarks/inspector_history.py --inspectors 200 --jobs 5000
+
+Needs a PostgreSQL database. Everything is written inside one transaction
+that is rolled back at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from datetime import datetime, timedelta, time as clock
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from appointments.models import Appointment
+from appointments.services import PunctualityService
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def populate(inspectors, jobs):
+    users = User.objects.bulk_create([
+        User(
+            username=f'bench-inspector-{index}',
+            email=f'bench-inspector-{index}@example.com',
+            first_name='Bench',
+            last_name=str(index),
+            role=User.Role.INSPECTOR,
+            password='!',
+        )
+        for index in range(inspectors)
+    ])
+    today = timezone.localdate()
+    appointments = []
+    for user in users:
+        for index in range(jobs):
+            day = today - timedelta(days=index // 4 + 1)
+            scheduled = clock(8 + index % 4 * 2)
+            start = timezone.make_aware(datetime.combine(day, scheduled)) + timedelta(minutes=random.randint(-15, 40))
+            appointments.append(Appointment(
+                client_name='Bench',
+                client_phone='3000000000',
+                address='Calle 1',
+                scheduled_date=day,
+                scheduled_time=scheduled,
+                inspector=user,
+                status=Appointment.Status.COMPLETED,
+                actual_start_time=start,
+                actual_end_time=start + timedelta(minutes=random.randint(30, 120)),
+            ))
+        if len(appointments) >= 50000:
+            Appointment.objects.bulk_create(appointments, batch_size=5000)
+            appointments = []
+    Appointment.objects.bulk_create(appointments, batch_size=5000)
+    return users
+
+
+def legacy(inspector):
+    """The former view body, without the response"""
+    appointments = Appointment.objects.filter(
+        inspector=inspector, status='COMPLETED'
+    ).order_by('-scheduled_date', '-scheduled_time')
+    appointments.filter(actual_start_time__isnull=False).count()
+    appointments.count()
+    history, late, delay = [], 0, 0
+    for apt in appointments:
+        history.append((apt.punctuality_minutes, apt.punctuality_status, apt.duration_minutes))
+        if apt.punctuality_status == 'LATE':
+            late += 1
+            delay += apt.punctuality_minutes
+    durations = [apt.duration_minutes for apt in appointments if apt.duration_minutes]
+    return len(history), late, len(durations)
+
+
+def current(inspector):
+    PunctualityService.statistics(inspector.id)
+    page = PunctualityService.completed(inspector=inspector).order_by(
+        '-scheduled_date', '-scheduled_time', '-id'
+    )[:50]
+    return list(page)
+
+
+def timed(label, func, *args):
+    began = time.perf_counter()
+    func(*args)
+    print(f"{label:<28} {(time.perf_counter() - began) * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--inspectors', type=int, default=200)
+    parser.add_argument('--jobs', type=int, default=5000, help='Completed appointments per inspector')
+    args = parser.parse_args()
+
+    random.seed(1)
+    try:
+        with transaction.atomic():
+            began = time.perf_counter()
+            users = populate(args.inspectors, args.jobs)
+            print(f"{args.inspectors} inspectors x {args.jobs:,} completed appointments "
+                  f"({time.perf_counter() - began:.1f} s)")
+
+            timed('Legacy history + statistics', legacy, users[0])
+            timed('Statistics + first page', current, users[0])
+            timed('Leaderboard (all inspectors)', PunctualityService.leaderboard)
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Middleware Stack Benchmark
+Per-request overhead of the project's own middlewares (the
+``core.middleware.*`` entries of settings.MIDDLEWARE) around a trivial view.
+
+Usage:
+    python benchmarks/middleware_stack.py --requests 20000 [--with-logging]
+    python benchmarks/middleware_stack.py --before <git-ref> [--with-logging]
+
+The chain is loaded like Django's BaseHandler.load_middleware: middlewares
+raising MiddlewareNotUsed are skipped and process_view hooks run before
+the view. ``--before`` also loads the ``core.middleware.*`` list and
+modules of another commit (e.g. the one preceding a middleware change) and
+prints both stacks side by side. Logging is disabled by default so handler
+I/O does not dominate the numbers.
+"""
+import argparse
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+import types
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from django.utils.module_loading import import_string
+
+PATH = '/api/appointments/'
+
+
+def build_stack(paths, view):
+    """
+    Wrap ``view`` in ``paths`` (outermost first) the way
+    BaseHandler.load_middleware does; returns the chain and the paths loaded
+    """
+    view_hooks = []
+    loaded = []
+    match = resolve(PATH)
+
+    def handler(request):
+        request.resolver_match = match
+        for hook in view_hooks:
+            response = hook(request, view, (), {})
+            if response is not None:
+                return response
+        return view(request)
+
+    for path in reversed(paths):
+        try:
+            middleware = import_string(path)(handler)
+        except MiddlewareNotUsed:
+            continue
+        if hasattr(middleware, 'process_view'):
+            view_hooks.insert(0, middleware.process_view)
+        handler = middleware
+        loaded.insert(0, path)
+    return handler, loaded
+
+
+def git_show(ref, path):
+    prefix = subprocess.run(
+        ['git', 'rev-parse', '--show-prefix'], cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    return subprocess.run(
+        ['git', 'show', f'{ref}:{prefix}{path}'], cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True,
+    ).stdout
+
+
+def load_before(ref):
+    """
+    ``core.middleware.*`` paths of MIDDLEWARE at ``ref``, with their modules
+    loaded from that commit under a ``before.`` prefix
+    """
+    block = re.search(r'^MIDDLEWARE = \[(.*?)\]', git_show(ref, 'core/settings.py'), re.S | re.M)
+    paths = re.findall(r"['\"](core\.middleware\.[\w.]+)['\"]", block.group(1))
+    for module_path in {path.rsplit('.', 1)[0] for path in paths}:
+        name = f'before.{module_path}'
+        module = types.ModuleType(name)
+        module.__file__ = f'{ref}:{module_path.replace(".", "/")}.py'
+        exec(compile(git_show(ref, f'{module_path.replace(".", "/")}.py'), module.__file__, 'exec'), module.__dict__)
+        sys.modules[name] = module
+    return [f'before.{path}' for path in paths]
+
+
+def measure(stack, total):
+    factory = RequestFactory()
+
+    def request(i):
+        # One address per request so the rate limiter takes its allow path
+        return factory.get(PATH, REMOTE_ADDR=f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}')
+
+    for i in range(1000):
+        stack(request(total + i))
+    requests = [request(i) for i in range(total)]
+    start = time.perf_counter()
+    for req in requests:
+        stack(req)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--with-logging', action='store_true')
+    parser.add_argument('--before', metavar='REF', help='also run the middleware list of this git commit')
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logging.disable(logging.CRITICAL)
+
+    def view(request):
+        return HttpResponse('ok')
+
+    stacks = {'current': [path for path in settings.MIDDLEWARE if path.startswith('core.middleware.')]}
+    if args.before:
+        stacks = {f'before ({args.before})': load_before(args.before), **stacks}
+
+    baseline_stack, _ = build_stack([], view)
+    baseline = measure(baseline_stack, args.requests)
+
+    rate_limits = {**settings.RATE_LIMITS, 'DEFAULT': f'{args.requests * 10}/minute'}
+    with override_settings(RATE_LIMITS=rate_limits):
+        for name, paths in stacks.items():
+            stack, loaded = build_stack(paths, view)
+            total = measure(stack, args.requests)
+            overhead_us = (total - baseline) / args.requests * 1e6
+            print(f"{name}:")
+            for path in paths:
+                print(f"  {path}{'' if path in loaded else '  (MiddlewareNotUsed)'}")
+            print(f"  Overhead per request: {overhead_us:.1f} us ({args.requests:,} requests)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Rate Limit Benchmark
+Per-request overhead of RateLimitMiddleware (identification, policy lookup
+and one counter round trip), for anonymous and bearer-token requests.
+
+Usage:
+    python benchmarks/rate_limit.py --requests 20000
+
+Runs against the configured default cache: the Redis script with
+django-redis, the in-process counters otherwise.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+
+django.setup()
+
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from core.middleware.performance import RateLimitMiddleware
+
+BUDGET_MS = 0.5
+
+
+def measure(middleware, request, total):
+    samples = []
+    for _ in range(total):
+        start = time.perf_counter()
+        middleware.process_view(request, None, (), {})
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean': sum(samples) / total,
+        'p50': samples[total // 2],
+        'p99': samples[int(total * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    factory = RequestFactory()
+    token = AccessToken()
+    token['user_id'] = 'b6a1f0c2-0000-0000-0000-000000000001'
+    token['role'] = 'INSPECTOR'
+    requests = {
+        'anonymous': factory.get('/api/appointments/', REMOTE_ADDR='10.0.0.1'),
+        'bearer token': factory.get('/api/appointments/', HTTP_AUTHORIZATION=f'Bearer {token}'),
+    }
+
+    # A limit high enough that every request goes through the full path
+    with override_settings(RATE_LIMITS={'DEFAULT': f'{args.requests * 10}/minute'}):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        backend = 'redis' if middleware.limiter._script is not None else 'in-process'
+        print(f"Counters: {backend}, {args.requests:,} requests each")
+        for name, request in requests.items():
+            stats = measure(middleware, request, args.requests)
+            verdict = 'OK' if stats['p50'] < BUDGET_MS else 'OVER BUDGET'
+            print(
+                f"{name:>13}: mean {stats['mean']:.4f} ms  p50 {stats['p50']:.4f} ms  "
+                f"p99 {stats['p99']:.4f} ms  [{verdict}]"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+# Same as get_asgi_application(), with read-only requests in autocommit
+# mode (see core.utils.transactions)
+django.setup(set_prefix=False)
+
+from core.utils.transactions import TransactionPolicyASGIHandler  # noqa: E402
+
+application = TransactionPolicyASGIHandler()
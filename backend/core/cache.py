@@ -4,10 +4,18 @@ Redis-based caching with automatic invalidation
 """
 from django.core.cache import cache
 from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag, urlencode
 from functools import wraps
+from core.local_cache import get_two_tier_cache
 import hashlib
 import json
 import logging
+import math
+import random
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +37,25 @@ class CacheManager:
     PREFIX_REPORT = 'report'
     PREFIX_DASHBOARD = 'dashboard'
     PREFIX_STATS = 'stats'
+    PREFIX_METRICS = 'cache_metrics'
+    PREFIX_GENERATION = 'generation'
+    PREFIX_LOCK = 'lock'
+    PREFIX_VIEW = 'view'
+    PREFIX_CALENDAR = 'calendar'
+    PREFIX_CAMPAIGN = 'campaign'
+    
+    # Stampede protection defaults
+    LOCK_TIMEOUT = 30  # max seconds one recomputation may hold the lock
+    LOCK_WAIT = 5  # max seconds a caller without stale value waits for it
+    LOCK_POLL_INTERVAL = 0.05
+    EARLY_EXPIRATION_BETA = 1.0
+    
+    # Dashboard variants (admin dashboards are global, the rest per user)
+    DASHBOARD_ENDPOINTS = ('stats', 'chart_data')
+    DASHBOARD_ADMIN = 'ADMIN'
+    DASHBOARD_INSPECTOR = 'INSPECTOR'
+    DASHBOARD_USER = 'USER'
+    DASHBOARD_GLOBAL_SCOPE = 'global'
     
     @classmethod
     def _generate_key(cls, prefix, *args, **kwargs):
@@ -40,11 +67,20 @@ class CacheManager:
     
     @classmethod
     def get(cls, key, default=None):
-        """Get value from cache"""
+        """Get value from cache, trying the worker's L1 first for opted-in prefixes"""
+        l1 = get_two_tier_cache()
+        local = l1.handles(key)
+        if local:
+            value = l1.get(key)
+            if value is not None:
+                logger.debug(f"Cache L1 HIT: {key}")
+                return value
         try:
             value = cache.get(key, default)
             if value is not None:
                 logger.debug(f"Cache HIT: {key}")
+                if local and value is not default:
+                    l1.fill(key, value)
             else:
                 logger.debug(f"Cache MISS: {key}")
             return value
@@ -57,6 +93,7 @@ class CacheManager:
         """Set value in cache"""
         try:
             cache.set(key, value, timeout)
+            get_two_tier_cache().invalidate(keys=[key])
             logger.debug(f"Cache SET: {key} (timeout: {timeout}s)")
             return True
         except Exception as e:
@@ -68,17 +105,67 @@ class CacheManager:
         """Delete value from cache"""
         try:
             cache.delete(key)
+            get_two_tier_cache().invalidate(keys=[key])
             logger.debug(f"Cache DELETE: {key}")
             return True
         except Exception as e:
             logger.error(f"Cache DELETE error: {e}")
             return False
     
+    @classmethod
+    def delete_many(cls, keys):
+        """Delete several keys in one round trip"""
+        keys = list(keys)
+        if not keys:
+            return True
+        try:
+            cache.delete_many(keys)
+            get_two_tier_cache().invalidate(keys=keys)
+            logger.debug(f"Cache DELETE MANY: {len(keys)} keys")
+            return True
+        except Exception as e:
+            logger.error(f"Cache DELETE MANY error: {e}")
+            return False
+    
+    @classmethod
+    def get_many(cls, keys):
+        """Get several keys in one round trip; missing keys are left out"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            return cache.get_many(keys)
+        except Exception as e:
+            logger.error(f"Cache GET MANY error: {e}")
+            return {}
+    
+    @classmethod
+    def set_many(cls, data, timeout=TIMEOUT_MEDIUM):
+        """Set several keys in one round trip"""
+        if not data:
+            return True
+        try:
+            cache.set_many(data, timeout)
+            get_two_tier_cache().invalidate(keys=list(data))
+            logger.debug(f"Cache SET MANY: {len(data)} keys (timeout: {timeout}s)")
+            return True
+        except Exception as e:
+            logger.error(f"Cache SET MANY error: {e}")
+            return False
+    
     @classmethod
     def delete_pattern(cls, pattern):
-        """Delete all keys matching pattern"""
+        """
+        Delete all keys matching pattern.
+        Scans the whole keyspace (Redis only); invalidation paths use
+        ``bump_generation`` instead.
+        """
+        if not hasattr(cache, 'delete_pattern'):
+            logger.warning(f"Cache DELETE PATTERN not supported by this backend: {pattern}")
+            return False
         try:
             cache.delete_pattern(pattern)
+            get_two_tier_cache().invalidate(patterns=[pattern])
             logger.info(f"Cache DELETE PATTERN: {pattern}")
             return True
         except Exception as e:
@@ -90,70 +177,362 @@ class CacheManager:
         """Clear entire cache"""
         try:
             cache.clear()
+            get_two_tier_cache().clear()
             logger.warning("Cache CLEARED")
             return True
         except Exception as e:
             logger.error(f"Cache CLEAR error: {e}")
             return False
     
+    # Stampede protection
+    #
+    # Values are stored in an envelope with their logical expiry and the time
+    # they took to compute, and kept in the cache for ``stale_ttl`` seconds
+    # past that expiry. Only the caller holding the key's lock recomputes;
+    # the others get the stale value (or wait for the fresh one). Callers
+    # may also recompute shortly BEFORE expiry, with a probability that grows
+    # as expiry approaches and with the cost of the computation
+    # ("XFetch", probabilistic early expiration), so a hot key is usually
+    # refreshed before anyone sees it expire.
+    
+    @classmethod
+    def _lock_key(cls, key):
+        return f"{cls.PREFIX_LOCK}:{key}"
+    
+    @classmethod
+    def acquire_lock(cls, key, timeout=LOCK_TIMEOUT):
+        """Try to take the single-flight lock of ``key``; returns a token or None"""
+        token = uuid.uuid4().hex
+        try:
+            return token if cache.add(cls._lock_key(key), token, timeout) else None
+        except Exception as e:
+            logger.error(f"Cache LOCK error: {e}")
+            # Without a lock backend every caller computes, as before
+            return token
+    
+    @classmethod
+    def release_lock(cls, key, token):
+        lock_key = cls._lock_key(key)
+        try:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+        except Exception as e:
+            logger.error(f"Cache UNLOCK error: {e}")
+    
+    @staticmethod
+    def _is_fresh(entry, beta):
+        """Whether a cached envelope can be served without recomputing"""
+        now = time.time()
+        if beta and entry['delta'] > 0:
+            # -log(U) is exponentially distributed: mostly small, occasionally large
+            now -= entry['delta'] * beta * math.log(1.0 - random.random())
+        return now < entry['expires']
+    
+    @classmethod
+    def get_or_compute(cls, key, compute, timeout=TIMEOUT_MEDIUM, stale_ttl=None,
+                       beta=EARLY_EXPIRATION_BETA, serve_stale_on_error=True,
+                       lock_timeout=LOCK_TIMEOUT, wait=LOCK_WAIT, cacheable=None):
+        """
+        Return the cached value of ``key``, computing it with ``compute()``
+        at most once at a time across workers.
+        
+        Args:
+            key: Cache key
+            compute: Callable producing the value
+            timeout: Seconds the value is fresh
+            stale_ttl: Seconds a stale value is still kept (and served while
+                another caller recomputes or when recomputing fails);
+                defaults to ``timeout``
+            beta: Early expiration aggressiveness (0 disables it)
+            serve_stale_on_error: Return the stale value if ``compute`` raises
+            lock_timeout: Seconds before an abandoned lock is released
+            wait: Seconds a caller with nothing to serve waits for the lock holder
+            cacheable: Optional predicate deciding whether a result is stored
+        """
+        stale_ttl = timeout if stale_ttl is None else stale_ttl
+        entry = cls.get(key)
+        if not isinstance(entry, dict) or 'expires' not in entry:
+            entry = None
+        if entry is not None and cls._is_fresh(entry, beta):
+            return entry['value']
+        
+        token = cls.acquire_lock(key, lock_timeout)
+        if token is None:
+            if entry is not None:
+                logger.debug(f"Cache STALE: {key} (recomputing elsewhere)")
+                return entry['value']
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(cls.LOCK_POLL_INTERVAL)
+                entry = cls.get(key)
+                if isinstance(entry, dict) and 'expires' in entry:
+                    return entry['value']
+            logger.warning(f"Cache LOCK wait timed out: {key}")
+        else:
+            # Another caller may have refreshed the key between our read and the lock
+            latest = cls.get(key)
+            refreshed = (
+                isinstance(latest, dict) and 'expires' in latest
+                and latest['expires'] != (entry or {}).get('expires')
+            )
+            if refreshed and time.time() < latest['expires']:
+                cls.release_lock(key, token)
+                return latest['value']
+        
+        try:
+            start = time.monotonic()
+            try:
+                value = compute()
+            except Exception:
+                if entry is not None and serve_stale_on_error:
+                    logger.warning(f"Cache STALE ON ERROR: {key}", exc_info=True)
+                    return entry['value']
+                raise
+            delta = time.monotonic() - start
+            
+            if cacheable is None or cacheable(value):
+                cls.set(key, {
+                    'value': value,
+                    'delta': delta,
+                    'expires': time.time() + timeout,
+                }, timeout + stale_ttl)
+            return value
+        finally:
+            if token is not None:
+                cls.release_lock(key, token)
+    
+    # Generation counters
+    #
+    # Keys of an invalidatable namespace embed the namespace's current
+    # generation. Invalidating the namespace is a single INCR: entries
+    # written under older generations are never read again and simply
+    # expire with their own timeout. O(1) on every backend, LocMem included.
+    
+    @classmethod
+    def _generation_key(cls, namespace):
+        return f"{cls.PREFIX_GENERATION}:{namespace}"
+    
+    @staticmethod
+    def _generation_seed():
+        """
+        Starting generation for a namespace without a counter.
+        Time based, so a counter lost to eviction or a restart never
+        restarts at a generation that still has entries cached.
+        """
+        return time.time_ns()
+    
+    @classmethod
+    def generation(cls, namespace):
+        """Current generation of ``namespace`` (counters never expire)"""
+        key = cls._generation_key(namespace)
+        value = cls.get(key)
+        if value is not None:
+            return value
+        try:
+            cache.add(key, cls._generation_seed(), None)
+            return cache.get(key) or 0
+        except Exception as e:
+            logger.error(f"Cache GENERATION error: {e}")
+            return 0
+    
+    @classmethod
+    def versioned_key(cls, namespace, *parts):
+        """Cache key under the current generation of ``namespace``"""
+        return ':'.join([namespace, f"v{cls.generation(namespace)}", *map(str, parts)])
+    
+    @classmethod
+    def bump_generation(cls, namespace):
+        """Invalidate every key of ``namespace`` with one INCR"""
+        key = cls._generation_key(namespace)
+        try:
+            try:
+                value = cache.incr(key)
+            except ValueError:
+                # No counter yet: nothing was cached under a newer seed
+                if cache.add(key, cls._generation_seed(), None):
+                    value = cache.get(key)
+                else:
+                    value = cache.incr(key)
+            get_two_tier_cache().invalidate(keys=[key])
+            logger.debug(f"Cache GENERATION: {namespace} -> {value}")
+            return True
+        except Exception as e:
+            logger.error(f"Cache GENERATION error: {e}")
+            return False
+    
     # Specific cache methods
     
+    @classmethod
+    def view_namespace(cls, name):
+        return f"{cls.PREFIX_VIEW}:{name}"
+    
+    @classmethod
+    def invalidate_view_cache(cls, name):
+        """Invalidate every cached response of a ``cache_view`` view"""
+        return cls.bump_generation(cls.view_namespace(name))
+    
+    @classmethod
+    def _user_namespace(cls, user_id):
+        return f"{cls.PREFIX_USER}:{user_id}"
+    
     @classmethod
     def cache_user_data(cls, user_id, data, timeout=TIMEOUT_MEDIUM):
         """Cache user data"""
-        key = f"{cls.PREFIX_USER}:{user_id}"
+        key = cls.versioned_key(cls._user_namespace(user_id))
         return cls.set(key, data, timeout)
     
     @classmethod
     def get_user_data(cls, user_id):
         """Get cached user data"""
-        key = f"{cls.PREFIX_USER}:{user_id}"
+        key = cls.versioned_key(cls._user_namespace(user_id))
         return cls.get(key)
     
     @classmethod
     def invalidate_user_cache(cls, user_id):
         """Invalidate all user-related cache"""
-        pattern = f"{cls.PREFIX_USER}:{user_id}*"
-        return cls.delete_pattern(pattern)
+        return cls.bump_generation(cls._user_namespace(user_id))
+    
+    @classmethod
+    def _inspection_namespace(cls, inspection_id):
+        return f"{cls.PREFIX_INSPECTION}:{inspection_id}"
     
     @classmethod
     def cache_inspection(cls, inspection_id, data, timeout=TIMEOUT_MEDIUM):
         """Cache inspection data"""
-        key = f"{cls.PREFIX_INSPECTION}:{inspection_id}"
+        key = cls.versioned_key(cls._inspection_namespace(inspection_id))
         return cls.set(key, data, timeout)
     
     @classmethod
     def get_inspection(cls, inspection_id):
         """Get cached inspection"""
-        key = f"{cls.PREFIX_INSPECTION}:{inspection_id}"
+        key = cls.versioned_key(cls._inspection_namespace(inspection_id))
         return cls.get(key)
     
     @classmethod
     def invalidate_inspection_cache(cls, inspection_id):
         """Invalidate inspection cache"""
-        pattern = f"{cls.PREFIX_INSPECTION}:{inspection_id}*"
-        return cls.delete_pattern(pattern)
+        return cls.bump_generation(cls._inspection_namespace(inspection_id))
     
     @classmethod
-    def cache_dashboard_stats(cls, user_id, role, data, timeout=TIMEOUT_SHORT):
+    def _dashboard_key(cls, user_id, role, endpoint, generation=None):
+        """Dashboard cache key for one endpoint and scope"""
+        if generation is None:
+            generation = cls.generation(cls.PREFIX_DASHBOARD)
+        return f"{cls.PREFIX_DASHBOARD}:v{generation}:{endpoint}:{role}:{user_id}"
+    
+    @classmethod
+    def cache_dashboard_stats(cls, user_id, role, data, timeout=TIMEOUT_SHORT, endpoint='stats'):
         """Cache dashboard statistics"""
-        key = f"{cls.PREFIX_DASHBOARD}:{role}:{user_id}"
+        key = cls._dashboard_key(user_id, role, endpoint)
         return cls.set(key, data, timeout)
     
     @classmethod
-    def get_dashboard_stats(cls, user_id, role):
-        """Get cached dashboard stats"""
-        key = f"{cls.PREFIX_DASHBOARD}:{role}:{user_id}"
-        return cls.get(key)
+    def get_dashboard_stats(cls, user_id, role, endpoint='stats'):
+        """Get cached dashboard stats, recording a hit or miss for the endpoint"""
+        key = cls._dashboard_key(user_id, role, endpoint)
+        value = cls.get(key)
+        cls.record_access(f"{cls.PREFIX_DASHBOARD}:{endpoint}", hit=value is not None)
+        return value
     
     @classmethod
     def invalidate_dashboard_cache(cls, user_id=None):
-        """Invalidate dashboard cache"""
+        """Invalidate one user's dashboards, or every dashboard"""
         if user_id:
-            pattern = f"{cls.PREFIX_DASHBOARD}:*:{user_id}*"
-        else:
-            pattern = f"{cls.PREFIX_DASHBOARD}:*"
-        return cls.delete_pattern(pattern)
+            return cls.invalidate_dashboards([str(user_id)], include_admin=False)
+        return cls.bump_generation(cls.PREFIX_DASHBOARD)
+    
+    @classmethod
+    def invalidate_dashboards(cls, user_ids=(), include_admin=True):
+        """
+        Invalidate only the dashboards affected by a write: the per-user
+        inspector/user dashboards of ``user_ids`` plus the global admin one.
+        Exact keys under the current generation, no keyspace scan.
+        """
+        user_ids = set(filter(None, user_ids))
+        if not user_ids and not include_admin:
+            return True
+        
+        generation = cls.generation(cls.PREFIX_DASHBOARD)
+        keys = []
+        for endpoint in cls.DASHBOARD_ENDPOINTS:
+            for user_id in user_ids:
+                keys.append(cls._dashboard_key(user_id, cls.DASHBOARD_INSPECTOR, endpoint, generation))
+                keys.append(cls._dashboard_key(user_id, cls.DASHBOARD_USER, endpoint, generation))
+            if include_admin:
+                keys.append(cls._dashboard_key(cls.DASHBOARD_GLOBAL_SCOPE, cls.DASHBOARD_ADMIN, endpoint, generation))
+        return cls.delete_many(keys)
+    
+    # Hit-ratio metrics
+    
+    @classmethod
+    def record_access(cls, name, hit):
+        """Count a cache hit or miss for ``name`` (shared across workers)"""
+        key = f"{cls.PREFIX_METRICS}:{name}:{'hit' if hit else 'miss'}"
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # First access: counters never expire
+                if not cache.add(key, 1, None):
+                    cache.incr(key)
+        except Exception as e:
+            logger.error(f"Cache METRICS error: {e}")
+    
+    @classmethod
+    def hit_ratio(cls, name):
+        """Hits, misses and hit ratio recorded for ``name``"""
+        hit_key = f"{cls.PREFIX_METRICS}:{name}:hit"
+        miss_key = f"{cls.PREFIX_METRICS}:{name}:miss"
+        try:
+            values = cache.get_many([hit_key, miss_key])
+        except Exception as e:
+            logger.error(f"Cache METRICS error: {e}")
+            values = {}
+        hits = values.get(hit_key, 0)
+        misses = values.get(miss_key, 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+    
+    @classmethod
+    def _calendar_key(cls, inspector_id, year, month):
+        return f"{cls.PREFIX_CALENDAR}:{inspector_id}:{year:04d}-{month:02d}"
+    
+    @classmethod
+    def get_calendars(cls, inspector_ids, year, month):
+        """Cached month buckets of several inspectors, by inspector id"""
+        keys = {cls._calendar_key(inspector_id, year, month): inspector_id for inspector_id in inspector_ids}
+        found = cls.get_many(keys)
+        return {keys[key]: value for key, value in found.items()}
+    
+    @classmethod
+    def cache_calendars(cls, calendars, year, month, timeout=TIMEOUT_LONG):
+        """Cache month buckets of several inspectors (``{inspector_id: buckets}``)"""
+        return cls.set_many({
+            cls._calendar_key(inspector_id, year, month): buckets
+            for inspector_id, buckets in calendars.items()
+        }, timeout)
+    
+    @classmethod
+    def invalidate_calendars(cls, inspector_days):
+        """Drop the cached months containing ``(inspector_id, date)`` pairs"""
+        return cls.delete_many({
+            cls._calendar_key(inspector_id, day.year, day.month)
+            for inspector_id, day in inspector_days if inspector_id and day
+        })
+    
+    @classmethod
+    def cache_campaign(cls, job_id, state, timeout=TIMEOUT_EXTRA_LONG):
+        """Store the state of a queued call campaign"""
+        return cls.set(f"{cls.PREFIX_CAMPAIGN}:{job_id}", state, timeout)
+    
+    @classmethod
+    def get_campaign(cls, job_id):
+        """State of a queued call campaign, or None when unknown"""
+        return cls.get(f"{cls.PREFIX_CAMPAIGN}:{job_id}")
     
     @classmethod
     def cache_report(cls, report_id, pdf_bytes, timeout=TIMEOUT_EXTRA_LONG):
@@ -174,43 +553,168 @@ class CacheManager:
         return cls.delete(key)
 
 
-def cache_view(timeout=CacheManager.TIMEOUT_MEDIUM, key_prefix=None):
+def user_scope(request):
+    """Response cache scope: one entry per user"""
+    user = request.user
+    if not user.is_authenticated:
+        return 'anon'
+    return f"{user.role}:{user.id}"
+
+
+def role_scope(*shared_roles):
     """
-    Decorator to cache view results
+    Response cache scope sharing one entry among every user of
+    ``shared_roles`` (views whose data does not depend on who they are),
+    and one entry per user otherwise
+    """
+    def scope(request):
+        role = getattr(request.user, 'role', None)
+        if role in shared_roles:
+            return role
+        return user_scope(request)
+    return scope
+
+
+def _normalized_query(request):
+    """Query string with parameters sorted, so ``?a=1&b=2`` and ``?b=2&a=1`` share a key"""
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+    )
+    return urlencode(params)
+
+
+# Not replayed from a cached entry: set again per response, or private to
+# the caller who filled the cache
+UNCACHED_HEADERS = frozenset({
+    'cache-control', 'content-length', 'date', 'etag', 'expires', 'last-modified', 'set-cookie',
+})
+
+
+def _render(request, response):
+    """Render a DRF Response inside the view, before DRF finalizes it"""
+    if getattr(response, 'is_rendered', True):
+        return response
+    parser_context = getattr(request, 'parser_context', None) or {}
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_media_type
+    response.renderer_context = {
+        'view': parser_context.get('view'),
+        'args': parser_context.get('args', ()),
+        'kwargs': parser_context.get('kwargs', {}),
+        'request': request,
+    }
+    return response.render()
+
+
+def cache_view(timeout=CacheManager.TIMEOUT_SHORT, key_prefix=None, scope=user_scope,
+               stale_ttl=None, beta=CacheManager.EARLY_EXPIRATION_BETA, serve_stale_on_error=True):
+    """
+    Decorator caching rendered GET responses
+    
+    Stores the rendered body and its headers (JSON-serializable, so it works
+    with the Redis JSONSerializer) and replays them on a hit, except the
+    validators and cookies (``UNCACHED_HEADERS``). The key includes the view's
+    generation, the caller's scope, the path, the normalized query string and
+    the Accept header. Responses carry ``ETag`` and ``Last-Modified`` and
+    conditional requests get a 304. ``CacheManager.invalidate_view_cache(key_prefix)``
+    drops every entry of the view. Recomputation is single-flight
+    (see ``CacheManager.get_or_compute``).
     
     Usage:
-        @cache_view(timeout=300, key_prefix='my_view')
+        @api_view(['GET'])
+        @cache_view(timeout=300, key_prefix='appointments', scope=role_scope('ADMIN'))
         def my_view(request):
             ...
+        
+        @method_decorator(cache_view(key_prefix='inspections'))
+        def list(self, request, *args, **kwargs):
+            ...
     """
     def decorator(func):
+        namespace = CacheManager.view_namespace(key_prefix or func.__name__)
+        
         @wraps(func)
         def wrapper(request, *args, **kwargs):
-            # Generate cache key
-            user_id = str(request.user.id) if request.user.is_authenticated else 'anon'
-            cache_key = f"{key_prefix or func.__name__}:{user_id}:{request.method}:{request.path}"
+            if request.method not in ('GET', 'HEAD'):
+                return func(request, *args, **kwargs)
             
-            # Try to get from cache
-            cached_response = CacheManager.get(cache_key)
-            if cached_response is not None:
-                return cached_response
+            cache_key = CacheManager.versioned_key(
+                namespace,
+                scope(request),
+                hashlib.md5(':'.join([
+                    request.path,
+                    _normalized_query(request),
+                    request.META.get('HTTP_ACCEPT', ''),
+                ]).encode()).hexdigest(),
+            )
+            uncached = []
             
-            # Execute function
-            response = func(request, *args, **kwargs)
+            def compute():
+                response = _render(request, func(request, *args, **kwargs))
+                if response.status_code != 200 or response.streaming:
+                    uncached.append(response)
+                    return None
+                charset = response.charset or 'utf-8'
+                try:
+                    content = response.content.decode(charset)
+                except UnicodeDecodeError:
+                    uncached.append(response)
+                    return None
+                return {
+                    'content': content,
+                    'charset': charset,
+                    'content_type': response['Content-Type'],
+                    'headers': [
+                        [name, value] for name, value in response.items()
+                        if name.lower() not in UNCACHED_HEADERS
+                    ],
+                    'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+                    'last_modified': int(time.time()),
+                }
             
-            # Cache response
-            if response.status_code == 200:
-                CacheManager.set(cache_key, response, timeout)
+            entry = CacheManager.get_or_compute(
+                cache_key,
+                compute,
+                timeout=timeout,
+                stale_ttl=stale_ttl,
+                beta=beta,
+                serve_stale_on_error=serve_stale_on_error,
+                cacheable=lambda value: value is not None,
+            )
+            if entry is None:
+                return uncached[0]
             
-            return response
+            response = HttpResponse(
+                entry['content'].encode(entry['charset']),
+                content_type=entry['content_type'],
+            )
+            for name, value in entry.get('headers', ()):
+                response[name] = value
+            response['ETag'] = entry['etag']
+            response['Last-Modified'] = http_date(entry['last_modified'])
+            patch_cache_control(response, private=True, no_cache=True)
+            return get_conditional_response(
+                request,
+                etag=entry['etag'],
+                last_modified=entry['last_modified'],
+                response=response,
+            )
         return wrapper
     return decorator
 
 
-def cache_method(timeout=CacheManager.TIMEOUT_MEDIUM, key_prefix=None):
+def cache_method(timeout=CacheManager.TIMEOUT_MEDIUM, key_prefix=None, stale_ttl=None,
+                 beta=CacheManager.EARLY_EXPIRATION_BETA, serve_stale_on_error=True):
     """
     Decorator to cache method results
     
+    Only one caller recomputes an expired value while the others get the
+    stale one; values may be refreshed slightly before they expire, and a
+    failing recomputation serves the stale value instead of raising
+    (see ``CacheManager.get_or_compute``).
+    
     Usage:
         @cache_method(timeout=300)
         def expensive_calculation(self, param1, param2):
@@ -226,17 +730,13 @@ def cache_method(timeout=CacheManager.TIMEOUT_MEDIUM, key_prefix=None):
                 **kwargs
             )
             
-            # Try to get from cache
-            cached_result = CacheManager.get(key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute function
-            result = func(self, *args, **kwargs)
-            
-            # Cache result
-            CacheManager.set(key, result, timeout)
-            
-            return result
+            return CacheManager.get_or_compute(
+                key,
+                lambda: func(self, *args, **kwargs),
+                timeout=timeout,
+                stale_ttl=stale_ttl,
+                beta=beta,
+                serve_stale_on_error=serve_stale_on_error,
+            )
         return wrapper
     return decorator
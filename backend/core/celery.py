@@ -0,0 +1,18 @@
+"""
+Celery Application
+Background workers for slow jobs (PDF reports). Configuration comes from
+the CELERY_* settings and tasks from each app's tasks.py:
+
+    celery -A core worker -l info
+
+With CELERY_TASK_ALWAYS_EAGER tasks run in the calling process instead, so
+development and tests need no broker.
+"""
+from celery import Celery
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+app = Celery('core')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -0,0 +1,228 @@
+"""
+In-Process L1 Cache
+Per-worker LRU in front of Redis for hot, rarely changing keys, kept
+coherent across workers through an invalidation channel
+"""
+from django.conf import settings
+from django.test.signals import setting_changed
+from fnmatch import fnmatchcase
+from collections import OrderedDict
+import copy
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRUCache:
+    """
+    Thread-safe LRU bounded by number of entries and per-entry TTL
+    """
+
+    def __init__(self, max_entries=1000, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a copy of the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        # Callers may mutate what they get back, as they would a fresh Redis read
+        return copy.deepcopy(value)
+
+    def set(self, key, value, timeout=None):
+        """Store ``value`` for at most ``timeout`` seconds (capped at the L1 TTL)"""
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if timeout <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_pattern(self, pattern):
+        """Drop every key matching a glob ``pattern`` (same syntax as Redis)"""
+        with self._lock:
+            for key in [key for key in self._data if fnmatchcase(key, pattern)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalInvalidationChannel:
+    """
+    In-process stand-in for the Redis channel: delivers messages to the
+    subscribers of this process synchronously (tests, single-process dev)
+    """
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def publish(self, message):
+        for callback in list(self._subscribers):
+            callback(message)
+
+
+class RedisInvalidationChannel:
+    """
+    Redis pub/sub channel shared by every worker. Subscribing starts a
+    daemon listener thread in the worker.
+    """
+
+    CHANNEL = 'cache:l1:invalidate'
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._subscribers = []
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        with self._lock:
+            if self._thread is not None:
+                return
+            try:
+                pubsub = self._connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.CHANNEL: self._dispatch})
+                self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except Exception as e:
+                logger.error(f"Cache L1 channel subscribe error: {e}")
+
+    def _dispatch(self, raw):
+        try:
+            message = json.loads(raw['data'])
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Cache L1 channel ignored message: {e}")
+            return
+        for callback in list(self._subscribers):
+            callback(message)
+
+    def publish(self, message):
+        try:
+            self._connection().publish(self.CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.error(f"Cache L1 channel publish error: {e}")
+
+
+class TwoTierCache:
+    """
+    L1 policy for CacheManager: which keys live in the per-worker LRU and
+    how their invalidations reach the other workers.
+
+    Only keys starting with one of ``CACHE_L1_PREFIXES`` are kept in L1, so
+    stale-sensitive data stays Redis-only. L1 is filled from Redis reads
+    (never from writes) so values have the same types on both paths.
+    """
+
+    CHANNELS = {
+        'local': LocalInvalidationChannel,
+        'redis': RedisInvalidationChannel,
+    }
+
+    def __init__(self, prefixes=(), max_entries=1000, timeout=30, channel='local'):
+        # ``channel`` is a name from CHANNELS or a channel instance
+        self.prefixes = tuple(prefix for prefix in prefixes if prefix)
+        self.local = LocalLRUCache(max_entries=max_entries, timeout=timeout)
+        self.origin = uuid.uuid4().hex
+        if isinstance(channel, str):
+            channel = self.CHANNELS[channel]() if self.prefixes else None
+        self.channel = channel
+        if self.channel is not None:
+            self.channel.subscribe(self._on_message)
+
+    @property
+    def enabled(self):
+        return bool(self.prefixes)
+
+    def handles(self, key):
+        return key.startswith(self.prefixes) if self.prefixes else False
+
+    def get(self, key):
+        return self.local.get(key)
+
+    def fill(self, key, value, timeout=None):
+        self.local.set(key, value, timeout)
+
+    def invalidate(self, keys=(), patterns=()):
+        """Drop keys/patterns here and in every other worker"""
+        keys = [key for key in keys if self.handles(key)]
+        patterns = list(patterns)
+        if not self.enabled or not (keys or patterns):
+            return
+        self._apply(keys, patterns)
+        self.channel.publish({'origin': self.origin, 'keys': keys, 'patterns': patterns})
+
+    def clear(self):
+        if not self.enabled:
+            return
+        self.local.clear()
+        self.channel.publish({'origin': self.origin, 'clear': True})
+
+    def _apply(self, keys, patterns):
+        self.local.delete(*keys)
+        for pattern in patterns:
+            self.local.delete_pattern(pattern)
+
+    def _on_message(self, message):
+        if message.get('origin') == self.origin:
+            return
+        if message.get('clear'):
+            self.local.clear()
+        else:
+            self._apply(message.get('keys', ()), message.get('patterns', ()))
+
+
+_two_tier = None
+
+
+def get_two_tier_cache():
+    """Per-process TwoTierCache built from the CACHE_L1_* settings"""
+    global _two_tier
+    if _two_tier is None:
+        _two_tier = TwoTierCache(
+            prefixes=getattr(settings, 'CACHE_L1_PREFIXES', ()),
+            max_entries=getattr(settings, 'CACHE_L1_MAX_ENTRIES', 1000),
+            timeout=getattr(settings, 'CACHE_L1_TIMEOUT', 30),
+            channel=getattr(settings, 'CACHE_L1_CHANNEL', 'local'),
+        )
+    return _two_tier
+
+
+def _reset_two_tier_cache(setting, **kwargs):
+    global _two_tier
+    if setting.startswith('CACHE_L1_'):
+        _two_tier = None
+
+
+setting_changed.connect(_reset_two_tier_cache)
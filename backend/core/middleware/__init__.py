@@ -1,14 +1,15 @@
 """
 Core middleware for professional enterprise application
 """
+from .instrumentation import InstrumentationMiddleware
+from .performance import PerformanceMonitoringMiddleware, SecurityHeadersMiddleware
 from .request_logger import (
     RequestLoggerMiddleware,
-    SecurityHeadersMiddleware,
-    PerformanceMonitoringMiddleware,
     AuditTrailMiddleware
 )
 
 __all__ = [
+    'InstrumentationMiddleware',
     'RequestLoggerMiddleware',
     'SecurityHeadersMiddleware',
     'PerformanceMonitoringMiddleware',
@@ -0,0 +1,205 @@
+"""
+Request Instrumentation Middleware
+Single pass that times the request, assigns a request ID, resolves user and
+client IP, tracks queries and adds security headers, then hands one
+``RequestRecord`` to pluggable sinks (metrics, logs...).
+
+Sinks are configured with ``INSTRUMENTATION_SINKS`` (dotted paths to
+classes exposing ``handle(record)``).
+"""
+import logging
+import os
+import random
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+from core.utils.client_ip import get_client_ip
+from core.utils.metrics import endpoint_name, registry, track_queries
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SINKS = (
+    'core.middleware.instrumentation.MetricsSink',
+    'core.middleware.instrumentation.LogSink',
+)
+
+
+class RequestRecord:
+    """Everything sinks need to know about one finished request"""
+
+    __slots__ = (
+        'request_id', 'method', 'path', 'endpoint', 'status', 'duration',
+        'query_count', 'db_time', 'slow_queries', 'user_id', 'user_email',
+        'role', 'ip', 'user_agent',
+    )
+
+    def __init__(self, request_id, method, path, endpoint, status, duration,
+                 query_count, db_time, slow_queries, user_id=None, user_email=None,
+                 role=None, ip=None, user_agent=''):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.status = status
+        self.duration = duration
+        self.query_count = query_count
+        self.db_time = db_time
+        self.slow_queries = slow_queries
+        self.user_id = user_id
+        self.user_email = user_email
+        self.role = role
+        self.ip = ip
+        self.user_agent = user_agent
+
+    @property
+    def user_label(self):
+        if self.user_id is None:
+            return 'Anonymous'
+        return f"{self.user_email} ({self.role})"
+
+
+class MetricsSink:
+    """Feeds the per-endpoint histograms served at /metrics"""
+
+    def handle(self, record):
+        registry.observe_request(
+            record.endpoint, record.method, record.status,
+            record.duration, record.query_count, record.db_time
+        )
+
+
+class LogSink:
+    """
+    One structured log line per request (level by status), slow-request and
+    high-query-count flags, and the SQL of slow queries.
+
+    Successful, fast GET/HEAD requests are sampled per URL name with
+    ``LOG_SAMPLING``; everything else is always logged.
+    """
+
+    SLOW_REQUEST_SECONDS = 1.0
+    HIGH_QUERY_COUNT = 20
+    SAMPLED_METHODS = ('GET', 'HEAD')
+
+    def __init__(self):
+        sampling = getattr(settings, 'LOG_SAMPLING', {})
+        self.default_rate = sampling.get('DEFAULT', 1.0)
+        self.route_rates = sampling.get('ROUTES', {})
+
+    def sampled_out(self, record):
+        if record.method not in self.SAMPLED_METHODS or not 200 <= record.status < 300:
+            return False
+        rate = self.route_rates.get(record.endpoint, self.default_rate)
+        return rate < 1.0 and random.random() >= rate
+
+    def handle(self, record):
+        if record.status >= 500:
+            level = logging.ERROR
+        elif record.status >= 400:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+
+        flags = ''
+        slow = record.duration > self.SLOW_REQUEST_SECONDS
+        if slow:
+            flags = ' [SLOW]'
+            level = max(level, logging.WARNING)
+        if record.query_count > self.HIGH_QUERY_COUNT:
+            flags += ' [HIGH DB QUERIES]'
+        if not logger.isEnabledFor(level):
+            return
+        if not slow and self.sampled_out(record):
+            return
+
+        # Arguments are formatted by the handler (off the request thread with
+        # the queued pipeline); ``extra`` becomes fields of the JSON record
+        logger.log(
+            level,
+            "[%s] %s %s | User: %s | IP: %s | Status: %s | Duration: %.3fs | "
+            "Queries: %d | DB: %.3fs%s",
+            record.request_id, record.method, record.path, record.user_label,
+            record.ip, record.status, record.duration, record.query_count,
+            record.db_time, flags,
+            extra={
+                'request_id': record.request_id,
+                'endpoint': record.endpoint,
+                'status': record.status,
+                'duration_ms': round(record.duration * 1000, 2),
+                'queries': record.query_count,
+                'user_id': record.user_id,
+                'ip': record.ip,
+            },
+        )
+        if slow:
+            for elapsed, sql in record.slow_queries:
+                logger.warning("[%s] Slow query (%.3fs): %s", record.request_id, elapsed, sql[:200])
+
+
+class InstrumentationMiddleware:
+    """
+    Replaces PerformanceMonitoringMiddleware, SecurityHeadersMiddleware and
+    RequestLoggerMiddleware with one pass per request
+    """
+
+    def __init__(self, get_response):
+        from core.middleware.performance import SecurityHeadersMiddleware
+        self.get_response = get_response
+        self.security_headers = tuple(SecurityHeadersMiddleware.HEADERS.items())
+        self.debug = settings.DEBUG
+        self.sinks = [
+            import_string(path)()
+            for path in getattr(settings, 'INSTRUMENTATION_SINKS', DEFAULT_SINKS)
+        ]
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        request_id = os.urandom(4).hex()
+        request.request_id = request_id
+
+        with track_queries(request) as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # Headers already set by Django's security middlewares (or the view) are kept
+        headers = response.headers
+        for name, value in self.security_headers:
+            if name not in headers:
+                headers[name] = value
+        response['X-Request-ID'] = request_id
+        if self.debug:
+            response['X-Response-Time'] = f"{duration * 1000:.2f}ms"
+            response['X-Query-Count'] = str(stats.count)
+
+        if self.sinks:
+            self.emit(self.build_record(request, response, request_id, duration, stats))
+        return response
+
+    @staticmethod
+    def build_record(request, response, request_id, duration, stats):
+        # Read after the view ran: DRF stores the token-authenticated user on the request
+        user = getattr(request, 'user', None)
+        authenticated = user is not None and user.is_authenticated
+        return RequestRecord(
+            request_id=request_id,
+            method=request.method,
+            path=request.path,
+            endpoint=endpoint_name(request),
+            status=response.status_code,
+            duration=duration,
+            query_count=stats.count,
+            db_time=stats.duration,
+            slow_queries=stats.slow_queries,
+            user_id=str(user.pk) if authenticated else None,
+            user_email=getattr(user, 'email', None) if authenticated else None,
+            role=getattr(user, 'role', None) if authenticated else None,
+            ip=get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+
+    def emit(self, record):
+        for sink in self.sinks:
+            try:
+                sink.handle(record)
+            except Exception:
+                logger.exception(f"Instrumentation sink {type(sink).__name__} failed")
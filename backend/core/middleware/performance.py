@@ -1,59 +1,21 @@
 """
 Performance Monitoring Middleware
-Tracks request/response times and logs slow queries for optimization.
+Security headers and rate limiting; request timing and query tracking
+live in core.middleware.instrumentation.
 """
 
-import time
 import logging
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from core.middleware.instrumentation import InstrumentationMiddleware
+from core.utils.client_ip import get_client_ip
 
 logger = logging.getLogger('performance')
 
 
-class PerformanceMonitoringMiddleware(MiddlewareMixin):
-    """
-    Middleware to monitor and log performance metrics for each request.
-    Tracks response time, query count, and identifies slow endpoints.
-    """
-    
-    def process_request(self, request):
-        """Mark the start time of the request."""
-        request._start_time = time.time()
-        return None
-    
-    def process_response(self, request, response):
-        """Calculate and log performance metrics."""
-        if hasattr(request, '_start_time'):
-            duration = time.time() - request._start_time
-            duration_ms = duration * 1000
-            
-            # Get query count from connection
-            from django.db import connection
-            query_count = len(connection.queries)
-            
-            # Log slow requests (over 1 second)
-            if duration_ms > 1000:
-                logger.warning(
-                    f"Slow request detected: {request.method} {request.path} "
-                    f"took {duration_ms:.2f}ms with {query_count} queries"
-                )
-            
-            # Add performance headers (only in debug mode)
-            if settings.DEBUG:
-                response['X-Response-Time'] = f"{duration_ms:.2f}ms"
-                response['X-Query-Count'] = str(query_count)
-            
-            # Log all requests in production
-            if not settings.DEBUG:
-                logger.info(
-                    f"{request.method} {request.path} - "
-                    f"Status: {response.status_code} - "
-                    f"Time: {duration_ms:.2f}ms - "
-                    f"Queries: {query_count}"
-                )
-        
-        return response
+# Timing and query tracking now happen in the single instrumentation pass;
+# the old name is kept for settings that still reference it
+PerformanceMonitoringMiddleware = InstrumentationMiddleware
 
 
 class RequestLoggingMiddleware(MiddlewareMixin):
@@ -96,27 +58,19 @@ class RequestLoggingMiddleware(MiddlewareMixin):
                 f"Response: {response.status_code} for {request.method} {request.path}"
             )
     
-    @staticmethod
-    def get_client_ip(request):
-        """Extract client IP address from request."""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR', 'Unknown')
-        return ip
+    get_client_ip = staticmethod(get_client_ip)
 
 
 class SecurityHeadersMiddleware(MiddlewareMixin):
     """
     Add additional security headers to all responses.
     Enhances security beyond Django's default settings.
+    InstrumentationMiddleware applies the same HEADERS in its own pass.
     """
     
-    def process_response(self, request, response):
-        """Add security headers to response."""
+    HEADERS = {
         # Content Security Policy
-        response['Content-Security-Policy'] = (
+        'Content-Security-Policy': (
             "default-src 'self'; "
             "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
             "style-src 'self' 'unsafe-inline'; "
@@ -124,10 +78,9 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
             "font-src 'self' data:; "
             "connect-src 'self'; "
             "frame-ancestors 'none';"
-        )
-        
+        ),
         # Permissions Policy (formerly Feature-Policy)
-        response['Permissions-Policy'] = (
+        'Permissions-Policy': (
             "geolocation=(), "
             "microphone=(), "
             "camera=(), "
@@ -135,72 +88,166 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
             "usb=(), "
             "magnetometer=(), "
             "accelerometer=()"
-        )
-        
-        # X-Content-Type-Options
-        response['X-Content-Type-Options'] = 'nosniff'
+        ),
+        'X-Content-Type-Options': 'nosniff',
+        'X-Frame-Options': 'DENY',
+        'X-XSS-Protection': '1; mode=block',
+        'Referrer-Policy': 'same-origin',
+    }
+    
+    def process_response(self, request, response):
+        """Add security headers to response."""
+        for name, value in self.HEADERS.items():
+            response[name] = value
+        return response
+
+
+def identify_request(request):
+    """
+    ``(identity, role)`` of a request from its bearer token, decoded once per
+    request; anonymous requests are identified by IP
+    """
+    identity = getattr(request, '_client_identity', None)
+    if identity is not None:
+        return identity
+    
+    identity = None
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer '):
+        from rest_framework_simplejwt.exceptions import TokenError
+        from rest_framework_simplejwt.tokens import AccessToken
+        try:
+            token = AccessToken(header[7:])
+            identity = (f"user:{token['user_id']}", token.get('role', 'USER'))
+        except (TokenError, KeyError):
+            pass
+    if identity is None:
+        identity = (f"ip:{RateLimitMiddleware.get_client_ip(request)}", None)
+    request._client_identity = identity
+    return identity
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Sliding-window rate limiting per user (or IP for anonymous requests),
+    with limits per route (URL name) and role from ``settings.RATE_LIMITS``.
+    
+    Counting is one atomic Redis round trip per request, with in-process
+    counters while Redis is unavailable (see ``core.utils.rate_limit``).
+    The role comes from the access token's ``role`` claim, so no database
+    query is needed.
+    """
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        from core.utils.rate_limit import RateLimitPolicy, SlidingWindowRateLimiter
+        self.policy = RateLimitPolicy()
+        self.limiter = SlidingWindowRateLimiter() if self.policy.enabled else None
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.limiter is None:
+            return None
         
-        # X-Frame-Options
-        response['X-Frame-Options'] = 'DENY'
+        identity, role = self.identify(request)
+        if role is None and self.is_staff_session(request):
+            return None
         
-        # X-XSS-Protection
-        response['X-XSS-Protection'] = '1; mode=block'
+        match = request.resolver_match
+        route = match.view_name if match else request.path
+        limit = self.policy.limit_for(route, role)
+        if limit is None:
+            return None
         
-        # Referrer Policy
-        response['Referrer-Policy'] = 'same-origin'
+        requests_limit, window = limit
+        allowed, retry_after = self.limiter.hit(f"{route}:{identity}", requests_limit, window)
+        if allowed:
+            return None
         
+        from django.http import JsonResponse
+        logging.getLogger('django.security').warning(
+            "Rate limit exceeded for %s on %s", identity, route
+        )
+        response = JsonResponse(
+            {
+                'error': 'Rate limit exceeded',
+                'message': f'Too many requests. Limit: {requests_limit} per {window} seconds.'
+            },
+            status=429
+        )
+        response['Retry-After'] = str(retry_after)
         return response
+    
+    def identify(self, request):
+        """
+        Return ``(identity, role)`` from the bearer token without touching
+        the database; anonymous requests are identified by IP
+        """
+        return identify_request(request)
+    
+    @staticmethod
+    def is_staff_session(request):
+        """Staff logged in through the admin session are not limited"""
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return False
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_authenticated and user.is_staff)
+    
+    # Same address the request logs, metrics and audit trail record
+    get_client_ip = staticmethod(get_client_ip)
 
 
-class RateLimitMiddleware(MiddlewareMixin):
+class ReadReplicaMiddleware:
     """
-    Simple rate limiting middleware based on IP address.
-    For production, consider using django-ratelimit or similar.
+    Route the reads of eligible GET requests (URL names matching
+    ``READ_REPLICA['ROUTES']``: lists, dashboards, analytics, exports) to the
+    read replica through DatabaseRouter.
+    
+    A client that wrote is pinned to the primary for ``STICKY_SECONDS``
+    (shared through the cache, so across workers) and reads its own writes.
+    Not loaded when no replica database is configured.
     """
     
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    
     def __init__(self, get_response):
+        from django.core.exceptions import MiddlewareNotUsed
+        options = getattr(settings, 'READ_REPLICA', {})
+        if options.get('ALIAS', 'replica') not in settings.DATABASES:
+            raise MiddlewareNotUsed
         self.get_response = get_response
-        self.cache_key_prefix = 'rate_limit'
-        self.requests_limit = 100  # requests per minute
-        self.timeout = 60  # 1 minute
+        self.routes = tuple(options.get('ROUTES', ()))
+        self.sticky_seconds = options.get('STICKY_SECONDS', 10)
+        self._eligible = {}
     
     def __call__(self, request):
+        from core.utils.db_optimization import read_from_replica
+        with read_from_replica(enabled=False) as state:
+            request.db_routing = state
+            response = self.get_response(request)
+        if state['wrote']:
+            from django.core.cache import cache
+            cache.set(self.pin_key(request), 1, self.sticky_seconds)
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in self.SAFE_METHODS:
+            return None
+        match = request.resolver_match
+        if match is None or not self.is_eligible(match.view_name):
+            return None
         from django.core.cache import cache
-        from django.http import JsonResponse
-        
-        # Get client IP
-        ip = self.get_client_ip(request)
-        
-        # Skip rate limiting for authenticated staff users
-        if hasattr(request, 'user') and request.user.is_authenticated and request.user.is_staff:
-            return self.get_response(request)
-        
-        # Check rate limit
-        cache_key = f"{self.cache_key_prefix}:{ip}"
-        request_count = cache.get(cache_key, 0)
-        
-        if request_count >= self.requests_limit:
-            logger = logging.getLogger('django.security')
-            logger.warning(f"Rate limit exceeded for IP: {ip}")
-            return JsonResponse(
-                {
-                    'error': 'Rate limit exceeded',
-                    'message': f'Too many requests. Limit: {self.requests_limit} per minute.'
-                },
-                status=429
-            )
-        
-        # Increment counter
-        cache.set(cache_key, request_count + 1, self.timeout)
-        
-        return self.get_response(request)
+        if cache.get(self.pin_key(request)) is None:
+            request.db_routing['replica'] = True
+        return None
+    
+    def is_eligible(self, route):
+        eligible = self._eligible.get(route)
+        if eligible is None:
+            from fnmatch import fnmatchcase
+            eligible = any(fnmatchcase(route, pattern) for pattern in self.routes)
+            self._eligible[route] = eligible
+        return eligible
     
     @staticmethod
-    def get_client_ip(request):
-        """Extract client IP address from request."""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR', 'Unknown')
-        return ip
+    def pin_key(request):
+        return f"replica:pin:{identify_request(request)[0]}"
@@ -55,9 +55,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'core.middleware.performance.PerformanceMonitoringMiddleware',
-    'core.middleware.performance.SecurityHeadersMiddleware',
-    'core.middleware.request_logger.RequestLoggerMiddleware',
+    # Timing, request ID, query stats, security headers, metrics and logs in one pass
+    'core.middleware.instrumentation.InstrumentationMiddleware',
+    'core.middleware.performance.RateLimitMiddleware',
+    'core.middleware.request_logger.AuditTrailMiddleware',
+    'core.middleware.performance.ReadReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -95,6 +97,29 @@ DATABASES = {
     }
 }
 
+# Optional streaming replica for list, dashboard, analytics and export reads
+# (see core.utils.db_optimization.DatabaseRouter)
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': config('DB_REPLICA_HOST'),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'ATOMIC_REQUESTS': False,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.utils.db_optimization.DatabaseRouter']
+
+READ_REPLICA = {
+    'ALIAS': 'replica',
+    # URL names (fnmatch patterns) whose GET requests may read from the replica
+    'ROUTES': ['*list*', '*dashboard*', '*analytics*', '*statistics*', '*export*', '*history*'],
+    # Reads of a client that wrote stay on the primary this long
+    'STICKY_SECONDS': config('DB_REPLICA_STICKY_SECONDS', default=10, cast=int),
+    'MAX_LAG_SECONDS': config('DB_REPLICA_MAX_LAG_SECONDS', default=5, cast=float),
+    'LAG_CHECK_INTERVAL': 5,
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -134,7 +159,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'core.utils.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'MAX_PAGE_SIZE': 100,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -183,6 +208,8 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
     'JTI_CLAIM': 'jti',
+    # Adds the role claim RateLimitMiddleware reads (users.tokens.RoleRefreshToken)
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.RoleTokenObtainPairSerializer',
 }
 
 # CORS Configuration - Professional Security
@@ -292,6 +319,14 @@ CACHES = {
     },
 }
 
+# Per-worker L1 cache in front of Redis, opt-in per key prefix
+# (e.g. CACHE_L1_PREFIXES=generation,inspectors). Workers drop each other's
+# L1 entries through the invalidation channel ('redis' pub/sub or 'local')
+CACHE_L1_PREFIXES = config('CACHE_L1_PREFIXES', default='', cast=Csv())
+CACHE_L1_MAX_ENTRIES = config('CACHE_L1_MAX_ENTRIES', default=1000, cast=int)
+CACHE_L1_TIMEOUT = config('CACHE_L1_TIMEOUT', default=30, cast=int)
+CACHE_L1_CHANNEL = config('CACHE_L1_CHANNEL', default='local' if DEBUG else 'redis')
+
 # Celery Configuration
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
@@ -304,6 +339,8 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000
 CELERY_WORKER_PREFETCH_MULTIPLIER = 4
+# Run tasks in the calling process, without a broker (development)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
 
 # API Documentation
 SPECTACULAR_SETTINGS = {
@@ -319,6 +356,14 @@ SPECTACULAR_SETTINGS = {
 LOG_DIR = BASE_DIR / 'logs'
 LOG_DIR.mkdir(exist_ok=True)
 
+# dictConfig, then every configured handler is moved behind a bounded queue
+# drained by a background thread, so handler I/O never blocks a request
+LOGGING_CONFIG = 'core.utils.log_pipeline.configure_logging'
+LOGGING_QUEUE = {
+    'ENABLED': config('LOGGING_QUEUE_ENABLED', default=True, cast=bool),
+    'MAX_SIZE': config('LOGGING_QUEUE_MAX_SIZE', default=10000, cast=int),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -333,6 +378,11 @@ LOGGING = {
             'style': '{',
             'datefmt': '%Y-%m-%d %H:%M:%S',
         },
+        'json': {
+            '()': 'pythonjsonlogger.jsonlogger.JsonFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(process)d %(message)s',
+            'rename_fields': {'asctime': 'timestamp', 'levelname': 'level', 'name': 'logger'},
+        },
     },
     'filters': {
         'require_debug_false': {
@@ -354,7 +404,7 @@ LOGGING = {
             'filename': LOG_DIR / 'django.log',
             'maxBytes': 10485760,  # 10MB
             'backupCount': 10,
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
         'error_file': {
             'level': 'ERROR',
@@ -456,3 +506,81 @@ CSRF_TRUSTED_ORIGINS = config(
     cast=Csv()
 )
 
+
+# Dashboard - read admin stats/charts from pre-summed daily rollups
+# (kept in sync by signals, reconciled nightly with `manage.py reconcile_rollups`)
+DASHBOARD_USE_ROLLUPS = config('DASHBOARD_USE_ROLLUPS', default=True, cast=bool)
+
+# Rate limiting (core.middleware.performance.RateLimitMiddleware)
+# DRF-style rates; ROUTES are keyed by URL name and may map roles to rates
+RATE_LIMITS = {
+    'ENABLED': config('RATE_LIMIT_ENABLED', default=True, cast=bool),
+    'DEFAULT': config('RATE_LIMIT_DEFAULT', default='100/minute'),
+    'ROLES': {
+        'ADMIN': '600/minute',
+        'CALL_CENTER_ADMIN': '600/minute',
+        'CALL_CENTER': '300/minute',
+        'INSPECTOR': '300/minute',
+        'USER': '120/minute',
+    },
+    'ROUTES': {
+        'login': '10/minute',
+    },
+    # Reverse proxies in front of Django that append to X-Forwarded-For
+    # (1 behind the nginx of DEPLOYMENT.md). With 0 anonymous callers are
+    # keyed by REMOTE_ADDR: the header is set by the client
+    'TRUSTED_PROXIES': config('RATE_LIMIT_TRUSTED_PROXIES', default=0, cast=int),
+}
+
+# Prometheus metrics at /metrics (scraped with Authorization: Bearer <token>)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# With django-redis, each worker adds its samples to a shared Redis hash every
+# FLUSH_INTERVAL seconds so any worker's /metrics reports the totals of all
+# of them; gauges of workers silent for WORKER_TTL seconds are dropped
+METRICS = {
+    'FLUSH_INTERVAL': config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float),
+    'WORKER_TTL': config('METRICS_WORKER_TTL', default=60, cast=int),
+}
+
+# Sinks receiving one record per request from InstrumentationMiddleware
+INSTRUMENTATION_SINKS = [
+    'core.middleware.instrumentation.MetricsSink',
+    'core.middleware.instrumentation.LogSink',
+]
+
+# Audit trail rows are queued and written to users.AuditLog in batches
+AUDIT_LOG = {
+    'BATCH_SIZE': config('AUDIT_LOG_BATCH_SIZE', default=100, cast=int),
+    'FLUSH_INTERVAL': config('AUDIT_LOG_FLUSH_INTERVAL', default=2.0, cast=float),
+    'MAX_QUEUE_SIZE': config('AUDIT_LOG_MAX_QUEUE_SIZE', default=10000, cast=int),
+}
+
+# Fraction of successful, fast GET/HEAD requests LogSink writes, by URL name.
+# Errors, slow requests and writes are always logged.
+LOG_SAMPLING = {
+    'DEFAULT': 1.0,
+    'ROUTES': {
+        'metrics': 0.0,
+        'inspection-list': 0.1,
+        'appointments:appointment-list-create': 0.1,
+    },
+}
+
+# Batch auto-scheduling of pending appointments (appointments.scheduling).
+# DAILY_CAPACITY matches the 8 slots a day of the inspector calendar.
+AUTO_SCHEDULING = {
+    'WORKDAY_START': '08:00',
+    'WORKDAY_END': '17:00',
+    'WORKDAYS': [0, 1, 2, 3, 4, 5],  # lunes a sábado
+    'DAILY_CAPACITY': 8,
+    'HORIZON_DAYS': 14,
+}
+
+# Call center work queue (appointments.dispatch). A claimed task is leased to
+# its agent for LEASE_MINUTES; an expired lease puts it back in the queue.
+# Unanswered calls wait RETRY_MINUTES before they are dialed again.
+CALL_QUEUE = {
+    'LEASE_MINUTES': 15,
+    'RETRY_MINUTES': 60,
+}
@@ -0,0 +1,939 @@
+"""
+Tests for core utilities
+"""
+import logging
+import os
+import pytest
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework import viewsets
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework_simplejwt.tokens import AccessToken
+from core.cache import CacheManager, cache_method, cache_view
+from core.middleware.instrumentation import InstrumentationMiddleware, LogSink, RequestRecord
+from core.middleware.performance import RateLimitMiddleware, ReadReplicaMiddleware
+from core.middleware.request_logger import AuditTrailMiddleware
+from core.views import metrics_view
+from core.utils import log_pipeline
+from core.utils.audit import AuditWriter
+from core.utils.transactions import apply_transaction_policy
+from core.utils.db_optimization import read_from_replica, replica_health
+from core.utils.metrics import Histogram, MetricsRegistry, RedisMetricsStore, registry, track_queries
+from core.utils.rate_limit import LocalSlidingWindow, RateLimitPolicy, SlidingWindowRateLimiter, parse_rate
+from core.local_cache import LocalInvalidationChannel, LocalLRUCache, TwoTierCache
+from users.models import AuditLog
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestCacheGenerations:
+    """Test generation-counter invalidation on the local-memory backend"""
+
+    def test_bump_hides_namespace_entries(self):
+        """Entries written before a bump are no longer visible"""
+        CacheManager.cache_user_data('42', {'name': 'Ana'})
+        CacheManager.cache_user_data('43', {'name': 'Luis'})
+        assert CacheManager.get_user_data('42') == {'name': 'Ana'}
+
+        assert CacheManager.invalidate_user_cache('42')
+
+        assert CacheManager.get_user_data('42') is None
+        assert CacheManager.get_user_data('43') == {'name': 'Luis'}
+
+    def test_lost_counter_does_not_resurrect_entries(self):
+        """A counter evicted after a bump restarts above every previous generation"""
+        CacheManager.cache_inspection('7', {'status': 'PENDING'})
+        old_generation = CacheManager.generation('inspection:7')
+
+        cache.delete(CacheManager._generation_key('inspection:7'))
+        CacheManager.bump_generation('inspection:7')
+
+        assert CacheManager.generation('inspection:7') > old_generation
+        assert CacheManager.get_inspection('7') is None
+
+
+class TestLocalLRUCache:
+    """Test the per-worker LRU"""
+
+    def test_evicts_least_recently_used(self):
+        """Reading a key keeps it over older ones when the cache is full"""
+        lru = LocalLRUCache(max_entries=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        assert lru.get('a') == 1
+        assert lru.get('b') is None
+        assert len(lru) == 2
+
+    def test_entries_expire(self, monkeypatch):
+        """Entries live at most the L1 timeout"""
+        clock = [1000.0]
+        monkeypatch.setattr('core.local_cache.time.monotonic', lambda: clock[0])
+        lru = LocalLRUCache(max_entries=10, timeout=30)
+        lru.set('a', 1, timeout=300)
+
+        clock[0] += 29
+        assert lru.get('a') == 1
+        clock[0] += 2
+        assert lru.get('a') is None
+
+    def test_returns_copies(self):
+        """Mutating a returned value does not change the cached one"""
+        lru = LocalLRUCache()
+        lru.set('a', {'items': [1]})
+        lru.get('a')['items'].append(2)
+
+        assert lru.get('a') == {'items': [1]}
+
+
+class TestTwoTierCache:
+    """Test the L1 tier of CacheManager"""
+
+    @override_settings(CACHE_L1_PREFIXES=['inspectors'], CACHE_L1_CHANNEL='local')
+    def test_opted_in_prefix_served_from_l1(self):
+        """Hot keys are read from Redis once, then from the worker's memory"""
+        CacheManager.set('inspectors:active', ['ana', 'luis'])
+        assert CacheManager.get('inspectors:active') == ['ana', 'luis']
+
+        cache.delete('inspectors:active')  # L2 gone, L1 still answers
+        assert CacheManager.get('inspectors:active') == ['ana', 'luis']
+
+    @override_settings(CACHE_L1_PREFIXES=['inspectors'], CACHE_L1_CHANNEL='local')
+    def test_other_prefixes_stay_redis_only(self):
+        """Keys without an opted-in prefix always go to Redis"""
+        CacheManager.set('dashboard:stats', {'total': 1})
+        assert CacheManager.get('dashboard:stats') == {'total': 1}
+
+        cache.delete('dashboard:stats')
+        assert CacheManager.get('dashboard:stats') is None
+
+    @override_settings(CACHE_L1_PREFIXES=['inspectors'], CACHE_L1_CHANNEL='local')
+    def test_write_invalidates_local_copy(self):
+        """A write through CacheManager is visible on the next read"""
+        CacheManager.set('inspectors:active', ['ana'])
+        CacheManager.get('inspectors:active')
+        CacheManager.set('inspectors:active', ['ana', 'luis'])
+
+        assert CacheManager.get('inspectors:active') == ['ana', 'luis']
+
+    def test_invalidation_reaches_other_workers(self):
+        """An invalidation in one worker drops the L1 copy in the others"""
+        channel = LocalInvalidationChannel()
+        worker_a = TwoTierCache(prefixes=['templates'], channel=channel)
+        worker_b = TwoTierCache(prefixes=['templates'], channel=channel)
+        worker_a.fill('templates:welcome', 'Hola')
+        worker_b.fill('templates:welcome', 'Hola')
+        worker_b.fill('templates:reminder', 'Recordatorio')
+
+        worker_a.invalidate(keys=['templates:welcome'])
+
+        assert worker_a.get('templates:welcome') is None
+        assert worker_b.get('templates:welcome') is None
+        assert worker_b.get('templates:reminder') == 'Recordatorio'
+
+        worker_a.invalidate(patterns=['templates:*'])
+        assert worker_b.get('templates:reminder') is None
+
+    @override_settings(CACHE_L1_PREFIXES=['generation'], CACHE_L1_CHANNEL='local')
+    def test_generation_bump_with_l1(self):
+        """Generation counters can live in L1 and bumps still invalidate"""
+        CacheManager.cache_user_data('42', {'name': 'Ana'})
+        assert CacheManager.get_user_data('42') == {'name': 'Ana'}
+
+        CacheManager.invalidate_user_cache('42')
+
+        assert CacheManager.get_user_data('42') is None
+
+
+class SlowReport:
+    """Simulates an expensive query and counts how often it runs"""
+
+    def __init__(self, duration=0.05, fail=False):
+        self.duration = duration
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def compute(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.duration)
+        if self.fail:
+            raise RuntimeError('database unavailable')
+        return {'total': 10}
+
+
+def run_concurrently(target, workers):
+    barrier = threading.Barrier(workers)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(target())
+
+    threads = [threading.Thread(target=run) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestStampedeProtection:
+    """Test single-flight recomputation, early expiration and stale serving"""
+
+    def test_cold_key_computed_once(self):
+        """Concurrent misses wait for one recomputation instead of each running it"""
+        report = SlowReport(duration=0.2)
+
+        results = run_concurrently(
+            lambda: CacheManager.get_or_compute('report:cold', report.compute, timeout=60),
+            workers=20
+        )
+
+        assert report.calls == 1
+        assert results == [{'total': 10}] * 20
+
+    def test_stale_value_served_while_recomputing(self):
+        """Callers that miss the lock get the stale value immediately"""
+        report = SlowReport()
+        cache.set('report:stale', {'value': 'old', 'delta': 0.1, 'expires': time.time() - 1}, 60)
+        token = CacheManager.acquire_lock('report:stale')
+
+        assert CacheManager.get_or_compute('report:stale', report.compute) == 'old'
+        assert report.calls == 0
+        CacheManager.release_lock('report:stale', token)
+
+    def test_stale_value_served_on_error(self):
+        """A failing recomputation falls back to the stale value"""
+        cache.set('report:error', {'value': 'old', 'delta': 0.1, 'expires': time.time() - 1}, 60)
+
+        value = CacheManager.get_or_compute('report:error', SlowReport(fail=True).compute)
+
+        assert value == 'old'
+
+    def test_error_without_stale_value_raises(self):
+        with pytest.raises(RuntimeError):
+            CacheManager.get_or_compute('report:missing', SlowReport(fail=True).compute)
+
+    def test_probabilistic_early_expiration(self, monkeypatch):
+        """A value close to expiry may be refreshed before it expires"""
+        report = SlowReport()
+        cache.set('report:early', {'value': 'old', 'delta': 1.0, 'expires': time.time() + 2}, 60)
+
+        monkeypatch.setattr('core.cache.random.random', lambda: 0.0)
+        assert CacheManager.get_or_compute('report:early', report.compute) == 'old'
+        assert report.calls == 0
+
+        monkeypatch.setattr('core.cache.random.random', lambda: 0.99)
+        assert CacheManager.get_or_compute('report:early', report.compute) == {'total': 10}
+        assert report.calls == 1
+
+    def test_recomputation_rate_flat_across_expiry(self):
+        """
+        Load test: 20 workers reading a key that expires every 0.2s for 1s
+        recompute it about once per expiry, not once per worker
+        """
+        report = SlowReport(duration=0.02)
+
+        class Service:
+            @cache_method(timeout=0.2, beta=0)
+            def totals(self):
+                return report.compute()
+
+        service = Service()
+        deadline = time.monotonic() + 1.0
+
+        def hammer():
+            reads = 0
+            while time.monotonic() < deadline:
+                assert service.totals() == {'total': 10}
+                reads += 1
+            return reads
+
+        reads = sum(run_concurrently(hammer, workers=20))
+
+        assert reads > 100
+        assert report.calls <= 7
+
+
+class BrokenRedis:
+    """Redis connection whose scripts always fail"""
+
+    def register_script(self, script):
+        def run(keys, args):
+            raise ConnectionError('redis down')
+        return run
+
+
+class TestCacheView:
+    """Test the rendered response cache"""
+
+    def test_headers_replayed_on_hit(self):
+        """A hit returns the view's headers, but not its cookies"""
+        calls = []
+
+        @cache_view(key_prefix='headers', scope=lambda request: 'all')
+        def view(request):
+            calls.append(request)
+            response = HttpResponse('{}', content_type='application/json')
+            response['Vary'] = 'Accept-Language'
+            response['Content-Language'] = 'es'
+            response['X-Total-Count'] = '3'
+            response.set_cookie('session', 'abc')
+            return response
+
+        view(RequestFactory().get('/api/things/'))
+        hit = view(RequestFactory().get('/api/things/'))
+
+        assert len(calls) == 1
+        assert (hit['Vary'], hit['Content-Language'], hit['X-Total-Count']) == ('Accept-Language', 'es', '3')
+        assert hit['Content-Type'] == 'application/json'
+        assert hit['ETag'] and not hit.cookies
+
+
+class TestRateLimiter:
+    """Test the sliding-window limiter and its policy"""
+
+    def test_parse_rate(self):
+        assert parse_rate('100/minute') == (100, 60)
+        assert parse_rate('5/h') == (5, 3600)
+        assert parse_rate(None) is None
+
+    def test_blocks_after_limit(self):
+        limiter = SlidingWindowRateLimiter()
+        now = 6000.0
+
+        results = [limiter.hit('ip:1', 3, 60, now=now)[0] for _ in range(4)]
+
+        assert results == [True, True, True, False]
+        assert limiter.hit('ip:2', 3, 60, now=now)[0]
+
+    def test_previous_window_is_weighted(self):
+        """Half-way into a window, half of the previous window still counts"""
+        limiter = SlidingWindowRateLimiter()
+        for _ in range(4):
+            limiter.hit('ip:1', 4, 60, now=6010.0)
+
+        assert limiter.hit('ip:1', 4, 60, now=6090.0) == (True, 0)
+        assert limiter.hit('ip:1', 4, 60, now=6090.0) == (True, 0)
+        allowed, retry_after = limiter.hit('ip:1', 4, 60, now=6090.0)
+        assert not allowed
+        assert retry_after == 30
+
+    def test_falls_back_to_local_counters(self):
+        """Requests keep being limited while Redis is down"""
+        limiter = SlidingWindowRateLimiter(redis=BrokenRedis())
+
+        results = [limiter.hit('ip:1', 2, 60, now=6000.0)[0] for _ in range(3)]
+
+        assert results == [True, True, False]
+
+    def test_local_counters_are_atomic(self):
+        """Concurrent hits are never lost"""
+        window = LocalSlidingWindow()
+
+        run_concurrently(lambda: [window.hit('ip:1', 60, 6000.0) for _ in range(100)], workers=10)
+
+        assert window.hit('ip:1', 60, 6000.0) == (1001, 0)
+
+    def test_policy_resolution_order(self):
+        policy = RateLimitPolicy({
+            'DEFAULT': '100/minute',
+            'ROLES': {'ADMIN': '600/minute'},
+            'ROUTES': {
+                'login': '10/minute',
+                'appointment_list_create': {'CALL_CENTER': '50/minute', 'DEFAULT': '20/minute'},
+            },
+        })
+
+        assert policy.limit_for('login', 'ADMIN') == (10, 60)
+        assert policy.limit_for('appointment_list_create', 'CALL_CENTER') == (50, 60)
+        assert policy.limit_for('appointment_list_create', 'ADMIN') == (20, 60)
+        assert policy.limit_for('inspection-list', 'ADMIN') == (600, 60)
+        assert policy.limit_for('inspection-list', None) == (100, 60)
+
+
+class TestRateLimitMiddleware:
+    """Test RateLimitMiddleware end to end"""
+
+    @override_settings(RATE_LIMITS={'DEFAULT': '2/minute', 'ROLES': {'ADMIN': '3/minute'}})
+    def test_returns_429_with_retry_after(self):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+
+        def call():
+            request = factory.get('/api/appointments/', REMOTE_ADDR='10.0.0.1')
+            return middleware.process_view(request, None, (), {})
+
+        assert call() is None
+        assert call() is None
+        response = call()
+        assert response.status_code == 429
+        assert int(response['Retry-After']) > 0
+
+    @override_settings(RATE_LIMITS={'DEFAULT': '1/minute', 'ROLES': {'ADMIN': '3/minute'}})
+    def test_role_comes_from_token_claim(self):
+        """Bearer tokens are limited per user with their role's limit, without queries"""
+        middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        token = AccessToken()
+        token['user_id'] = 'b6a1f0c2-0000-0000-0000-000000000001'
+        token['role'] = 'ADMIN'
+        request = RequestFactory().get('/api/appointments/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        assert middleware.identify(request) == ('user:b6a1f0c2-0000-0000-0000-000000000001', 'ADMIN')
+        results = [middleware.process_view(request, None, (), {}) for _ in range(4)]
+        assert results[:3] == [None, None, None]
+        assert results[3].status_code == 429
+
+    @override_settings(RATE_LIMITS={'DEFAULT': '2/minute'})
+    def test_forged_forwarded_for_does_not_reset_the_limit(self):
+        """Without trusted proxies anonymous callers are keyed by REMOTE_ADDR"""
+        middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+        results = [
+            middleware.process_view(
+                factory.post('/api/auth/login/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}'),
+                None, (), {},
+            )
+            for i in range(3)
+        ]
+
+        assert results[2].status_code == 429
+
+    @override_settings(RATE_LIMITS={'TRUSTED_PROXIES': 1})
+    def test_client_ip_from_trusted_proxy_hop(self):
+        """Behind one proxy the client is the entry that proxy appended, not the first one"""
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='', HTTP_X_FORWARDED_FOR='192.0.2.7, 198.51.100.4'
+        )
+
+        assert RateLimitMiddleware.get_client_ip(request) == '198.51.100.4'
+
+
+class TestMetrics:
+    """Test query tracking and latency histograms"""
+
+    @pytest.mark.django_db
+    def test_queries_counted_without_debug(self, settings, django_user_model):
+        """execute_wrapper counts queries even though connection.queries is off"""
+        settings.DEBUG = False
+
+        with track_queries() as stats:
+            django_user_model.objects.count()
+            django_user_model.objects.filter(role='ADMIN').exists()
+
+        assert stats.count == 2
+        assert stats.duration > 0
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram((0.1, 0.2, 0.4, 0.8))
+        for value in [0.05] * 50 + [0.15] * 45 + [0.7] * 5:
+            histogram.observe(value)
+
+        assert histogram.quantile(0.5) == pytest.approx(0.1)
+        assert 0.1 < histogram.quantile(0.95) <= 0.2
+        assert 0.4 < histogram.quantile(0.99) <= 0.8
+
+    @pytest.mark.django_db
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self, django_user_model):
+        """Requests are recorded per URL name and exposed in Prometheus format"""
+        registry.reset()
+        factory = RequestFactory()
+
+        def view(request):
+            request.resolver_match = resolve(request.path)
+            django_user_model.objects.count()
+            return HttpResponse(status=401)
+
+        InstrumentationMiddleware(view)(factory.get('/api/appointments/'))
+
+        assert metrics_view(factory.get('/metrics')).status_code == 403
+        response = metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret'))
+
+        body = response.content.decode()
+        endpoint = 'endpoint="appointments:appointment-list-create"'
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert f'http_request_duration_seconds_bucket{{{endpoint},le="0.005"' in body
+        assert f'http_request_latency_seconds{{{endpoint},quantile="0.99"' in body
+        assert f'http_responses_total{{{endpoint},method="GET",status="4xx"' in body
+        assert f'db_queries_per_request_sum{{{endpoint}}}' in body
+        assert registry.summary('appointments:appointment-list-create')['count'] == 1
+
+
+class FakeRedis:
+    """In-memory stand-in for the Redis commands RedisMetricsStore pipelines"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.sorted_sets = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hincrby(self, key, field, value):
+        values = self.hashes.setdefault(key, {})
+        values[field.encode()] = values.get(field.encode(), 0) + value
+
+    hincrbyfloat = hincrby
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({name.encode(): value for name, value in mapping.items()})
+
+    def expire(self, key, seconds):
+        pass
+
+    def hgetall(self, key):
+        return {name: str(value).encode() for name, value in self.hashes.get(key, {}).items()}
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update({member.encode(): score for member, score in mapping.items()})
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.sorted_sets.get(key, {})
+        for member in [member for member, score in members.items() if low <= score <= high]:
+            del members[member]
+
+    def zrange(self, key, start, end):
+        return sorted(self.sorted_sets.get(key, {}))
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class TestSharedMetrics:
+    """Test adding up the metrics of several workers"""
+
+    def test_any_worker_reports_the_totals(self, monkeypatch):
+        """A scrape answered by one worker includes what the others observed"""
+        store = RedisMetricsStore(FakeRedis(), worker_ttl=60)
+        workers = [MetricsRegistry(store=store, flush_interval=60) for _ in range(2)]
+        enqueued = {0: 0, 1: 0}
+        for index, worker in enumerate(workers):
+            worker._pid = os.getpid()
+            worker.register_counter('audit_events_enqueued_total', 'Queued', lambda index=index: enqueued[index])
+            worker.register_gauge('audit_queue_depth', 'Waiting', lambda index=index: enqueued[index])
+        endpoint = 'appointments:appointment-list-create'
+
+        monkeypatch.setattr('core.utils.metrics.worker_id', lambda: 'host:1')
+        workers[0].observe_request(endpoint, 'GET', 200, 0.02, 3, 0.01)
+        enqueued[0] = 4
+        workers[0].flush()
+        monkeypatch.setattr('core.utils.metrics.worker_id', lambda: 'host:2')
+        workers[1].observe_request(endpoint, 'GET', 200, 0.3, 1, 0.1)
+        workers[1].observe_request(endpoint, 'GET', 500, 0.01, 0, 0.0)
+        enqueued[1] = 2
+
+        body = workers[1].render()
+
+        labels = 'endpoint="appointments:appointment-list-create"'
+        assert f'http_request_duration_seconds_count{{{labels}}} 3' in body
+        assert f'http_request_duration_seconds_bucket{{{labels},le="0.025"}} 2' in body
+        assert f'http_responses_total{{{labels},method="GET",status="2xx"}} 2' in body
+        assert f'http_responses_total{{{labels},method="GET",status="5xx"}} 1' in body
+        assert 'audit_events_enqueued_total 6' in body
+        assert 'audit_queue_depth 6.0' in body
+        assert 'worker=' not in body
+        # Nothing is counted twice by later flushes
+        workers[0].flush()
+        assert f'http_request_duration_seconds_count{{{labels}}} 3' in workers[0].render()
+
+    def test_failed_flush_keeps_the_samples(self):
+        """Samples of a flush that did not reach Redis go out with the next one"""
+        store = RedisMetricsStore(FakeRedis(), worker_ttl=60)
+        worker = MetricsRegistry(store=store, flush_interval=60)
+        worker._pid = os.getpid()
+        worker.observe_request('health', 'GET', 200, 0.01, 0, 0.0)
+        add = store.add
+
+        def redis_down(*args):
+            raise ConnectionError('redis down')
+
+        store.add = redis_down
+        with pytest.raises(ConnectionError):
+            worker.flush()
+        store.add = add
+
+        assert 'http_request_duration_seconds_count{endpoint="health"} 1' in worker.render()
+
+
+class RecordingSink:
+    records = []
+
+    def handle(self, record):
+        self.records.append(record)
+
+
+class FailingSink:
+    def handle(self, record):
+        raise RuntimeError('sink down')
+
+
+@pytest.mark.django_db
+class TestInstrumentationMiddleware:
+    """Test the single instrumentation pass"""
+
+    @override_settings(INSTRUMENTATION_SINKS=[
+        'core.tests.FailingSink',
+        'core.tests.RecordingSink',
+    ])
+    def test_one_record_per_request(self, django_user_model):
+        """Sinks get timing, user, IP and query stats; a failing sink is isolated"""
+        RecordingSink.records = []
+        user = django_user_model.objects.create_user(
+            username='admin', email='admin@test.com', password='testpass123', role='ADMIN'
+        )
+
+        def view(request):
+            request.resolver_match = resolve('/api/appointments/')
+            request.user = user
+            django_user_model.objects.count()
+            return HttpResponse('ok')
+
+        request = RequestFactory().get(
+            '/api/appointments/', REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='10.0.0.7, 10.0.0.1'
+        )
+        response = InstrumentationMiddleware(view)(request)
+
+        assert response.status_code == 200
+        assert response['X-Request-ID'] == request.request_id
+        assert response['X-Frame-Options'] == 'DENY'
+        assert 'Content-Security-Policy' in response
+        [record] = RecordingSink.records
+        assert record.endpoint == 'appointments:appointment-list-create'
+        assert record.query_count == 1
+        assert record.user_label == 'admin@test.com (ADMIN)'
+        # Same address as the rate limiter: X-Forwarded-For is not trusted by default
+        assert record.ip == RateLimitMiddleware.get_client_ip(request) == '10.0.0.9'
+
+
+class SlowHandler(logging.Handler):
+    """Handler standing in for blocking file or network I/O"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.messages = []
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.messages.append(self.format(record))
+
+
+class TestLogPipeline:
+    """Test the queued logging pipeline and request log sampling"""
+
+    @pytest.fixture
+    def pipeline_logger(self):
+        target = logging.getLogger('core.tests.pipeline')
+        target.propagate = False
+        target.setLevel(logging.INFO)
+        yield target
+        target.handlers.clear()
+
+    def test_handler_io_is_off_the_request_thread(self, pipeline_logger):
+        """Slow handlers do not block the caller; formatting happens on the listener"""
+        handler = SlowHandler(delay=0.05)
+        pipeline_logger.addHandler(handler)
+        [listener] = log_pipeline.install_queue(['core.tests.pipeline'])
+
+        start = time.perf_counter()
+        for i in range(5):
+            pipeline_logger.info("request %d", i)
+        assert time.perf_counter() - start < 0.05
+
+        listener.stop()
+        assert handler.messages == [f"request {i}" for i in range(5)]
+
+    def test_full_queue_drops_instead_of_blocking(self, pipeline_logger):
+        """Records over the queue size are counted as dropped"""
+        pipeline_logger.addHandler(SlowHandler(delay=0.2))
+        [listener] = log_pipeline.install_queue(['core.tests.pipeline'], max_size=2)
+        [queued] = pipeline_logger.handlers
+
+        start = time.perf_counter()
+        for i in range(10):
+            pipeline_logger.info("request %d", i)
+        assert time.perf_counter() - start < 0.2
+        assert queued.dropped >= 7
+        assert log_pipeline.dropped_records() >= queued.dropped
+        listener.stop()
+
+    @override_settings(LOG_SAMPLING={'DEFAULT': 1.0, 'ROUTES': {'metrics': 0.0}})
+    def test_sampling_skips_only_fast_successful_reads(self, caplog):
+        """Sampled-out routes still log errors, writes and slow requests"""
+        sink = LogSink()
+
+        def record(method='GET', status=200, duration=0.01, endpoint='metrics'):
+            return RequestRecord('abcd1234', method, '/metrics', endpoint, status, duration, 0, 0.0, [])
+
+        with caplog.at_level(logging.INFO, logger='core.middleware.instrumentation'):
+            sink.handle(record())
+            sink.handle(record(status=500))
+            sink.handle(record(method='POST'))
+            sink.handle(record(duration=2.0))
+            sink.handle(record(endpoint='inspection-list'))
+
+        assert [(r.status, r.endpoint, r.duration_ms) for r in caplog.records] == [
+            (500, 'metrics', 10.0),
+            (200, 'metrics', 10.0),
+            (200, 'metrics', 2000.0),
+            (200, 'inspection-list', 10.0),
+        ]
+
+
+@pytest.mark.django_db
+class TestAuditWriter:
+    """Test the batched AuditLog writer"""
+
+    def test_flush_writes_in_batches(self):
+        """Queued events are written with one INSERT per batch"""
+        writer = AuditWriter(batch_size=2, autostart=False)
+        for i in range(5):
+            assert writer.submit(action='CREATE', model_name='inspections', object_id=str(i))
+
+        with CaptureQueriesContext(connection) as queries:
+            writer.flush()
+
+        # Each batch also runs in a savepoint, so a failed one can be retried
+        assert sum(query['sql'].startswith('INSERT') for query in queries) == 3
+        assert AuditLog.objects.count() == 5
+        assert (writer.enqueued, writer.written, writer.depth) == (5, 5, 0)
+
+    def test_full_queue_drops_events(self):
+        """Events over the queue size are dropped and counted, never blocking"""
+        writer = AuditWriter(max_queue_size=2, autostart=False)
+        results = [writer.submit(action='DELETE', model_name='inspections') for _ in range(3)]
+
+        assert results == [True, True, False]
+        assert (writer.enqueued, writer.dropped) == (2, 1)
+
+    def test_background_thread_flushes_by_size_and_interval(self, monkeypatch):
+        """Full batches are written at once, a partial one when the interval elapses"""
+        batches = []
+        monkeypatch.setattr(AuditWriter, 'write', lambda self, batch: batches.append(len(batch)))
+        writer = AuditWriter(batch_size=3, flush_interval=0.2)
+        for _ in range(4):
+            writer.submit(action='UPDATE', model_name='appointments')
+
+        time.sleep(0.05)
+        assert batches == [3]
+        deadline = time.monotonic() + 5
+        while len(batches) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        writer.stop()
+
+        assert batches == [3, 1]
+
+    def test_middleware_queues_mutations(self, django_user_model):
+        """Successful writes on tracked paths are queued, reads are not"""
+        user = django_user_model.objects.create_user(
+            username='admin', email='admin@test.com', password='testpass123', role='ADMIN'
+        )
+
+        def view(request):
+            request.resolver_match = resolve(request.path)
+            request.user = user
+            return HttpResponse(status=200 if request.method == 'GET' else 204)
+
+        middleware = AuditTrailMiddleware(view)
+        middleware.writer = AuditWriter(autostart=False)
+        factory = RequestFactory()
+        middleware(factory.get('/api/inspections/'))
+        middleware(factory.patch('/api/inspections/7/', REMOTE_ADDR='10.0.0.3'))
+        middleware.writer.flush()
+
+        entry = AuditLog.objects.get()
+        assert (entry.user, entry.action, entry.model_name, entry.object_id) == (
+            user, 'UPDATE', 'inspections', '7'
+        )
+        assert entry.ip_address == '10.0.0.3'
+
+    def test_middleware_ignores_forged_forwarded_ip(self):
+        """The audit trail stores the address the rate limiter trusts, not the client's claim"""
+        middleware = AuditTrailMiddleware(lambda request: HttpResponse(status=201))
+        middleware.writer = AuditWriter(autostart=False)
+        factory = RequestFactory()
+        middleware(factory.post('/api/inspections/', REMOTE_ADDR='10.0.0.3', HTTP_X_FORWARDED_FOR='192.0.2.1'))
+        with override_settings(RATE_LIMITS={'TRUSTED_PROXIES': 1}):
+            middleware(factory.post(
+                '/api/inspections/', REMOTE_ADDR='10.0.0.3', HTTP_X_FORWARDED_FOR='192.0.2.1, 2001:db8::1'
+            ))
+            middleware(factory.post('/api/inspections/', REMOTE_ADDR='10.0.0.3', HTTP_X_FORWARDED_FOR='not-an-ip'))
+        middleware.writer.flush()
+
+        assert sorted(AuditLog.objects.values_list('ip_address', flat=True), key=str) == [
+            '10.0.0.3', '2001:db8::1', None
+        ]
+
+    def test_bad_row_does_not_drop_the_batch(self):
+        """A row the database rejects is skipped, the rest of its batch is written"""
+        writer = AuditWriter(batch_size=10, autostart=False)
+        writer.submit(action='CREATE', model_name='inspections', ip_address='10.0.0.1')
+        writer.submit(action='CREATE', model_name='inspections', ip_address='not-an-ip')
+        writer.submit(action='CREATE', model_name='inspections', ip_address='10.0.0.2')
+
+        writer.flush()
+
+        assert (writer.written, writer.failed) == (2, 1)
+        assert AuditLog.objects.count() == 2
+
+
+class DepthViewSet(viewsets.ViewSet):
+    """Reports how many atomic blocks are open while the action runs"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    non_atomic_actions = ('create',)
+
+    def list(self, request):
+        return Response({'depth': len(connection.atomic_blocks)})
+
+    create = partial_update = list
+
+
+@pytest.mark.django_db
+class TestTransactionPolicy:
+    """Test per-request transaction decisions"""
+
+    @pytest.fixture(autouse=True)
+    def atomic_requests(self, monkeypatch):
+        monkeypatch.setitem(connections.settings['default'], 'ATOMIC_REQUESTS', True)
+        registry.reset()
+
+    def call(self, view, method):
+        request = getattr(RequestFactory(), method)('/api/appointments/')
+        request.resolver_match = resolve('/api/appointments/')
+        return apply_transaction_policy(view)(request)
+
+    def test_reads_autocommit_writes_atomic(self):
+        """GET runs outside a transaction, POST in one whose open time is recorded"""
+        outer = len(connection.atomic_blocks)
+
+        def view(request):
+            return HttpResponse(str(len(connection.atomic_blocks)))
+
+        assert int(self.call(view, 'get').content) == outer
+        assert int(self.call(view, 'post').content) == outer + 1
+        assert registry.transactions['appointments:appointment-list-create'].count == 1
+
+    def test_non_atomic_opt_outs(self):
+        """non_atomic_requests and viewset non_atomic_actions skip the transaction"""
+        outer = len(connection.atomic_blocks)
+
+        @transaction.non_atomic_requests
+        def view(request):
+            return HttpResponse(str(len(connection.atomic_blocks)))
+
+        assert int(self.call(view, 'post').content) == outer
+
+        viewset = DepthViewSet.as_view({'get': 'list', 'post': 'create', 'patch': 'partial_update'})
+        assert self.call(viewset, 'post').data == {'depth': outer}
+        assert self.call(viewset, 'patch').data == {'depth': outer + 1}
+
+
+@pytest.fixture
+def replica_alias(monkeypatch):
+    """SQLite in-memory database standing in for the read replica"""
+    replica = connections.configure_settings({
+        'default': dict(settings.DATABASES['default']),
+        'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+    })['replica']
+    monkeypatch.setitem(settings.DATABASES, 'replica', replica)
+    replica_health.reset()
+    yield 'replica'
+    replica_health.reset()
+    if hasattr(connections._connections, 'replica'):
+        connections['replica'].close()
+        del connections['replica']
+
+
+@pytest.mark.django_db
+class TestReadReplicaRouting:
+    """Test read/write splitting with sticky-after-write"""
+
+    def test_reads_go_to_replica_until_a_write(self, replica_alias, django_user_model):
+        """Reads in a replica block use the replica, then the primary after a write"""
+        assert django_user_model.objects.all().db == 'default'
+
+        with read_from_replica():
+            assert django_user_model.objects.all().db == 'replica'
+            django_user_model.objects.create_user(username='ana', email='ana@test.com', password='x')
+            assert django_user_model.objects.all().db == 'default'
+
+    def test_lagging_or_unreachable_replica_falls_back(self, replica_alias, monkeypatch, django_user_model):
+        """Lag over the threshold or a connection error send reads to the primary"""
+        checks = []
+
+        def lag(alias):
+            checks.append(alias)
+            return 30.0
+
+        monkeypatch.setattr(replica_health, 'lag', lag)
+        with read_from_replica():
+            assert django_user_model.objects.all().db == 'default'
+            assert django_user_model.objects.all().db == 'default'
+        assert checks == ['replica']
+
+        def unreachable(alias):
+            raise OperationalError('connection refused')
+
+        replica_health.reset()
+        monkeypatch.setattr(replica_health, 'lag', unreachable)
+        with read_from_replica():
+            assert django_user_model.objects.all().db == 'default'
+
+    def test_middleware_pins_client_after_write(self, replica_alias, django_user_model):
+        """Eligible GETs read from the replica, except right after the client wrote"""
+        def view(request):
+            if request.method == 'POST':
+                django_user_model.objects.create_user(username='luis', email='luis@test.com', password='x')
+            return HttpResponse(django_user_model.objects.all().db)
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReadReplicaMiddleware(get_response)
+        factory = RequestFactory()
+
+        def call(method, path, ip='10.0.0.5'):
+            request = getattr(factory, method)(path, REMOTE_ADDR=ip)
+            request.resolver_match = resolve(path)
+            return middleware(request).content.decode()
+
+        assert call('get', '/api/appointments/') == 'replica'
+        assert call('get', '/api/auth/admin/call-center/') == 'default'
+        assert call('post', '/api/appointments/') == 'default'
+        assert call('get', '/api/appointments/') == 'default'
+        assert call('get', '/api/appointments/', ip='10.0.0.6') == 'replica'
+
+    def test_middleware_unused_without_replica(self):
+        """No replica alias configured: the middleware is not loaded"""
+        with pytest.raises(MiddlewareNotUsed):
+            ReadReplicaMiddleware(lambda request: HttpResponse())
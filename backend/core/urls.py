@@ -10,6 +10,7 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView
 )
+from core.views import metrics_view
 
 urlpatterns = [
     # Admin
@@ -20,6 +21,9 @@ urlpatterns = [
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     
+    # Monitoring (Prometheus)
+    path('metrics', metrics_view, name='metrics'),
+    
     # Authentication
     path('api/auth/', include('users.urls')),
     
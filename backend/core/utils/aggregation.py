@@ -0,0 +1,93 @@
+"""
+Conditional Aggregation Utilities
+Single-pass breakdowns using COUNT(...) FILTER (WHERE ...) expressions.
+"""
+
+from django.db.models import Count, Q, Sum
+
+
+def choice_breakdown(field, choices, alias=None, measure=None):
+    """
+    Build one filtered aggregate expression per choice of ``field``.
+
+    Args:
+        field: Model field (or lookup path) to break down
+        choices: TextChoices ``.choices`` list of (value, label)
+        alias: Prefix for the aggregate names (defaults to ``field``)
+        measure: Column to SUM instead of counting rows (for pre-summed
+            tables such as dashboard rollups)
+
+    Returns:
+        Dict of aggregate expressions keyed ``<alias>_<value>``
+    """
+    alias = alias or field
+
+    def expression(value):
+        condition = Q(**{field: value})
+        if measure:
+            return Sum(measure, filter=condition, default=0)
+        return Count('pk', filter=condition)
+
+    return {
+        f'{alias}_{value}': expression(value)
+        for value, _label in choices
+    }
+
+
+def aggregate_breakdowns(queryset, breakdowns, measure=None, **extra):
+    """
+    Compute several choice breakdowns plus extra aggregates in ONE query.
+
+    The number of queries stays at one regardless of how many choices each
+    enum has, so adding a new status does not add a round trip.
+
+    Args:
+        queryset: Scoped queryset (global, per inspector, per user...)
+        breakdowns: Dict of ``{field: choices}``
+        measure: Optional column to SUM instead of counting rows
+        **extra: Additional named aggregate expressions (Avg, Count...)
+
+    Returns:
+        Dict ``{field: {value: count}, ..., <extra name>: value}``
+
+    Example:
+        aggregate_breakdowns(
+            Inspection.objects.filter(inspector=user),
+            {'status': Inspection.Status.choices},
+            total=Count('pk')
+        )
+    """
+    expressions = dict(extra)
+    for field, choices in breakdowns.items():
+        expressions.update(choice_breakdown(field, choices, measure=measure))
+
+    raw = queryset.aggregate(**expressions) if expressions else {}
+
+    result = {name: raw[name] for name in extra}
+    for field, choices in breakdowns.items():
+        result[field] = {
+            value: raw[f'{field}_{value}'] for value, _label in choices
+        }
+    return result
+
+
+def with_labels(counts, choices):
+    """
+    Turn ``{value: count}`` into ``{value: {'count': n, 'label': label}}``.
+    """
+    return {
+        value: {'count': counts.get(value, 0), 'label': label}
+        for value, label in choices
+    }
+
+
+def as_distribution(counts, choices, key, skip_empty=False):
+    """
+    Turn ``{value: count}`` into a chart-friendly list of
+    ``{key: label, 'count': n}`` entries, in choice order.
+    """
+    return [
+        {key: label, 'count': counts.get(value, 0)}
+        for value, label in choices
+        if not (skip_empty and not counts.get(value, 0))
+    ]
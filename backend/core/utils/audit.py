@@ -0,0 +1,173 @@
+"""
+Batched Audit Log Writer
+Audit events are queued in memory and written to ``users.AuditLog`` with
+``bulk_create`` by a background thread, every ``BATCH_SIZE`` events or
+``FLUSH_INTERVAL`` seconds, so mutating requests never wait on the INSERT.
+
+The queue is bounded (``MAX_QUEUE_SIZE``): when the database falls behind,
+new events are dropped and counted instead of growing memory or blocking
+requests. Counters are exported on /metrics.
+"""
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.test.signals import setting_changed
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Bounded in-process queue of AuditLog rows flushed in batches"""
+
+    def __init__(self, batch_size=100, flush_interval=2.0, max_queue_size=10000, autostart=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.autostart = autostart
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, **fields):
+        """Queue one AuditLog row; returns False when it had to be dropped"""
+        if self.autostart:
+            self._ensure_thread()
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            self.write(batch[start:start + self.batch_size])
+
+    def write(self, batch):
+        if not batch:
+            return
+        from users.models import AuditLog
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create([AuditLog(**fields) for fields in batch])
+        except Exception:
+            # One bad row must not cost the whole batch: retry them one by one
+            logger.warning("Audit batch of %d entries failed, writing them one by one", len(batch))
+            for fields in batch:
+                try:
+                    with transaction.atomic():
+                        AuditLog.objects.create(**fields)
+                except Exception:
+                    self.failed += 1
+                    logger.exception("Could not write audit log entry %r", fields)
+                else:
+                    self.written += 1
+        else:
+            self.written += len(batch)
+
+    def stop(self, timeout=10):
+        """Write the pending events and stop the background thread"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def _ensure_thread(self):
+        # Also restarts the thread in forked workers, where it does not survive
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            self._consume()
+        finally:
+            connections.close_all()
+
+    def _consume(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write_batch(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write_batch(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        # The thread keeps its own connection: drop it if it went stale
+        close_old_connections()
+        self.write(batch)
+
+
+_writer = None
+
+
+def get_audit_writer():
+    """Per-process AuditWriter built from the AUDIT_LOG setting"""
+    global _writer
+    if _writer is None:
+        options = getattr(settings, 'AUDIT_LOG', {})
+        _writer = AuditWriter(
+            batch_size=options.get('BATCH_SIZE', 100),
+            flush_interval=options.get('FLUSH_INTERVAL', 2.0),
+            max_queue_size=options.get('MAX_QUEUE_SIZE', 10000),
+        )
+    return _writer
+
+
+def _stop_writer():
+    if _writer is not None:
+        _writer.stop()
+
+
+def _reset_audit_writer(setting, **kwargs):
+    global _writer
+    if setting == 'AUDIT_LOG':
+        _stop_writer()
+        _writer = None
+
+
+setting_changed.connect(_reset_audit_writer)
+atexit.register(_stop_writer)
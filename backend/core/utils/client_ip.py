@@ -0,0 +1,19 @@
+"""
+Client IP resolution shared by rate limiting, request logs, metrics and
+the audit trail, so they all agree on who made a request.
+"""
+from django.conf import settings
+
+
+def get_client_ip(request):
+    """
+    Client address of a request: the X-Forwarded-For entry added by the
+    outermost of ``RATE_LIMITS['TRUSTED_PROXIES']`` proxies, else
+    REMOTE_ADDR. Entries further left are chosen by the client.
+    """
+    trusted = getattr(settings, 'RATE_LIMITS', {}).get('TRUSTED_PROXIES', 0)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if trusted and x_forwarded_for:
+        hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+        return hops[-trusted] if len(hops) >= trusted else hops[0]
+    return request.META.get('REMOTE_ADDR') or 'Unknown'
@@ -3,9 +3,12 @@ Database Optimization Utilities
 Professional database query optimization and monitoring tools.
 """
 
-from django.db import connection
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
 from django.db.models import Prefetch
 from functools import wraps
+import contextvars
 import time
 import logging
 
@@ -165,22 +168,114 @@ def bulk_update_optimized(queryset, field_updates, batch_size=1000):
     return queryset.update(**field_updates)
 
 
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """
+    Route the reads of the block to the read replica (if configured and
+    healthy). Reads go back to the primary once the block writes.
+    The request-level equivalent is ``ReadReplicaMiddleware``.
+
+    Usage:
+        with read_from_replica():
+            stats = AnalyticsService.get_inspection_trends(days=90)
+    """
+    state = {'replica': enabled, 'wrote': False}
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaHealth:
+    """
+    Per-process replica lag check, cached for ``interval`` seconds.
+    An unreachable replica counts as lagging.
+    """
+    
+    LAG_QUERY = (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() "
+        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )
+    
+    def __init__(self):
+        self._checked = {}
+    
+    def lag(self, alias):
+        """Replication lag in seconds (0 for non-PostgreSQL aliases)"""
+        replica = connections[alias]
+        if replica.vendor != 'postgresql':
+            return 0.0
+        with replica.cursor() as cursor:
+            cursor.execute(self.LAG_QUERY)
+            return float(cursor.fetchone()[0] or 0)
+    
+    def is_usable(self, alias, max_lag, interval):
+        now = time.monotonic()
+        checked = self._checked.get(alias)
+        if checked is not None and checked[0] > now:
+            return checked[1]
+        
+        try:
+            lag = self.lag(alias)
+        except DatabaseError as e:
+            logger.warning(f"Read replica '{alias}' unavailable, reading from primary: {e}")
+            usable = False
+        else:
+            usable = lag <= max_lag
+            if not usable:
+                logger.warning(f"Read replica '{alias}' lags {lag:.1f}s, reading from primary")
+        self._checked[alias] = (now + interval, usable)
+        return usable
+    
+    def reset(self):
+        self._checked.clear()
+
+
+replica_health = ReplicaHealth()
+
+
 class DatabaseRouter:
     """
     Database router for read/write splitting.
-    Configure in settings.py: DATABASE_ROUTERS = ['core.utils.db.DatabaseRouter']
+    Configure in settings.py:
+        DATABASE_ROUTERS = ['core.utils.db_optimization.DatabaseRouter']
+    
+    Reads go to the ``READ_REPLICA['ALIAS']`` database only inside
+    ``read_from_replica()`` (set per request by ReadReplicaMiddleware for
+    eligible routes), until the first write of the block, and while the
+    replica lag is under ``MAX_LAG_SECONDS``. Everything else uses the primary.
     """
     
     def db_for_read(self, model, **hints):
-        """Send read operations to read replica if available."""
-        return 'read_replica' if 'read_replica' in settings.DATABASES else 'default'
+        """Send eligible reads to the read replica when it is usable."""
+        state = _routing.get()
+        if state is None or not state['replica'] or state['wrote']:
+            return None
+        
+        options = getattr(settings, 'READ_REPLICA', {})
+        alias = options.get('ALIAS', 'replica')
+        if alias not in settings.DATABASES:
+            return None
+        if not replica_health.is_usable(
+            alias, options.get('MAX_LAG_SECONDS', 5), options.get('LAG_CHECK_INTERVAL', 5)
+        ):
+            return None
+        return alias
     
     def db_for_write(self, model, **hints):
         """Send write operations to primary database."""
+        state = _routing.get()
+        if state is not None:
+            state['wrote'] = True
         return 'default'
     
     def allow_relation(self, obj1, obj2, **hints):
-        """Allow relations if both objects are in the same database."""
+        """Replica and primary hold the same data."""
         return True
     
     def allow_migrate(self, db, app_label, model_name=None, **hints):
@@ -260,58 +355,3 @@ def explain_query(queryset):
     with connection.cursor() as cursor:
         cursor.execute(f"EXPLAIN ANALYZE {sql}", params)
         return cursor.fetchall()
-
-
-# Index suggestions based on common queries
-SUGGESTED_INDEXES = """
--- Performance Optimization: Suggested Database Indexes
-
--- Users table
-CREATE INDEX IF NOT EXISTS idx_users_email ON users_customuser(email);
-CREATE INDEX IF NOT EXISTS idx_users_role ON users_customuser(role);
-CREATE INDEX IF NOT EXISTS idx_users_active ON users_customuser(is_active);
-CREATE INDEX IF NOT EXISTS idx_users_role_active ON users_customuser(role, is_active);
-
--- Inspections table
-CREATE INDEX IF NOT EXISTS idx_inspections_user ON inspections_inspection(user_id);
-CREATE INDEX IF NOT EXISTS idx_inspections_inspector ON inspections_inspection(inspector_id);
-CREATE INDEX IF NOT EXISTS idx_inspections_status ON inspections_inspection(status);
-CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections_inspection(scheduled_date);
-CREATE INDEX IF NOT EXISTS idx_inspections_created ON inspections_inspection(created_at);
-CREATE INDEX IF NOT EXISTS idx_inspections_status_date ON inspections_inspection(status, scheduled_date);
-
--- Reports table
-CREATE INDEX IF NOT EXISTS idx_reports_inspection ON reports_report(inspection_id);
-CREATE INDEX IF NOT EXISTS idx_reports_user ON reports_report(generated_by_id);
-CREATE INDEX IF NOT EXISTS idx_reports_status ON reports_report(status);
-CREATE INDEX IF NOT EXISTS idx_reports_created ON reports_report(created_at);
-
--- Notifications table
-CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications_notification(user_id);
-CREATE INDEX IF NOT EXISTS idx_notifications_type ON notifications_notification(notification_type);
-CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications_notification(status);
-CREATE INDEX IF NOT EXISTS idx_notifications_read ON notifications_notification(read_at);
-CREATE INDEX IF NOT EXISTS idx_notifications_user_status ON notifications_notification(user_id, status);
-
--- Composite indexes for common queries
-CREATE INDEX IF NOT EXISTS idx_inspections_user_status_date 
-    ON inspections_inspection(user_id, status, scheduled_date DESC);
-CREATE INDEX IF NOT EXISTS idx_inspections_inspector_status_date 
-    ON inspections_inspection(inspector_id, status, scheduled_date DESC);
-"""
-
-
-def apply_suggested_indexes():
-    """
-    Apply suggested database indexes for better performance.
-    Run this in production after deployment.
-    """
-    with connection.cursor() as cursor:
-        for statement in SUGGESTED_INDEXES.split(';'):
-            statement = statement.strip()
-            if statement:
-                try:
-                    cursor.execute(statement)
-                    logger.info(f"Applied index: {statement[:100]}")
-                except Exception as e:
-                    logger.error(f"Failed to apply index: {e}")
@@ -13,6 +13,7 @@ from django.utils import timezone
 import logging
 import traceback
 from django.conf import settings
+from core.utils.client_ip import get_client_ip
 
 logger = logging.getLogger('django.request')
 
@@ -205,13 +206,3 @@ def is_client_error(exc):
     if hasattr(exc, 'status_code'):
         return 400 <= exc.status_code < 500
     return isinstance(exc, (DjangoValidationError, ValueError))
-
-
-def get_client_ip(request):
-    """Extract client IP from request."""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0].strip()
-    else:
-        ip = request.META.get('REMOTE_ADDR', 'Unknown')
-    return ip
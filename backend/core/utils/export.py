@@ -0,0 +1,49 @@
+"""
+Streaming Exports
+Write large lists as NDJSON or CSV while they are read, so an export of
+hundreds of thousands of rows holds one chunk in memory instead of the
+whole list.
+
+    rows = (serialize(obj) for obj in queryset.iterator(chunk_size=2000))
+    return stream_rows(rows, 'csv', 'clientes')
+"""
+from django.http import StreamingHttpResponse
+import csv
+import json
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class _Echo:
+    """File-like object that hands csv.writer's output back instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+
+
+def _csv_lines(rows):
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(_Echo(), fieldnames=list(row))
+            yield writer.writeheader()
+        yield writer.writerow(row)
+
+
+def stream_rows(rows, export_format, filename):
+    """
+    StreamingHttpResponse for an iterable of dicts in ``export_format``
+    (a key of EXPORT_FORMATS). CSV columns are the keys of the first row.
+    """
+    lines = _ndjson_lines(rows) if export_format == 'ndjson' else _csv_lines(rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -0,0 +1,135 @@
+"""
+Non-Blocking Logging Pipeline
+Moves log formatting and handler I/O off the request thread: after the
+regular ``dictConfig``, the handlers of every configured logger are put
+behind a bounded ``QueueHandler`` drained by a ``QueueListener`` thread.
+
+Enabled with ``LOGGING_CONFIG = 'core.utils.log_pipeline.configure_logging'``
+and tuned with ``LOGGING_QUEUE`` (``ENABLED``, ``MAX_SIZE``).
+"""
+from django.conf import settings
+import atexit
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import threading
+
+_listeners = []
+_lock = threading.Lock()
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller: records are enqueued as-is
+    (formatting happens on the listener thread) and dropped, and counted,
+    when the queue is full
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # In-process queue: no need to pre-format or make the record picklable
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() waits for room in a full queue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def install_queue(logger_names, max_size=10000):
+    """
+    Put the handlers of the given loggers (None = root) behind queues, one
+    queue and listener per distinct set of handlers. Returns the started
+    listeners.
+    """
+    by_handlers = {}
+    started = []
+    with _lock:
+        for name in logger_names:
+            target = logging.getLogger(name)
+            handlers = [
+                handler for handler in target.handlers
+                if not isinstance(handler, logging.handlers.QueueHandler)
+            ]
+            if not handlers:
+                continue
+            key = tuple(id(handler) for handler in handlers)
+            if key not in by_handlers:
+                log_queue = queue.Queue(maxsize=max_size)
+                listener = DrainingQueueListener(
+                    log_queue, *handlers, respect_handler_level=True
+                )
+                listener.start()
+                started.append(listener)
+                by_handlers[key] = BoundedQueueHandler(log_queue)
+            for handler in handlers:
+                target.removeHandler(handler)
+            target.addHandler(by_handlers[key])
+        _listeners.extend(started)
+    return started
+
+
+def stop_listeners():
+    """Flush pending records and stop the listener threads"""
+    with _lock:
+        while _listeners:
+            _listeners.pop().stop()
+
+
+def _restart_listeners():
+    # Threads do not survive fork(): restart them in the child (gunicorn --preload)
+    for listener in _listeners:
+        if listener._thread is not None:
+            listener._thread = None
+            listener.start()
+
+
+def dropped_records():
+    """Records dropped because a queue was full, summed over all queues"""
+    seen = set()
+    total = 0
+    for target in [logging.getLogger()] + [
+        logging.getLogger(name) for name in logging.root.manager.loggerDict
+    ]:
+        for handler in getattr(target, 'handlers', ()):
+            if isinstance(handler, BoundedQueueHandler) and id(handler) not in seen:
+                seen.add(id(handler))
+                total += handler.dropped
+    return total
+
+
+def configure_logging(logging_settings):
+    """``LOGGING_CONFIG`` callable: dictConfig, then queue the handlers"""
+    if not logging_settings:
+        return
+    logging.config.dictConfig(logging_settings)
+
+    options = getattr(settings, 'LOGGING_QUEUE', {})
+    if not options.get('ENABLED', True):
+        return
+    install_queue(
+        [None, *logging_settings.get('loggers', {})],
+        max_size=options.get('MAX_SIZE', 10000),
+    )
+
+
+atexit.register(stop_listeners)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listeners)
@@ -0,0 +1,475 @@
+"""
+Request and Query Metrics
+Query counting through ``connection.execute_wrapper`` (works with
+DEBUG=False, unlike ``connection.queries``) and per-endpoint latency
+histograms exposed in the Prometheus text format.
+
+Each worker observes into its own registry. With django-redis as the
+default cache, workers add what they observed to one Redis hash every
+``METRICS['FLUSH_INTERVAL']`` seconds and /metrics renders that hash, so
+whichever worker answers a scrape reports the totals of all of them.
+Without Redis (LocMem in development) /metrics is the one process's counts.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds (Prometheus ``le``), the last bucket is +Inf
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.4, 0.6,
+    1.0, 1.5, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+QUANTILES = (0.5, 0.95, 0.99)
+
+SLOW_QUERY_SECONDS = 0.1
+
+
+class QueryStats:
+    """
+    ``execute_wrapper`` callable counting queries and DB time.
+    Keeps the SQL of slow queries only, so it is cheap in production.
+    """
+
+    def __init__(self, slow_query_seconds=SLOW_QUERY_SECONDS):
+        self.count = 0
+        self.duration = 0.0
+        self.slow_queries = []
+        self.slow_query_seconds = slow_query_seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed >= self.slow_query_seconds:
+                self.slow_queries.append((elapsed, sql))
+
+
+_current = threading.local()
+
+
+def _dispatch_query(execute, sql, params, many, context):
+    """Execute wrapper installed once per connection; reports to the active tracker"""
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def _install_wrappers():
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if _dispatch_query not in wrappers:
+            wrappers.append(_dispatch_query)
+
+
+@contextmanager
+def track_queries(request=None):
+    """
+    Count the queries run inside the block on every database alias.
+
+    A dispatching wrapper is installed once per (thread-local) connection,
+    so entering the block only swaps the active tracker. With a
+    ``request``, the stats are shared through ``request.query_stats`` so
+    nested middlewares reuse the outer tracker.
+    """
+    stats = getattr(request, 'query_stats', None)
+    if stats is not None:
+        yield stats
+        return
+
+    stats = QueryStats()
+    if request is not None:
+        request.query_stats = stats
+    _install_wrappers()
+    previous = getattr(_current, 'stats', None)
+    _current.stats = stats
+    try:
+        yield stats
+    finally:
+        _current.stats = previous
+
+
+class Histogram:
+    """Cumulative-bucket histogram with quantile estimation"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """``(upper_bound, cumulative_count)`` pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation inside its bucket
+        (same method as PromQL ``histogram_quantile``)
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower = 0.0
+        previous = 0
+        for bound, cumulative in self.cumulative():
+            if cumulative >= rank:
+                if bound == float('inf'):
+                    return lower
+                in_bucket = cumulative - previous
+                fraction = (rank - previous) / in_bucket if in_bucket else 0
+                return lower + (bound - lower) * fraction
+            lower, previous = bound, cumulative
+        return lower
+
+
+class RedisMetricsStore:
+    """
+    Totals of every worker in one Redis hash (field -> count or sum), added
+    to with HINCRBY; gauges in one hash per worker that expires with it
+    """
+
+    KEY = 'metrics'
+
+    def __init__(self, redis, worker_ttl):
+        from django.core.cache import cache
+        self.redis = redis
+        self.worker_ttl = worker_ttl
+        self.key = cache.make_key(self.KEY)
+        self.workers_key = cache.make_key(f'{self.KEY}:workers')
+
+    def gauges_key(self, worker):
+        return f'{self.key}:gauges:{worker}'
+
+    def add(self, fields, gauges, worker):
+        """Add ``fields`` to the totals and replace ``worker``'s gauges, in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        for field, value in fields.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(self.key, field, value)
+            else:
+                pipe.hincrby(self.key, field, value)
+        if gauges:
+            pipe.hset(self.gauges_key(worker), mapping=gauges)
+            pipe.expire(self.gauges_key(worker), self.worker_ttl)
+        pipe.zadd(self.workers_key, {worker: time.time()})
+        pipe.execute()
+
+    def load(self):
+        """``(fields, gauges)``: the totals, and the gauges summed over live workers"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(self.key)
+        pipe.zremrangebyscore(self.workers_key, 0, time.time() - self.worker_ttl)
+        pipe.zrange(self.workers_key, 0, -1)
+        totals, _, workers = pipe.execute()
+
+        gauges = {}
+        if workers:
+            pipe = self.redis.pipeline(transaction=False)
+            for worker in workers:
+                pipe.hgetall(self.gauges_key(worker.decode()))
+            for values in pipe.execute():
+                for name, value in values.items():
+                    name = name.decode()
+                    gauges[name] = gauges.get(name, 0) + float(value)
+
+        fields = {}
+        for field, value in totals.items():
+            field = field.decode()
+            fields[field] = float(value) if field.endswith('|sum') else int(value)
+        return fields, gauges
+
+
+class MetricsRegistry:
+    """
+    Per-endpoint request latency, query count and DB time histograms, plus
+    process counters and gauges registered by other modules.
+
+    With a shared ``store`` the histograms only hold what this worker
+    observed since its last flush: a background thread adds them to the
+    store every ``flush_interval`` seconds, and ``render`` flushes and then
+    renders the totals of all workers.
+    """
+
+    # Histogram attribute -> buckets
+    HISTOGRAMS = {
+        'latency': LATENCY_BUCKETS,
+        'db_time': LATENCY_BUCKETS,
+        'queries': QUERY_COUNT_BUCKETS,
+        'transactions': LATENCY_BUCKETS,
+    }
+
+    def __init__(self, store=None, flush_interval=5.0):
+        self._lock = threading.Lock()
+        self.store = store
+        self.flush_interval = flush_interval
+        self.counters = {}
+        self.gauges = {}
+        self._flushed = {}
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._reset_histograms()
+
+    def _reset_histograms(self):
+        self.latency = {}
+        self.db_time = {}
+        self.queries = {}
+        self.responses = {}
+        self.transactions = {}
+
+    def register_counter(self, name, help_text, read):
+        """Export ``read()``, a per-process running total, as a counter"""
+        self.counters[name] = (help_text, read)
+
+    def register_gauge(self, name, help_text, read):
+        """Export ``read()`` as a gauge (summed over workers)"""
+        self.gauges[name] = (help_text, read)
+
+    def observe_request(self, endpoint, method, status, duration, query_count, db_time):
+        self._ensure_flusher()
+        status_class = f"{status // 100}xx"
+        with self._lock:
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.db_time[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.queries[endpoint] = Histogram(QUERY_COUNT_BUCKETS)
+            self.latency[endpoint].observe(duration)
+            self.db_time[endpoint].observe(db_time)
+            self.queries[endpoint].observe(query_count)
+            key = (endpoint, method, status_class)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def observe_transaction(self, endpoint, duration):
+        self._ensure_flusher()
+        with self._lock:
+            if endpoint not in self.transactions:
+                self.transactions[endpoint] = Histogram(LATENCY_BUCKETS)
+            self.transactions[endpoint].observe(duration)
+
+    def summary(self, endpoint):
+        """Request count and p50/p95/p99 latency (seconds) of an endpoint in this registry"""
+        histogram = self.latency.get(endpoint)
+        if histogram is None:
+            return None
+        return {
+            'count': histogram.count,
+            **{f'p{int(q * 100)}': histogram.quantile(q) for q in QUANTILES},
+        }
+
+    # Shared store
+
+    def _ensure_flusher(self):
+        # Also restarts the thread in forked workers, where it does not survive
+        if self.store is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush error: {e}")
+
+    def flush(self):
+        """Add what this worker observed since the last flush to the store"""
+        if self.store is None:
+            return
+        # One flush at a time, or counter deltas would be added twice
+        with self._flush_lock:
+            counters = {name: read() for name, (_, read) in self.counters.items()}
+            gauges = {name: read() for name, (_, read) in self.gauges.items()}
+            with self._lock:
+                fields = self._fields()
+                self._reset_histograms()
+            for name, value in counters.items():
+                delta = value - self._flushed.get(name, 0)
+                if delta < 0:
+                    # The source was recreated and counts from zero again
+                    delta = value
+                if delta:
+                    fields[f'c|{name}'] = delta
+            try:
+                self.store.add(fields, gauges, worker_id())
+            except Exception:
+                # Kept for the next flush
+                with self._lock:
+                    self._absorb({field: value for field, value in fields.items() if not field.startswith('c|')})
+                raise
+            self._flushed.update(counters)
+
+    def _fields(self):
+        """Flat ``{field: value}`` view of the histograms and response counters"""
+        fields = {}
+        for attr in self.HISTOGRAMS:
+            for endpoint, data in getattr(self, attr).items():
+                for index, count in enumerate(data.counts):
+                    if count:
+                        fields[f'h|{attr}|{endpoint}|{index}'] = count
+                fields[f'h|{attr}|{endpoint}|sum'] = float(data.sum)
+                fields[f'h|{attr}|{endpoint}|count'] = data.count
+        for (endpoint, method, status_class), count in self.responses.items():
+            fields[f'r|{endpoint}|{method}|{status_class}'] = count
+        return fields
+
+    def _absorb(self, fields):
+        """Add flat fields (see ``_fields``) to the histograms and response counters"""
+        for field, value in fields.items():
+            kind, rest = field.split('|', 1)
+            if kind == 'h':
+                attr, rest = rest.split('|', 1)
+                endpoint, part = rest.rsplit('|', 1)
+                histograms = getattr(self, attr)
+                if endpoint not in histograms:
+                    histograms[endpoint] = Histogram(self.HISTOGRAMS[attr])
+                data = histograms[endpoint]
+                if part == 'sum':
+                    data.sum += value
+                elif part == 'count':
+                    data.count += value
+                else:
+                    data.counts[int(part)] += value
+            elif kind == 'r':
+                key = tuple(rest.rsplit('|', 2))
+                self.responses[key] = self.responses.get(key, 0) + value
+
+    # Exposition
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4): the totals of all
+        workers with a shared store, this process's otherwise
+        """
+        if self.store is None:
+            counters = {name: read() for name, (_, read) in self.counters.items()}
+            gauges = {name: read() for name, (_, read) in self.gauges.items()}
+            with self._lock:
+                return self._render(self, counters, gauges)
+
+        self.flush()
+        fields, gauges = self.store.load()
+        merged = MetricsRegistry()
+        merged._absorb(fields)
+        counters = {name: fields.get(f'c|{name}', 0) for name in self.counters}
+        return self._render(merged, counters, {name: gauges.get(name, 0) for name in self.gauges})
+
+    def _render(self, source, counters, gauges):
+        lines = []
+
+        def labels(**values):
+            return ','.join(f'{name}="{escape(value)}"' for name, value in values.items())
+
+        def histogram(name, help_text, histograms):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for endpoint, data in sorted(histograms.items()):
+                for bound, cumulative in data.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_bucket{{{labels(endpoint=endpoint, le=le)}}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels(endpoint=endpoint)}}} {data.sum}')
+                lines.append(f'{name}_count{{{labels(endpoint=endpoint)}}} {data.count}')
+
+        lines.append('# HELP http_responses_total Responses by endpoint, method and status class')
+        lines.append('# TYPE http_responses_total counter')
+        for (endpoint, method, status_class), count in sorted(source.responses.items()):
+            lines.append(
+                f'http_responses_total{{{labels(endpoint=endpoint, method=method, status=status_class)}}} {count}'
+            )
+
+        histogram('http_request_duration_seconds', 'Request latency by endpoint', source.latency)
+
+        lines.append('# HELP http_request_latency_seconds Estimated latency quantiles by endpoint')
+        lines.append('# TYPE http_request_latency_seconds summary')
+        for endpoint, data in sorted(source.latency.items()):
+            for q in QUANTILES:
+                lines.append(
+                    f'http_request_latency_seconds{{{labels(endpoint=endpoint, quantile=str(q))}}} '
+                    f'{data.quantile(q)}'
+                )
+
+        histogram('db_query_duration_seconds', 'Database time per request by endpoint', source.db_time)
+        histogram('db_queries_per_request', 'Database queries per request by endpoint', source.queries)
+        histogram(
+            'db_transaction_duration_seconds',
+            'Time request transactions stay open, commit included, by endpoint',
+            source.transactions,
+        )
+
+        for kind, sources, values in (('counter', self.counters, counters), ('gauge', self.gauges, gauges)):
+            for name, (help_text, _) in sources.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {values[name]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def endpoint_name(request):
+    """Resolved URL name of a request, so metrics are not split per object id"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shared_store():
+    """
+    RedisMetricsStore on the default cache's Redis, or None when it is not
+    django-redis (LocMem in development: one process, nothing to share)
+    """
+    try:
+        from django_redis import get_redis_connection
+        redis = get_redis_connection('default')
+    except Exception:
+        return None
+    options = getattr(settings, 'METRICS', {})
+    return RedisMetricsStore(redis, worker_ttl=options.get('WORKER_TTL', 60))
+
+
+def _build_registry():
+    options = getattr(settings, 'METRICS', {})
+    return MetricsRegistry(store=shared_store(), flush_interval=options.get('FLUSH_INTERVAL', 5.0))
+
+
+registry = _build_registry()
@@ -0,0 +1,165 @@
+"""
+Keyset Pagination
+Page-number pagination for existing clients, plus a cursor mode that seeks
+on a composite key instead of counting and skipping rows, so every page
+costs the same however deep it is.
+
+    GET /api/inspections/?page=3                        offset mode (unchanged)
+    GET /api/inspections/?cursor=&page_size=50          first keyset page
+    GET /api/inspections/?cursor=<next cursor>          following pages
+
+The key is the view's (or the paginator's) ``keyset_ordering``, by default
+``('-created_at', '-id')``. Its fields (model fields or annotations) must be
+non-null, all in the same direction, and end with a unique field; back it
+with a matching composite index. Cursor mode uses that ordering and ignores
+``?ordering=``. Offset pages only carry ``next_cursor`` when they are sorted
+by the key, since a cursor taken from another order would skip or repeat
+rows; a queryset left in a model ordering that the key refines (e.g.
+``-created_at`` for the default key) gets the key as a tie-breaker.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+import json
+
+DEFAULT_KEYSET_ORDERING = ('-created_at', '-id')
+
+
+def _row(*expressions):
+    return Func(*expressions, function='ROW', output_field=Field())
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    PageNumberPagination (``?page=``) with an opt-in keyset mode (``?cursor=``).
+    Offset pages in key order also return ``next_cursor`` so clients can
+    switch over.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = api_settings.user_settings.get('MAX_PAGE_SIZE', 100)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+    keyset_ordering = DEFAULT_KEYSET_ORDERING
+
+    @classmethod
+    def requested(cls, request):
+        """Whether the client asked for a page (for endpoints that were unpaginated)"""
+        params = request.query_params
+        return any(
+            name in params
+            for name in (cls.cursor_query_param, cls.page_query_param, cls.page_size_query_param)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.keyset_ordering))
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            queryset = self.tie_break(queryset)
+            page = super().paginate_queryset(queryset, request, view)
+            in_key_order = tuple(queryset.query.order_by) == self.ordering
+            self.next_cursor = (
+                self.encode_cursor(page[-1]) if in_key_order and page and self.page.has_next() else None
+            )
+            return page
+        return self.paginate_keyset(queryset, request)
+
+    def tie_break(self, queryset):
+        """Order by the key when the queryset only has a model ordering the key extends"""
+        query = queryset.query
+        default = tuple(queryset.model._meta.ordering)
+        if query.order_by or not query.default_ordering or not default:
+            return queryset
+        if default != self.ordering[:len(default)]:
+            return queryset
+        return queryset.order_by(*self.ordering)
+
+    def paginate_keyset(self, queryset, request):
+        page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        cursor = request.query_params.get(self.cursor_query_param)
+        values, reverse = self.decode_cursor(queryset, cursor) if cursor else (None, False)
+
+        descending = self.ordering[0].startswith('-')
+        fields = [name.lstrip('-') for name in self.ordering]
+        # Going back: walk the key in the opposite direction, then flip the page
+        forward_descending = descending != reverse
+        ordering = [f"-{name}" if forward_descending else name for name in fields]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            lookup = LessThan if forward_descending else GreaterThan
+            queryset = queryset.filter(lookup(
+                _row(*(F(name) for name in fields)),
+                _row(*(Value(value) for value in values)),
+            ))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = bool(rows) and (has_more or reverse)
+        self.has_previous = bool(rows) and (values is not None) and (has_more or not reverse)
+        self.first_row = rows[0] if rows else None
+        self.last_row = rows[-1] if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return Response(OrderedDict([
+                ('count', self.page.paginator.count),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('next_cursor', self.next_cursor),
+                ('results', data),
+            ]))
+        return Response(OrderedDict([
+            ('next', self.get_keyset_link(self.last_row) if self.has_next else None),
+            ('previous', self.get_keyset_link(self.first_row, reverse=True) if self.has_previous else None),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['next_cursor'] = {'type': 'string', 'nullable': True}
+        return response
+
+    def get_keyset_link(self, row, reverse=False):
+        url = remove_query_param(self.base_url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def encode_cursor(self, row, reverse=False):
+        values = []
+        for name in self.ordering:
+            value = getattr(row, name.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        payload = json.dumps([values, reverse], separators=(',', ':')).encode()
+        return urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, queryset, cursor):
+        """``(typed key values, reverse)`` from a cursor, or 404 if malformed"""
+        annotations = queryset.query.annotations
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values, reverse = json.loads(urlsafe_b64decode(padded))
+            if len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            fields = [name.lstrip('-') for name in self.ordering]
+            return [
+                (
+                    annotations[name].output_field if name in annotations
+                    else queryset.model._meta.get_field(name)
+                ).to_python(value)
+                for name, value in zip(fields, values)
+            ], bool(reverse)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,167 @@
+"""
+Sliding-Window Rate Limiting
+Atomic per-request counters in Redis (one round trip) with an in-process
+fallback while Redis is unavailable.
+
+The sliding window is approximated from two fixed windows: the current
+window's count plus the previous window's count weighted by how much of it
+still overlaps the sliding window.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# INCR the current window (setting its TTL on creation) and read the
+# previous one, atomically and in a single round trip
+SLIDING_WINDOW_SCRIPT = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+local previous = redis.call('GET', KEYS[2])
+return {current, tonumber(previous or '0')}
+"""
+
+
+def parse_rate(rate):
+    """
+    Parse a DRF-style rate (``'100/minute'``, ``'5/h'``) into
+    ``(requests, window_seconds)``; ``None`` means unlimited
+    """
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+class LocalSlidingWindow:
+    """
+    In-process counters with the same algorithm as the Redis script.
+    Per worker, so limits are approximate while it is in use.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key, window, now):
+        """Count a request; returns ``(current, previous)`` window counts"""
+        index = int(now // window)
+        with self._lock:
+            current = self._counts.get((key, window, index), 0) + 1
+            self._counts[(key, window, index)] = current
+            previous = self._counts.get((key, window, index - 1), 0)
+            self._hits += 1
+            if self._hits % self.PURGE_EVERY == 0:
+                self._purge(now)
+        return current, previous
+
+    def _purge(self, now):
+        expired = [
+            entry for entry in self._counts
+            if entry[2] < int(now // entry[1]) - 1
+        ]
+        for entry in expired:
+            del self._counts[entry]
+
+
+class SlidingWindowRateLimiter:
+    """
+    Rate limiter backed by Redis when the default cache is django-redis,
+    by ``LocalSlidingWindow`` otherwise or while Redis is failing
+    """
+
+    KEY_PREFIX = 'rate_limit'
+    RETRY_REDIS_AFTER = 5  # seconds on the local fallback after a Redis error
+
+    def __init__(self, redis=None):
+        self.local = LocalSlidingWindow()
+        self._redis = redis if redis is not None else self._redis_connection()
+        self._script = self._redis.register_script(SLIDING_WINDOW_SCRIPT) if self._redis is not None else None
+        self._redis_down_until = 0
+
+    @staticmethod
+    def _redis_connection():
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+        except Exception:
+            # Not a django-redis cache (LocMem in development)
+            return None
+
+    def _counts(self, key, window, now):
+        index = int(now // window)
+        if self._script is not None and now >= self._redis_down_until:
+            try:
+                current, previous = self._script(
+                    keys=[
+                        cache.make_key(f"{self.KEY_PREFIX}:{key}:{window}:{index}"),
+                        cache.make_key(f"{self.KEY_PREFIX}:{key}:{window}:{index - 1}"),
+                    ],
+                    args=[window * 2],
+                )
+                return int(current), int(previous)
+            except Exception as e:
+                self._redis_down_until = now + self.RETRY_REDIS_AFTER
+                logger.error(f"Rate limit Redis error, using local counters: {e}")
+        return self.local.hit(key, window, now)
+
+    def hit(self, key, limit, window, now=None):
+        """
+        Count one request for ``key`` against ``limit`` per ``window`` seconds.
+
+        Returns:
+            ``(allowed, retry_after_seconds)``
+        """
+        now = time.time() if now is None else now
+        current, previous = self._counts(key, window, now)
+        elapsed = (now % window) / window
+        estimated = previous * (1 - elapsed) + current
+        if estimated <= limit:
+            return True, 0
+        return False, max(1, int(window - now % window))
+
+
+class RateLimitPolicy:
+    """
+    Resolve the limit of a request from ``settings.RATE_LIMITS``:
+    route (URL name) and role first, then the route default, the role
+    default and the global default
+    """
+
+    def __init__(self, config=None):
+        config = config if config is not None else getattr(settings, 'RATE_LIMITS', {})
+        self.enabled = config.get('ENABLED', True)
+        self.default = config.get('DEFAULT')
+        self.roles = config.get('ROLES', {})
+        self.routes = config.get('ROUTES', {})
+        self._cache = {}
+
+    def limit_for(self, route, role):
+        """Return ``(requests, window_seconds)`` or None when unlimited"""
+        cache_key = (route, role)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = parse_rate(self._rate_for(route, role))
+        return self._cache[cache_key]
+
+    def _rate_for(self, route, role):
+        route_rate = self.routes.get(route)
+        if isinstance(route_rate, dict):
+            if role in route_rate:
+                return route_rate[role]
+            if 'DEFAULT' in route_rate:
+                return route_rate['DEFAULT']
+        elif route_rate is not None:
+            return route_rate
+        if role in self.roles:
+            return self.roles[role]
+        return self.default
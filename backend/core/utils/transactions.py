@@ -0,0 +1,74 @@
+"""
+Request Transaction Policy
+Replaces the blanket ``ATOMIC_REQUESTS`` wrapping with a per-request decision:
+
+- GET, HEAD and OPTIONS run in autocommit mode, so list and dashboard
+  endpoints do not hold a transaction open while serializing responses.
+- Other methods keep one transaction per request, unless the view opts out
+  with ``transaction.non_atomic_requests`` or, for DRF viewsets, lists the
+  action in ``non_atomic_actions``. Views doing slow non-DB work (PDF
+  rendering, email) opt out and keep their own transactions short.
+
+Transaction open time, commit included, is recorded per endpoint in the
+metrics registry (``db_transaction_duration_seconds``). The policy is
+installed by the handlers below, used in core.wsgi and core.asgi.
+"""
+from contextlib import ExitStack
+from functools import wraps
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections, transaction
+from asgiref.sync import iscoroutinefunction
+from core.utils.metrics import endpoint_name, registry
+import time
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def apply_transaction_policy(view):
+    """Wrap a resolved view the way ``make_view_atomic`` would, per request"""
+    non_atomic_requests = getattr(view, '_non_atomic_requests', set())
+    aliases = [
+        alias for alias, settings_dict in connections.settings.items()
+        if settings_dict.get('ATOMIC_REQUESTS') and alias not in non_atomic_requests
+    ]
+    if not aliases:
+        return view
+
+    # DRF's as_view() exposes the viewset class and its method -> action map
+    non_atomic_actions = getattr(getattr(view, 'cls', None), 'non_atomic_actions', ())
+    actions = getattr(view, 'actions', None) or {}
+
+    @wraps(view)
+    def policy_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS or actions.get(request.method.lower()) in non_atomic_actions:
+            return view(request, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in aliases:
+                    stack.enter_context(transaction.atomic(using=alias))
+                return view(request, *args, **kwargs)
+        finally:
+            registry.observe_transaction(endpoint_name(request), time.perf_counter() - start)
+
+    return policy_view
+
+
+class TransactionPolicyMixin:
+    """Handler mixin applying the transaction policy instead of ATOMIC_REQUESTS"""
+
+    def make_view_atomic(self, view):
+        if iscoroutinefunction(view):
+            # Let Django reject async views under ATOMIC_REQUESTS as usual
+            return super().make_view_atomic(view)
+        return apply_transaction_policy(view)
+
+
+class TransactionPolicyWSGIHandler(TransactionPolicyMixin, WSGIHandler):
+    pass
+
+
+class TransactionPolicyASGIHandler(TransactionPolicyMixin, ASGIHandler):
+    pass
@@ -0,0 +1,56 @@
+"""
+Core views
+"""
+import logging
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from core.utils.audit import get_audit_writer
+from core.utils.log_pipeline import dropped_records
+from core.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Per-process counters; the registry adds them up across workers
+registry.register_counter(
+    'logging_dropped_records_total', 'Log records dropped because the log queue was full', dropped_records
+)
+registry.register_counter(
+    'audit_events_enqueued_total', 'Audit events queued for writing', lambda: get_audit_writer().enqueued
+)
+registry.register_counter(
+    'audit_events_dropped_total', 'Audit events dropped because the audit queue was full',
+    lambda: get_audit_writer().dropped,
+)
+registry.register_counter(
+    'audit_events_written_total', 'Audit events written to the database', lambda: get_audit_writer().written
+)
+registry.register_counter(
+    'audit_events_failed_total', 'Audit events lost to failed batch writes', lambda: get_audit_writer().failed
+)
+registry.register_gauge('audit_queue_depth', 'Audit events waiting to be written', lambda: get_audit_writer().depth)
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+    Requires ``Authorization: Bearer <METRICS_TOKEN>`` when METRICS_TOKEN is
+    set; without a token it is only served in DEBUG.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        provided = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        if not constant_time_compare(provided, token):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    
+    try:
+        body = registry.render()
+    except Exception as e:
+        # Partial numbers would look like counter resets: fail the scrape instead
+        logger.error(f"Metrics render error: {e}")
+        return HttpResponse(status=503)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_wsgi_application()
+# Same as get_wsgi_application(), with read-only requests in autocommit
+# mode (see core.utils.transactions)
+django.setup(set_prefix=False)
+
+from core.utils.transactions import TransactionPolicyWSGIHandler  # noqa: E402
+
+application = TransactionPolicyWSGIHandler()
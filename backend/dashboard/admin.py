@@ -2,7 +2,7 @@
 Admin configuration for Dashboard app
 """
 from django.contrib import admin
-from .models import DashboardCache
+from .models import DashboardCache, DashboardRollup
 
 
 @admin.register(DashboardCache)
@@ -18,3 +18,16 @@ class DashboardCacheAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at']
     
     date_hierarchy = 'created_at'
+
+
+@admin.register(DashboardRollup)
+class DashboardRollupAdmin(admin.ModelAdmin):
+    """Admin interface for DashboardRollup model"""
+    
+    list_display = ['source', 'day', 'status', 'result', 'gas_type', 'inspector', 'count']
+    
+    list_filter = ['source', 'status', 'result', 'gas_type']
+    
+    readonly_fields = ['updated_at']
+    
+    date_hierarchy = 'day'
@@ -0,0 +1,166 @@
+"""
+Index advisor: replay captured queries through EXPLAIN and report
+sequential scans on large tables
+
+Accepted log formats (one statement per line, mixed freely):
+    - django.db.backends debug lines, plain or JSON (``message`` field):
+      ``(0.012) SELECT ...; args=(...); alias=default``
+    - PostgreSQL ``log_min_duration_statement`` lines:
+      ``... LOG:  duration: 12.3 ms  statement: SELECT ...``
+    - bare SQL statements
+
+Only single SELECT statements are replayed, each with plain EXPLAIN in a
+read-only transaction that is rolled back.
+
+Usage:
+    python manage.py index_advisor logs/django.log --min-rows 10000
+"""
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+import json
+import re
+
+DJANGO_SQL = re.compile(r'^\((?P<duration>[\d.]+)\) (?P<sql>.*?); args=.*; alias=\w+$')
+POSTGRES_SQL = re.compile(r'duration: (?P<duration>[\d.]+) ms\s+(?:statement|execute [^:]*): (?P<sql>.*)$')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+
+def extract_statement(line):
+    """``(sql, duration_ms)`` from one log line, or None"""
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            line = json.loads(line).get('message', '')
+        except ValueError:
+            return None
+    for pattern, scale in ((DJANGO_SQL, 1000), (POSTGRES_SQL, 1)):
+        match = pattern.search(line)
+        if match:
+            return match.group('sql').strip(), float(match.group('duration')) * scale
+    if line.upper().startswith('SELECT '):
+        return line.rstrip(';'), 0.0
+    return None
+
+
+def is_single_statement(sql):
+    """False when ``sql`` has a ``;`` outside string literals and quoted names"""
+    return ';' not in QUOTED.sub('', sql)
+
+
+def fingerprint(sql):
+    """Statement shape with literals removed, to group repeated queries"""
+    return ' '.join(LITERALS.sub('?', sql).split())
+
+
+def sequential_scans(plan):
+    """Yield the Seq Scan nodes of an EXPLAIN (FORMAT JSON) plan tree"""
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan
+    for child in plan.get('Plans', ()):
+        yield from sequential_scans(child)
+
+
+class Command(BaseCommand):
+    help = 'Report sequential scans on large tables for the queries of captured logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('logfiles', nargs='+', help='Query log files to replay')
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='Only report tables with at least this many (estimated) rows')
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--limit', type=int, default=20, help='Maximum number of findings')
+
+    def handle(self, *args, **options):
+        queries = {}
+        counts = Counter()
+        durations = Counter()
+        rejected = 0
+        for path in options['logfiles']:
+            try:
+                with open(path, encoding='utf-8', errors='replace') as logfile:
+                    for line in logfile:
+                        statement = extract_statement(line)
+                        if statement is None or not statement[0].upper().startswith('SELECT'):
+                            continue
+                        sql, duration = statement
+                        # Log lines are untrusted: never hand the driver more than one statement
+                        if not is_single_statement(sql):
+                            rejected += 1
+                            continue
+                        key = fingerprint(sql)
+                        queries.setdefault(key, sql)
+                        counts[key] += 1
+                        durations[key] += duration
+            except OSError as e:
+                raise CommandError(f"Cannot read {path}: {e}")
+
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('index_advisor needs a PostgreSQL database')
+
+        findings = {}
+        failed = 0
+        with connection.cursor() as cursor:
+            table_rows = self.table_rows(cursor)
+            for key, sql in queries.items():
+                try:
+                    # Plain EXPLAIN: the statement is planned, never executed.
+                    # The savepoint keeps one bad statement from aborting the
+                    # rest; it is read-only and always rolled back.
+                    with transaction.atomic(using=options['database']):
+                        cursor.execute('SET TRANSACTION READ ONLY')
+                        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                        plan = cursor.fetchone()[0]
+                        transaction.set_rollback(True, using=options['database'])
+                except DatabaseError:
+                    failed += 1
+                    continue
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                for node in sequential_scans(plan[0]['Plan']):
+                    table = node.get('Relation Name')
+                    rows = table_rows.get(table, 0)
+                    if rows < options['min_rows']:
+                        continue
+                    finding = findings.setdefault((table, node.get('Filter', '')), {
+                        'table': table,
+                        'rows': rows,
+                        'filter': node.get('Filter', ''),
+                        'queries': 0,
+                        'time_ms': 0.0,
+                        'example': sql,
+                    })
+                    finding['queries'] += counts[key]
+                    finding['time_ms'] += durations[key]
+
+        self.stdout.write(
+            f"{sum(counts.values())} statements, {len(queries)} distinct, "
+            f"{failed} could not be explained"
+        )
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"{rejected} multi-statement lines rejected"))
+        if not findings:
+            self.stdout.write(self.style.SUCCESS('No sequential scans on large tables'))
+            return
+
+        ranked = sorted(findings.values(), key=lambda f: (f['time_ms'], f['queries']), reverse=True)
+        for finding in ranked[:options['limit']]:
+            self.stdout.write(self.style.WARNING(
+                f"Seq Scan on {finding['table']} (~{finding['rows']:,} rows): "
+                f"{finding['queries']} queries, {finding['time_ms']:.1f} ms logged"
+            ))
+            if finding['filter']:
+                self.stdout.write(f"  Filter: {finding['filter']}")
+            self.stdout.write(f"  Example: {finding['example'][:300]}")
+
+    @staticmethod
+    def table_rows(cursor):
+        """Planner row estimates of the user tables"""
+        cursor.execute(
+            "SELECT c.relname, GREATEST(c.reltuples, 0)::bigint FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind IN ('r', 'p') AND n.nspname NOT IN ('pg_catalog', 'information_schema')"
+        )
+        return dict(cursor.fetchall())
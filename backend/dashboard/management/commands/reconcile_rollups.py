@@ -0,0 +1,18 @@
+"""
+Nightly reconciliation of the dashboard rollup table
+
+Schedule daily (cron, Celery beat...):
+    python manage.py reconcile_rollups
+"""
+from django.core.management.base import BaseCommand
+from dashboard.services import RollupService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DashboardRollup from inspections and appointments, reporting drift'
+
+    def handle(self, *args, **options):
+        result = RollupService.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollups reconciled: {result['buckets']} buckets, {result['drifted']} drifted"
+        ))
@@ -0,0 +1,92 @@
+# Generated by Django 5.0.1 on 2026-10-16 22:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Seed the rollup table from existing inspections and appointments"""
+    Inspection = apps.get_model('inspections', 'Inspection')
+    Appointment = apps.get_model('appointments', 'Appointment')
+    DashboardRollup = apps.get_model('dashboard', 'DashboardRollup')
+
+    rows = [
+        DashboardRollup(
+            source='INSPECTION',
+            day=row['day'],
+            status=row['status'],
+            result=row['result'] or '',
+            gas_type=row['gas_type'] or '',
+            inspector_id=row['inspector_id'],
+            count=row['count'],
+            score_total=row['score_total'],
+            scored_count=row['scored_count'],
+        )
+        for row in Inspection.objects.order_by().annotate(
+            day=TruncDate('created_at')
+        ).values('day', 'status', 'result', 'gas_type', 'inspector_id').annotate(
+            count=Count('pk'),
+            score_total=Sum('total_score', default=0),
+            scored_count=Count('total_score'),
+        )
+    ]
+    rows += [
+        DashboardRollup(
+            source='APPOINTMENT',
+            day=row['scheduled_date'],
+            status=row['status'],
+            inspector_id=row['inspector_id'],
+            count=row['count'],
+        )
+        for row in Appointment.objects.order_by().values(
+            'scheduled_date', 'status', 'inspector_id'
+        ).annotate(count=Count('pk'))
+    ]
+    DashboardRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('inspections', '0004_alter_inspection_neighborhood'),
+        ('appointments', '0004_add_task_type_to_calltask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('INSPECTION', 'Inspección'), ('APPOINTMENT', 'Cita')], max_length=20, verbose_name='Origen')),
+                ('day', models.DateField(verbose_name='Día')),
+                ('status', models.CharField(max_length=20, verbose_name='Estado')),
+                ('result', models.CharField(blank=True, default='', max_length=20, verbose_name='Resultado')),
+                ('gas_type', models.CharField(blank=True, default='', max_length=20, verbose_name='Tipo de gas')),
+                ('count', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('score_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Suma de puntajes')),
+                ('scored_count', models.IntegerField(default=0, verbose_name='Cantidad con puntaje')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+                ('inspector', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Inspector')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de Dashboard',
+                'verbose_name_plural': 'Resúmenes diarios de Dashboard',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['source', 'day'], name='dashboard_d_source_e91452_idx'), models.Index(fields=['source', 'inspector', 'day'], name='dashboard_d_source_2c5c59_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('inspector__isnull', False)), fields=('source', 'day', 'status', 'result', 'gas_type', 'inspector'), name='dashboard_rollup_unique_inspector'),
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('inspector__isnull', True)), fields=('source', 'day', 'status', 'result', 'gas_type'), name='dashboard_rollup_unique_unassigned'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
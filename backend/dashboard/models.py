@@ -48,3 +48,60 @@ class DashboardCache(models.Model):
     
     def __str__(self):
         return f"{self.get_cache_type_display()} - {self.user.email if self.user else 'Global'}"
+
+
+class DashboardRollup(models.Model):
+    """
+    Pre-summed daily counters backing the dashboard and chart endpoints.
+    One row per source x day x status x result x gas type x inspector,
+    maintained incrementally by signals and reconciled nightly.
+    """
+    
+    class Source(models.TextChoices):
+        INSPECTION = 'INSPECTION', 'Inspección'
+        APPOINTMENT = 'APPOINTMENT', 'Cita'
+    
+    source = models.CharField('Origen', max_length=20, choices=Source.choices)
+    day = models.DateField('Día')
+    status = models.CharField('Estado', max_length=20)
+    result = models.CharField('Resultado', max_length=20, blank=True, default='')
+    gas_type = models.CharField('Tipo de gas', max_length=20, blank=True, default='')
+    
+    inspector = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='dashboard_rollups',
+        verbose_name='Inspector',
+        null=True,
+        blank=True
+    )
+    
+    count = models.IntegerField('Cantidad', default=0)
+    score_total = models.DecimalField('Suma de puntajes', max_digits=14, decimal_places=2, default=0)
+    scored_count = models.IntegerField('Cantidad con puntaje', default=0)
+    
+    updated_at = models.DateTimeField('Última actualización', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Resumen diario de Dashboard'
+        verbose_name_plural = 'Resúmenes diarios de Dashboard'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'day', 'status', 'result', 'gas_type', 'inspector'],
+                condition=models.Q(inspector__isnull=False),
+                name='dashboard_rollup_unique_inspector'
+            ),
+            models.UniqueConstraint(
+                fields=['source', 'day', 'status', 'result', 'gas_type'],
+                condition=models.Q(inspector__isnull=True),
+                name='dashboard_rollup_unique_unassigned'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['source', 'day']),
+            models.Index(fields=['source', 'inspector', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_source_display()} {self.day} {self.status} ({self.count})"
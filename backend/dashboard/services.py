@@ -0,0 +1,337 @@
+"""
+Dashboard Aggregation Service
+Computes every inspection breakdown for a scope in a single query, either
+from the live tables or from the incrementally maintained daily rollups
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import date, datetime, time, timedelta
+from core.utils.aggregation import aggregate_breakdowns
+from appointments.models import Appointment
+from inspections.models import Inspection
+from .models import DashboardRollup
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InspectionStatsService:
+    """
+    Scoped inspection statistics (global, per inspector, per user)
+    """
+
+    BREAKDOWNS = {
+        'status': Inspection.Status.choices,
+        'result': Inspection.Result.choices,
+        'gas_type': Inspection.GasType.choices,
+    }
+
+    @staticmethod
+    def scope(inspector=None, user=None):
+        """Return the inspection queryset for a dashboard scope"""
+        queryset = Inspection.objects.all()
+        if inspector is not None:
+            queryset = queryset.filter(inspector=inspector)
+        if user is not None:
+            queryset = queryset.filter(user=user)
+        return queryset
+
+    # Windows are whole local calendar days, the unit of DashboardRollup.day,
+    # so live and rollup counts agree whichever DASHBOARD_USE_ROLLUPS picks
+
+    @staticmethod
+    def day_start(day):
+        """Aware datetime of the local midnight that starts ``day``"""
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    @classmethod
+    def date_range(cls, date_field, start, end=None, dates=False):
+        """
+        Q for ``start <= date_field < end`` over local days; ``dates`` when
+        the field holds dates rather than datetimes
+        """
+        bound = (lambda day: day) if dates else cls.day_start
+        condition = Q(**{f'{date_field}__gte': bound(start)})
+        if end is not None:
+            condition &= Q(**{f'{date_field}__lt': bound(end)})
+        return condition
+
+    @staticmethod
+    def recent_start(days=30):
+        """First local day of the "last ``days`` days" window"""
+        return timezone.localdate() - timedelta(days=days)
+
+    @staticmethod
+    def monthly_windows(months):
+        """
+        Return ``(label, first_day, next_first_day)`` local calendar months
+        for the last ``months`` months, oldest first
+        """
+        today = timezone.localdate()
+        windows = []
+        for offset in range(months - 1, -1, -1):
+            year, month = divmod(today.year * 12 + today.month - 1 - offset, 12)
+            start = date(year, month + 1, 1)
+            year, month = divmod(year * 12 + month + 1, 12)
+            windows.append((start.strftime('%b %Y'), start, date(year, month + 1, 1)))
+        return windows
+
+    @classmethod
+    def monthly_counts(cls, date_field, months, measure=None, dates=False):
+        """
+        Build one filtered Count (or Sum of ``measure``) per monthly window,
+        keyed ``month_<n>``
+        """
+        def expression(start, end):
+            condition = cls.date_range(date_field, start, end, dates=dates)
+            if measure:
+                return Sum(measure, filter=condition, default=0)
+            return Count('pk', filter=condition)
+
+        return {
+            f'month_{index}': expression(start, end)
+            for index, (_label, start, end) in enumerate(cls.monthly_windows(months))
+        }
+
+    @classmethod
+    def monthly_series(cls, data, months):
+        """Turn ``month_<n>`` aggregates back into a chart series"""
+        return [
+            {'month': label, 'count': data[f'month_{index}']}
+            for index, (label, _start, _end) in enumerate(cls.monthly_windows(months))
+        ]
+
+    @classmethod
+    def summary(cls, queryset, **extra):
+        """
+        Totals, average score and status/result/gas-type breakdowns in one query
+        """
+        return aggregate_breakdowns(
+            queryset,
+            cls.BREAKDOWNS,
+            total=Count('pk'),
+            avg_score=Avg('total_score'),
+            **extra
+        )
+
+    @classmethod
+    def rollup_summary(cls, **extra):
+        """
+        Same shape as ``summary()`` for the global scope, read from the
+        pre-summed daily rollups instead of scanning every inspection
+        """
+        data = aggregate_breakdowns(
+            DashboardRollup.objects.filter(source=DashboardRollup.Source.INSPECTION),
+            cls.BREAKDOWNS,
+            measure='count',
+            total=Sum('count', default=0),
+            score_total=Sum('score_total', default=0),
+            scored_count=Sum('scored_count', default=0),
+            **extra
+        )
+        scored = data.pop('scored_count')
+        score_total = data.pop('score_total')
+        data['avg_score'] = score_total / scored if scored else None
+        return data
+
+
+class RollupService:
+    """
+    Incremental maintenance and nightly reconciliation of DashboardRollup
+    """
+
+    KEY_FIELDS = ('source', 'day', 'status', 'result', 'gas_type', 'inspector_id')
+
+    INSPECTION_FIELDS = ('created_at', 'status', 'result', 'gas_type', 'inspector_id', 'total_score')
+    APPOINTMENT_FIELDS = ('scheduled_date', 'status', 'inspector_id')
+
+    @staticmethod
+    def inspection_snapshot(values):
+        """
+        Rollup key and score for an inspection's field values.
+        Returns None when the row has no creation date yet.
+        """
+        created_at = values.get('created_at')
+        if created_at is None:
+            return None
+        score = values.get('total_score')
+        if score is not None:
+            score = Inspection._meta.get_field('total_score').to_python(score)
+        return {
+            'key': {
+                'source': DashboardRollup.Source.INSPECTION,
+                'day': timezone.localdate(created_at),
+                'status': values.get('status') or '',
+                'result': values.get('result') or '',
+                'gas_type': values.get('gas_type') or '',
+                'inspector_id': values.get('inspector_id'),
+            },
+            'score': score,
+        }
+
+    @staticmethod
+    def appointment_snapshot(values):
+        """
+        Rollup key for an appointment's field values.
+        Returns None when the appointment has no scheduled date.
+        """
+        scheduled_date = values.get('scheduled_date')
+        if scheduled_date is None:
+            return None
+        return {
+            'key': {
+                'source': DashboardRollup.Source.APPOINTMENT,
+                'day': Appointment._meta.get_field('scheduled_date').to_python(scheduled_date),
+                'status': values.get('status') or '',
+                'result': '',
+                'gas_type': '',
+                'inspector_id': values.get('inspector_id'),
+            },
+            'score': None,
+        }
+
+    @staticmethod
+    def apply(snapshot, delta):
+        """Add ``delta`` rows (and their score) to the snapshot's rollup bucket"""
+        score = snapshot['score']
+        changes = {
+            'count': F('count') + delta,
+            'score_total': F('score_total') + (score * delta if score is not None else 0),
+            'scored_count': F('scored_count') + (delta if score is not None else 0),
+            'updated_at': timezone.now(),
+        }
+        bucket = DashboardRollup.objects.filter(**snapshot['key'])
+        if bucket.update(**changes) or delta < 0:
+            return
+
+        try:
+            with transaction.atomic():
+                DashboardRollup.objects.create(
+                    count=delta,
+                    score_total=score * delta if score is not None else 0,
+                    scored_count=delta if score is not None else 0,
+                    **snapshot['key']
+                )
+        except IntegrityError:
+            # Another transaction created the bucket first
+            bucket.update(**changes)
+
+    @classmethod
+    def move(cls, old, new):
+        """Move one row from the ``old`` snapshot's bucket to the ``new`` one"""
+        if old == new:
+            return
+        if old is not None:
+            cls.apply(old, -1)
+        if new is not None:
+            cls.apply(new, 1)
+
+    @classmethod
+    def apply_counts(cls, deltas):
+        """
+        Add net row counts to many score-less buckets: ``{key tuple: delta}``
+        with keys as in ``appointment_snapshot``. Existing buckets are
+        updated one by one, missing ones created in one bulk insert.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        keys = [dict(key) for key in deltas]
+        candidates = DashboardRollup.objects.filter(
+            source__in={key['source'] for key in keys},
+            day__in={key['day'] for key in keys},
+        ).values(*cls.KEY_FIELDS)
+        existing = {tuple(row[field] for field in cls.KEY_FIELDS) for row in candidates}
+
+        missing = []
+        for key, delta in deltas.items():
+            values = dict(key)
+            if tuple(values[field] for field in cls.KEY_FIELDS) in existing or delta < 0:
+                cls.apply({'key': values, 'score': None}, delta)
+            else:
+                missing.append(DashboardRollup(count=delta, **values))
+        try:
+            with transaction.atomic():
+                DashboardRollup.objects.bulk_create(missing)
+        except IntegrityError:
+            # Some bucket was created concurrently: fall back to one at a time
+            for bucket in missing:
+                cls.apply({
+                    'key': {field: getattr(bucket, field) for field in cls.KEY_FIELDS},
+                    'score': None,
+                }, bucket.count)
+
+    @classmethod
+    def _collect(cls):
+        """Recompute every rollup bucket from the source tables"""
+        inspections = Inspection.objects.order_by().annotate(
+            day=TruncDate('created_at')
+        ).values(
+            'day', 'status', 'result', 'gas_type', 'inspector_id'
+        ).annotate(
+            count=Count('pk'),
+            score_total=Sum('total_score', default=0),
+            scored_count=Count('total_score'),
+        )
+        for row in inspections:
+            yield DashboardRollup(
+                source=DashboardRollup.Source.INSPECTION,
+                day=row['day'],
+                status=row['status'],
+                result=row['result'] or '',
+                gas_type=row['gas_type'] or '',
+                inspector_id=row['inspector_id'],
+                count=row['count'],
+                score_total=row['score_total'],
+                scored_count=row['scored_count'],
+            )
+
+        appointments = Appointment.objects.order_by().values(
+            'scheduled_date', 'status', 'inspector_id'
+        ).annotate(count=Count('pk'))
+        for row in appointments:
+            yield DashboardRollup(
+                source=DashboardRollup.Source.APPOINTMENT,
+                day=row['scheduled_date'],
+                status=row['status'],
+                inspector_id=row['inspector_id'],
+                count=row['count'],
+            )
+
+    @classmethod
+    def reconcile(cls):
+        """
+        Rebuild the rollup table from the source tables.
+
+        Catches drift from writes that bypass signals (``QuerySet.update``,
+        ``bulk_create``, raw SQL). Meant to run nightly.
+
+        Returns:
+            Dict with the number of buckets written and how many drifted
+        """
+        def bucket(row):
+            return tuple(getattr(row, field) for field in cls.KEY_FIELDS)
+
+        with transaction.atomic():
+            previous = {
+                bucket(row): (row.count, row.scored_count, row.score_total)
+                for row in DashboardRollup.objects.select_for_update()
+            }
+            rows = list(cls._collect())
+            current = {
+                bucket(row): (row.count, row.scored_count, row.score_total)
+                for row in rows
+            }
+            drifted = sum(
+                1 for key in previous.keys() | current.keys()
+                if previous.get(key, (0, 0, 0)) != current.get(key, (0, 0, 0))
+            )
+
+            DashboardRollup.objects.all().delete()
+            DashboardRollup.objects.bulk_create(rows, batch_size=1000)
+
+        if drifted:
+            logger.warning(f"Dashboard rollups reconciled: {drifted} drifted buckets")
+        return {'buckets': len(rows), 'drifted': drifted}
@@ -0,0 +1,129 @@
+"""
+Signals keeping DashboardRollup and the dashboard cache in sync with writes
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from collections import Counter
+from appointments.models import Appointment
+from appointments.signals import appointments_bulk_changed
+from core.cache import CacheManager
+from inspections.models import Inspection
+from notifications.models import Notification
+from reports.models import Report
+from .services import RollupService
+
+TRACKED = {
+    Inspection: (RollupService.INSPECTION_FIELDS, RollupService.inspection_snapshot),
+    Appointment: (RollupService.APPOINTMENT_FIELDS, RollupService.appointment_snapshot),
+}
+
+
+def _snapshot(instance):
+    """
+    Rollup snapshot from the instance's loaded values.
+    Reads ``__dict__`` so deferred fields never trigger a query; returns
+    False when some tracked field is not loaded.
+    """
+    fields, build = TRACKED[type(instance)]
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return False
+    return build(values)
+
+
+def _stored_snapshot(instance):
+    """Rollup snapshot of the row as currently stored in the database"""
+    fields, build = TRACKED[type(instance)]
+    values = type(instance)._base_manager.filter(pk=instance.pk).values(*fields).first()
+    return build(values) if values else None
+
+
+@receiver(post_init, sender=Inspection)
+@receiver(post_init, sender=Appointment)
+def remember_rollup_snapshot(sender, instance, **kwargs):
+    """Remember the loaded state so saves can move the row between buckets"""
+    instance._rollup_snapshot = _snapshot(instance)
+
+
+@receiver(pre_save, sender=Inspection)
+@receiver(pre_save, sender=Appointment)
+@receiver(pre_delete, sender=Inspection)
+@receiver(pre_delete, sender=Appointment)
+def load_missing_rollup_snapshot(sender, instance, **kwargs):
+    """Fetch the stored state when the instance was loaded with deferred fields"""
+    if not instance._state.adding and getattr(instance, '_rollup_snapshot', None) is False:
+        instance._rollup_snapshot = _stored_snapshot(instance)
+
+
+@receiver(post_save, sender=Inspection)
+@receiver(post_save, sender=Appointment)
+def update_rollup_on_save(sender, instance, created, **kwargs):
+    """Move the row from its previous bucket to its current one"""
+    if kwargs.get('raw'):
+        return
+    old = None if created else getattr(instance, '_rollup_snapshot', None)
+    new = _snapshot(instance)
+    if new is False:
+        new = _stored_snapshot(instance)
+    RollupService.move(old or None, new)
+    _invalidate_dashboards(instance, old)
+    instance._rollup_snapshot = new
+
+
+@receiver(post_delete, sender=Inspection)
+@receiver(post_delete, sender=Appointment)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    """Remove the deleted row from its bucket"""
+    old = getattr(instance, '_rollup_snapshot', None) or None
+    RollupService.move(old, None)
+    _invalidate_dashboards(instance, old)
+
+
+@receiver(appointments_bulk_changed)
+def update_rollups_on_bulk_change(sender, changes, **kwargs):
+    """Apply the net bucket changes of a bulk appointment write at once"""
+    deltas = Counter()
+    user_ids = set()
+    for old, new in changes:
+        for values, delta in ((old, -1), (new, 1)):
+            if not values:
+                continue
+            snapshot = RollupService.appointment_snapshot(values)
+            if snapshot:
+                deltas[tuple(snapshot['key'].items())] += delta
+            user_ids.update((values.get('user_id'), values.get('inspector_id')))
+    RollupService.apply_counts(deltas)
+    user_ids = {str(user_id) for user_id in user_ids if user_id}
+    transaction.on_commit(lambda: CacheManager.invalidate_dashboards(user_ids))
+
+
+def _invalidate_dashboards(instance, old_snapshot=None, include_admin=True):
+    """
+    Drop the cached dashboards of the users an instance touches (client and
+    current/previous inspector) plus the admin one, once the write commits
+    """
+    values = instance.__dict__
+    user_ids = {values.get('user_id'), values.get('inspector_id')}
+    if old_snapshot:
+        user_ids.add(old_snapshot['key']['inspector_id'])
+    user_ids = {str(user_id) for user_id in user_ids if user_id}
+    transaction.on_commit(
+        lambda: CacheManager.invalidate_dashboards(user_ids, include_admin=include_admin)
+    )
+
+
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+def invalidate_dashboards_on_report(sender, instance, **kwargs):
+    """Report counts appear on the admin and client dashboards"""
+    owners = Inspection.objects.filter(pk=instance.inspection_id).values('user_id', 'inspector_id').first()
+    user_ids = {str(user_id) for user_id in (owners or {}).values() if user_id}
+    transaction.on_commit(lambda: CacheManager.invalidate_dashboards(user_ids))
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_dashboards_on_notification(sender, instance, **kwargs):
+    """Unread notification counts only appear on the recipient's dashboard"""
+    _invalidate_dashboards(instance, include_admin=False)
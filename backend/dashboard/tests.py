@@ -0,0 +1,372 @@
+"""
+Tests for Dashboard app
+"""
+import json
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.cache import CacheManager
+from inspections.models import Inspection
+from notifications.models import Notification
+from users.models import AuditLog
+from .models import DashboardRollup
+from .services import InspectionStatsService, RollupService
+from .views import DashboardViewSet
+from .management.commands.index_advisor import extract_statement, is_single_statement
+from datetime import timedelta
+from io import StringIO
+
+User = get_user_model()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def factory():
+    return APIRequestFactory()
+
+
+@pytest.fixture
+def admin_user(db):
+    return User.objects.create_user(
+        username='admin',
+        email='admin@test.com',
+        password='testpass123',
+        first_name='Admin',
+        last_name='Test',
+        role=User.Role.ADMIN
+    )
+
+
+@pytest.fixture
+def inspector_user(db):
+    return User.objects.create_user(
+        username='inspector',
+        email='inspector@test.com',
+        password='testpass123',
+        first_name='Inspector',
+        last_name='Test',
+        role=User.Role.INSPECTOR,
+        license_number='LIC-12345'
+    )
+
+
+@pytest.fixture
+def regular_user(db):
+    return User.objects.create_user(
+        username='user',
+        email='user@test.com',
+        password='testpass123',
+        first_name='User',
+        last_name='Test',
+        role=User.Role.USER
+    )
+
+
+@pytest.fixture
+def inspections(db, regular_user, inspector_user):
+    """One inspection per status, with mixed results and gas types"""
+    created = []
+    for index, (status_value, _label) in enumerate(Inspection.Status.choices):
+        created.append(Inspection.objects.create(
+            user=regular_user,
+            inspector=inspector_user,
+            address=f'Calle {index}',
+            gas_type=Inspection.GasType.values[index % len(Inspection.GasType.values)],
+            status=status_value,
+            result=Inspection.Result.APPROVED if status_value == Inspection.Status.COMPLETED else None,
+            total_score=90 if status_value == Inspection.Status.COMPLETED else None,
+            scheduled_date=timezone.now() + timedelta(days=1),
+            completed_at=timezone.now() if status_value == Inspection.Status.COMPLETED else None,
+        ))
+    return created
+
+
+def call_dashboard(factory, user, action):
+    view = DashboardViewSet.as_view({'get': action})
+    request = factory.get(f'/api/dashboard/{action}/')
+    force_authenticate(request, user=user)
+    return view(request)
+
+
+@pytest.mark.django_db
+class TestDashboardQueryCount:
+    """Pin each dashboard at a fixed number of queries"""
+
+    @pytest.mark.parametrize('user_fixture, action, expected', [
+        ('admin_user', 'stats', 5),
+        ('inspector_user', 'stats', 3),
+        ('regular_user', 'stats', 5),
+        ('admin_user', 'chart_data', 1),
+        ('inspector_user', 'chart_data', 1),
+        ('regular_user', 'chart_data', 1),
+    ])
+    def test_dashboard_query_count(self, request, factory, inspections,
+                                   django_assert_num_queries, user_fixture, action, expected):
+        """Query count does not depend on the number of enum choices or rows"""
+        user = request.getfixturevalue(user_fixture)
+
+        with django_assert_num_queries(expected):
+            response = call_dashboard(factory, user, action)
+
+        assert response.status_code == 200
+
+
+@pytest.mark.django_db
+class TestDashboardStats:
+    """Test aggregated dashboard values"""
+
+    def test_admin_stats_breakdowns(self, factory, admin_user, inspections):
+        """Admin breakdowns cover every choice with the right counts"""
+        response = call_dashboard(factory, admin_user, 'stats')
+        data = response.data['data']
+
+        assert data['totals']['inspections'] == len(Inspection.Status.choices)
+        assert data['totals']['users'] == 1
+        assert data['totals']['inspectors'] == 1
+        assert set(data['inspections_by_status']) == set(Inspection.Status.values)
+        assert all(entry['count'] == 1 for entry in data['inspections_by_status'].values())
+        assert data['inspections_by_result'][Inspection.Result.APPROVED]['count'] == 1
+        assert data['inspections_by_result'][Inspection.Result.REJECTED]['count'] == 0
+        assert data['average_score'] == 90
+
+    def test_inspector_stats_totals(self, factory, inspector_user, inspections):
+        """Inspector totals are scoped to assigned inspections"""
+        response = call_dashboard(factory, inspector_user, 'stats')
+        totals = response.data['data']['totals']
+
+        assert totals['assigned'] == len(Inspection.Status.choices)
+        assert totals['completed'] == 1
+        assert response.data['data']['by_result']['approved'] == 1
+
+    def test_user_chart_skips_empty_results(self, factory, regular_user, inspections):
+        """User charts only list non-empty buckets"""
+        response = call_dashboard(factory, regular_user, 'chart_data')
+        data = response.data['data']
+
+        assert len(data['status_distribution']) == len(Inspection.Status.choices)
+        assert data['result_distribution'] == [{'result': 'Aprobada', 'count': 1}]
+
+
+@pytest.mark.django_db
+class TestDashboardRollups:
+    """Test incremental maintenance of DashboardRollup"""
+
+    def rollup_counts(self):
+        return {
+            (row.source, row.status, row.result, row.inspector_id): row.count
+            for row in DashboardRollup.objects.filter(count__gt=0)
+        }
+
+    def test_signals_move_rows_between_buckets(self, inspections, inspector_user):
+        """Status changes and deletes move counts between buckets"""
+        inspection = Inspection.objects.get(status=Inspection.Status.PENDING)
+        inspection.status = Inspection.Status.COMPLETED
+        inspection.result = Inspection.Result.REJECTED
+        inspection.total_score = 40
+        inspection.save()
+
+        summary = InspectionStatsService.rollup_summary()
+        assert summary['status'][Inspection.Status.PENDING] == 0
+        assert summary['status'][Inspection.Status.COMPLETED] == 2
+        assert summary['result'][Inspection.Result.REJECTED] == 1
+        assert summary['avg_score'] == 65
+
+        inspection.delete()
+        summary = InspectionStatsService.rollup_summary()
+        assert summary['total'] == len(Inspection.Status.choices) - 1
+        assert summary['status'][Inspection.Status.COMPLETED] == 1
+
+    def test_deferred_load_keeps_rollups_consistent(self, inspections):
+        """Saving an instance loaded with only() still decrements the old bucket"""
+        inspection = Inspection.objects.only('id', 'status').get(status=Inspection.Status.SCHEDULED)
+        inspection.status = Inspection.Status.CANCELLED
+        inspection.save(update_fields=['status'])
+
+        summary = InspectionStatsService.rollup_summary()
+        assert summary['status'][Inspection.Status.SCHEDULED] == 0
+        assert summary['status'][Inspection.Status.CANCELLED] == 2
+
+    def test_reconcile_matches_incremental_state(self, inspections):
+        """Nightly reconciliation finds no drift after signal-driven writes"""
+        incremental = self.rollup_counts()
+
+        assert RollupService.reconcile()['drifted'] == 0
+        assert self.rollup_counts() == incremental
+
+    def test_reconcile_repairs_bypassed_writes(self, inspections):
+        """Writes that bypass signals are picked up by reconciliation"""
+        Inspection.objects.filter(status=Inspection.Status.PENDING).update(
+            status=Inspection.Status.CANCELLED
+        )
+
+        assert RollupService.reconcile()['drifted'] == 2
+        summary = InspectionStatsService.rollup_summary()
+        assert summary['status'][Inspection.Status.PENDING] == 0
+        assert summary['status'][Inspection.Status.CANCELLED] == 2
+
+
+    def test_live_and_rollup_windows_agree(self, factory, admin_user, inspections, settings):
+        """Rows just either side of a local midnight land in the same windows in both modes"""
+        month_start = InspectionStatsService.monthly_windows(1)[0][1]
+        recent_start = InspectionStatsService.recent_start(30)
+        edges = [
+            InspectionStatsService.day_start(day) + timedelta(minutes=minutes)
+            for day in (month_start, recent_start) for minutes in (-30, 30)
+        ]
+        for inspection, created_at in zip(inspections, edges):
+            Inspection.objects.filter(pk=inspection.pk).update(created_at=created_at)
+        RollupService.reconcile()
+
+        results = {}
+        for use_rollups in (True, False):
+            settings.DASHBOARD_USE_ROLLUPS = use_rollups
+            cache.clear()
+            stats = call_dashboard(factory, admin_user, 'stats').data['data']
+            charts = call_dashboard(factory, admin_user, 'chart_data').data['data']
+            results[use_rollups] = (stats['recent_activity'], charts['monthly_inspections'])
+
+        assert results[True] == results[False]
+        in_this_month = sum(edge >= InspectionStatsService.day_start(month_start) for edge in edges)
+        assert results[False][1][-1]['count'] == len(inspections) - len(edges) + in_this_month
+
+@pytest.mark.django_db
+class TestDashboardCache:
+    """Test role/user-scoped dashboard caching and targeted invalidation"""
+
+    def test_second_request_served_from_cache(self, factory, inspector_user, inspections,
+                                              django_assert_num_queries):
+        """A warm dashboard costs no queries and counts as a hit"""
+        call_dashboard(factory, inspector_user, 'stats')
+
+        with django_assert_num_queries(0):
+            response = call_dashboard(factory, inspector_user, 'stats')
+
+        assert response.data['data']['totals']['assigned'] == len(Inspection.Status.choices)
+        ratio = CacheManager.hit_ratio('dashboard:stats')
+        assert ratio == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+    def test_inspection_write_invalidates_affected_dashboards(
+            self, factory, admin_user, inspector_user, regular_user, inspections,
+            django_capture_on_commit_callbacks):
+        """Saving an inspection drops its inspector, client and admin dashboards"""
+        call_dashboard(factory, admin_user, 'stats')
+        call_dashboard(factory, inspector_user, 'stats')
+        other = User.objects.create_user(
+            username='other', email='other@test.com', password='testpass123',
+            first_name='Other', last_name='Client', role=User.Role.USER
+        )
+        call_dashboard(factory, other, 'stats')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            inspection = inspections[0]
+            inspection.status = Inspection.Status.CANCELLED
+            inspection.save()
+
+        admin_key = CacheManager._dashboard_key('global', CacheManager.DASHBOARD_ADMIN, 'stats')
+        inspector_key = CacheManager._dashboard_key(str(inspector_user.id), CacheManager.DASHBOARD_INSPECTOR, 'stats')
+        other_key = CacheManager._dashboard_key(str(other.id), CacheManager.DASHBOARD_USER, 'stats')
+        assert cache.get(admin_key) is None
+        assert cache.get(inspector_key) is None
+        assert cache.get(other_key) is not None
+
+    def test_notification_write_keeps_admin_dashboard(
+            self, factory, admin_user, regular_user, inspections,
+            django_capture_on_commit_callbacks):
+        """Notifications only invalidate the recipient's dashboard"""
+        call_dashboard(factory, admin_user, 'stats')
+        call_dashboard(factory, regular_user, 'stats')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Notification.objects.create(user=regular_user, title='Aviso', message='Mensaje')
+
+        response = call_dashboard(factory, regular_user, 'stats')
+        assert response.data['data']['unread_notifications'] == 1
+        admin_key = CacheManager._dashboard_key('global', CacheManager.DASHBOARD_ADMIN, 'stats')
+        assert cache.get(admin_key) is not None
+
+    def test_global_invalidation_bumps_generation(self, factory, admin_user, inspector_user, inspections):
+        """Invalidating every dashboard is one counter bump, no key scan"""
+        call_dashboard(factory, admin_user, 'stats')
+        call_dashboard(factory, inspector_user, 'stats')
+        old_key = CacheManager._dashboard_key('global', CacheManager.DASHBOARD_ADMIN, 'stats')
+
+        assert CacheManager.invalidate_dashboard_cache()
+
+        assert CacheManager._dashboard_key('global', CacheManager.DASHBOARD_ADMIN, 'stats') != old_key
+        assert CacheManager.get_dashboard_stats('global', CacheManager.DASHBOARD_ADMIN) is None
+        assert CacheManager.get_dashboard_stats(str(inspector_user.id), CacheManager.DASHBOARD_INSPECTOR) is None
+
+
+@pytest.mark.django_db
+class TestIndexAdvisor:
+    """Test the index_advisor command"""
+
+    def test_parses_log_formats(self):
+        """django.db.backends (plain or JSON), PostgreSQL and bare SQL lines"""
+        sql = 'SELECT "id" FROM "inspections_inspection" WHERE "status" = \'PENDING\''
+        lines = [
+            f'(0.012) {sql}; args=(\'PENDING\',); alias=default',
+            json.dumps({'message': f'(0.012) {sql}; args=(\'PENDING\',); alias=default'}),
+            f'2026-10-16 10:00:00 UTC [42] LOG:  duration: 12.000 ms  statement: {sql}',
+            f'{sql};',
+        ]
+        assert [extract_statement(line) for line in lines] == [
+            (sql, 12.0), (sql, 12.0), (sql, 12.0), (sql, 0.0),
+        ]
+        assert extract_statement('[INFO] 2026-10-16 - GET /api/inspections/') is None
+
+    def test_reports_sequential_scans(self, tmp_path):
+        """Unindexed filters are reported once per table and filter, grouped across literals"""
+        log = tmp_path / 'queries.log'
+        log.write_text('\n'.join([
+            '(0.001) SELECT * FROM "missing_table"; args=(); alias=default',
+            '(0.050) SELECT "id" FROM "inspections_inspection" WHERE "address" = \'Calle 1\'; args=(); alias=default',
+            '(0.070) SELECT "id" FROM "inspections_inspection" WHERE "address" = \'Calle 2\'; args=(); alias=default',
+            '(0.001) INSERT INTO "inspections_inspection" ("address") VALUES (\'x\'); args=(); alias=default',
+        ]))
+        out = StringIO()
+
+        call_command('index_advisor', str(log), min_rows=0, stdout=out)
+
+        output = out.getvalue()
+        assert '3 statements, 2 distinct, 1 could not be explained' in output
+        assert 'Seq Scan on inspections_inspection' in output
+        assert '2 queries, 120.0 ms logged' in output
+        assert 'address' in output
+
+    def test_rejects_stacked_statements(self, tmp_path):
+        """A second statement after ``;`` is never sent to the database"""
+        assert is_single_statement('SELECT \'a;b\' FROM "x;y"')
+        assert not is_single_statement('SELECT 1; DROP TABLE "users_auditlog"')
+        log = tmp_path / 'queries.log'
+        log.write_text('SELECT 1; DROP TABLE "users_auditlog"\n')
+        out = StringIO()
+
+        call_command('index_advisor', str(log), min_rows=0, stdout=out)
+
+        assert '1 multi-statement lines rejected' in out.getvalue()
+        assert AuditLog.objects.count() == 0
+
+    def test_explain_is_read_only(self, monkeypatch, tmp_path):
+        """Whatever reaches EXPLAIN runs in a read-only transaction"""
+        monkeypatch.setattr(
+            'dashboard.management.commands.index_advisor.is_single_statement', lambda sql: True
+        )
+        log = tmp_path / 'queries.log'
+        log.write_text('SELECT 1; DELETE FROM "users_auditlog"\n')
+        AuditLog.objects.create(action='CREATE', model_name='inspections')
+        out = StringIO()
+
+        call_command('index_advisor', str(log), min_rows=0, stdout=out)
+
+        assert '1 could not be explained' in out.getvalue()
+        assert AuditLog.objects.count() == 1
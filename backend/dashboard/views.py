@@ -4,14 +4,20 @@ Views for Dashboard app
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Q, Avg, Sum
+from django.conf import settings
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 from datetime import timedelta
+from core.cache import CacheManager
 from core.utils.response import APIResponse
+from core.utils.aggregation import aggregate_breakdowns, as_distribution, with_labels
 from inspections.models import Inspection
+from appointments.models import Appointment
 from users.models import CustomUser
 from reports.models import Report
 from notifications.models import Notification
+from .models import DashboardRollup
+from .services import InspectionStatsService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,64 +29,86 @@ class DashboardViewSet(viewsets.ViewSet):
     """
     permission_classes = [IsAuthenticated]
     
+    @staticmethod
+    def _use_rollups():
+        """Read global aggregates from DashboardRollup instead of live tables"""
+        return getattr(settings, 'DASHBOARD_USE_ROLLUPS', True)
+    
+    @staticmethod
+    def _cache_scope(user):
+        """Dashboard variant and cache scope for a user (admin data is global)"""
+        if user.is_admin:
+            return CacheManager.DASHBOARD_ADMIN, CacheManager.DASHBOARD_GLOBAL_SCOPE
+        elif user.is_inspector:
+            return CacheManager.DASHBOARD_INSPECTOR, str(user.id)
+        return CacheManager.DASHBOARD_USER, str(user.id)
+    
+    def _cached(self, request, endpoint, builders):
+        """
+        Serve ``endpoint`` from the role/user-scoped dashboard cache,
+        building and caching it on a miss
+        """
+        variant, scope = self._cache_scope(request.user)
+        cached = CacheManager.get_dashboard_stats(scope, variant, endpoint=endpoint)
+        if cached is not None:
+            return APIResponse.success(cached)
+        
+        response = builders[variant](request)
+        if response.status_code == 200:
+            CacheManager.cache_dashboard_stats(scope, variant, response.data['data'], endpoint=endpoint)
+        return response
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get dashboard statistics based on user role"""
-        user = request.user
+        return self._cached(request, 'stats', {
+            CacheManager.DASHBOARD_ADMIN: self._get_admin_stats,
+            CacheManager.DASHBOARD_INSPECTOR: self._get_inspector_stats,
+            CacheManager.DASHBOARD_USER: self._get_user_stats,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Dashboard cache hit ratio per endpoint (admin only)"""
+        if not request.user.is_admin:
+            return APIResponse.forbidden()
         
-        if user.is_admin:
-            return self._get_admin_stats(request)
-        elif user.is_inspector:
-            return self._get_inspector_stats(request)
-        else:
-            return self._get_user_stats(request)
+        return APIResponse.success({
+            endpoint: CacheManager.hit_ratio(f"{CacheManager.PREFIX_DASHBOARD}:{endpoint}")
+            for endpoint in CacheManager.DASHBOARD_ENDPOINTS
+        })
     
     def _get_admin_stats(self, request):
         """Get statistics for admin dashboard"""
-        # Total counts
-        total_inspections = Inspection.objects.count()
-        total_users = CustomUser.objects.filter(role=CustomUser.Role.USER).count()
-        total_inspectors = CustomUser.objects.filter(role=CustomUser.Role.INSPECTOR).count()
+        # Every inspection breakdown in a single query
+        recent_start = InspectionStatsService.recent_start(30)
+        if self._use_rollups():
+            recent = InspectionStatsService.date_range('day', recent_start, dates=True)
+            summary = InspectionStatsService.rollup_summary(
+                recent=Sum('count', filter=recent, default=0)
+            )
+            appointments_by_status = aggregate_breakdowns(
+                DashboardRollup.objects.filter(source=DashboardRollup.Source.APPOINTMENT),
+                {'status': Appointment.Status.choices},
+                measure='count'
+            )['status']
+        else:
+            summary = InspectionStatsService.summary(
+                InspectionStatsService.scope(),
+                recent=Count('pk', filter=InspectionStatsService.date_range('created_at', recent_start))
+            )
+            appointments_by_status = aggregate_breakdowns(
+                Appointment.objects.all(),
+                {'status': Appointment.Status.choices}
+            )['status']
+        
+        # User totals by role
+        users_by_role = aggregate_breakdowns(
+            CustomUser.objects.all(),
+            {'role': CustomUser.Role.choices}
+        )['role']
         total_reports = Report.objects.filter(status=Report.Status.COMPLETED).count()
         
-        # Inspections by status
-        inspections_by_status = {}
-        for status_choice in Inspection.Status.choices:
-            count = Inspection.objects.filter(status=status_choice[0]).count()
-            inspections_by_status[status_choice[0]] = {
-                'count': count,
-                'label': status_choice[1]
-            }
-        
-        # Inspections by result
-        inspections_by_result = {}
-        for result_choice in Inspection.Result.choices:
-            count = Inspection.objects.filter(result=result_choice[0]).count()
-            inspections_by_result[result_choice[0]] = {
-                'count': count,
-                'label': result_choice[1]
-            }
-        
-        # Recent activity (last 30 days)
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_inspections = Inspection.objects.filter(
-            created_at__gte=thirty_days_ago
-        ).count()
-        
-        # Average score
-        avg_score = Inspection.objects.filter(
-            total_score__isnull=False
-        ).aggregate(Avg('total_score'))['total_score__avg'] or 0
-        
-        # Inspections by gas type
-        inspections_by_gas_type = {}
-        for gas_type in Inspection.GasType.choices:
-            count = Inspection.objects.filter(gas_type=gas_type[0]).count()
-            inspections_by_gas_type[gas_type[0]] = {
-                'count': count,
-                'label': gas_type[1]
-            }
-        
         # Top inspectors (by completed inspections)
         top_inspectors = CustomUser.objects.filter(
             role=CustomUser.Role.INSPECTOR
@@ -99,18 +127,19 @@ class DashboardViewSet(viewsets.ViewSet):
         
         stats = {
             'totals': {
-                'inspections': total_inspections,
-                'users': total_users,
-                'inspectors': total_inspectors,
+                'inspections': summary['total'],
+                'users': users_by_role[CustomUser.Role.USER],
+                'inspectors': users_by_role[CustomUser.Role.INSPECTOR],
                 'reports': total_reports
             },
-            'inspections_by_status': inspections_by_status,
-            'inspections_by_result': inspections_by_result,
-            'inspections_by_gas_type': inspections_by_gas_type,
+            'inspections_by_status': with_labels(summary['status'], Inspection.Status.choices),
+            'inspections_by_result': with_labels(summary['result'], Inspection.Result.choices),
+            'inspections_by_gas_type': with_labels(summary['gas_type'], Inspection.GasType.choices),
+            'appointments_by_status': with_labels(appointments_by_status, Appointment.Status.choices),
             'recent_activity': {
-                'inspections_last_30_days': recent_inspections
+                'inspections_last_30_days': summary['recent']
             },
-            'average_score': round(avg_score, 2),
+            'average_score': round(float(summary['avg_score'] or 0), 2),
             'top_inspectors': top_inspectors_data
         }
         
@@ -120,23 +149,11 @@ class DashboardViewSet(viewsets.ViewSet):
         """Get statistics for inspector dashboard"""
         inspector = request.user
         
-        # My inspections counts
-        my_inspections = Inspection.objects.filter(inspector=inspector)
-        total_assigned = my_inspections.count()
-        completed = my_inspections.filter(status=Inspection.Status.COMPLETED).count()
-        pending = my_inspections.filter(status=Inspection.Status.PENDING).count()
-        in_progress = my_inspections.filter(status=Inspection.Status.IN_PROGRESS).count()
-        scheduled = my_inspections.filter(status=Inspection.Status.SCHEDULED).count()
-        
-        # My inspections by result
-        approved = my_inspections.filter(result=Inspection.Result.APPROVED).count()
-        conditional = my_inspections.filter(result=Inspection.Result.CONDITIONAL).count()
-        rejected = my_inspections.filter(result=Inspection.Result.REJECTED).count()
-        
-        # Average score
-        avg_score = my_inspections.filter(
-            total_score__isnull=False
-        ).aggregate(Avg('total_score'))['total_score__avg'] or 0
+        # My inspections counts, by status and result in a single query
+        my_inspections = InspectionStatsService.scope(inspector=inspector)
+        summary = InspectionStatsService.summary(my_inspections)
+        by_status = summary['status']
+        by_result = summary['result']
         
         # Upcoming inspections (next 7 days)
         today = timezone.now()
@@ -168,25 +185,25 @@ class DashboardViewSet(viewsets.ViewSet):
                 'address': inspection.address,
                 'completed_at': inspection.completed_at.isoformat() if inspection.completed_at else None,
                 'result': inspection.get_result_display() if inspection.result else None,
-                'score': inspection.total_score
+                'score': float(inspection.total_score) if inspection.total_score is not None else None
             }
             for inspection in recent_completed
         ]
         
         stats = {
             'totals': {
-                'assigned': total_assigned,
-                'completed': completed,
-                'pending': pending,
-                'in_progress': in_progress,
-                'scheduled': scheduled
+                'assigned': summary['total'],
+                'completed': by_status[Inspection.Status.COMPLETED],
+                'pending': by_status[Inspection.Status.PENDING],
+                'in_progress': by_status[Inspection.Status.IN_PROGRESS],
+                'scheduled': by_status[Inspection.Status.SCHEDULED]
             },
             'by_result': {
-                'approved': approved,
-                'conditional': conditional,
-                'rejected': rejected
+                'approved': by_result[Inspection.Result.APPROVED],
+                'conditional': by_result[Inspection.Result.CONDITIONAL],
+                'rejected': by_result[Inspection.Result.REJECTED]
             },
-            'average_score': round(avg_score, 2),
+            'average_score': round(float(summary['avg_score'] or 0), 2),
             'upcoming_inspections': upcoming_data,
             'recent_completions': recent_data
         }
@@ -197,24 +214,17 @@ class DashboardViewSet(viewsets.ViewSet):
         """Get statistics for user dashboard"""
         user = request.user
         
-        # My inspections
-        my_inspections = Inspection.objects.filter(user=user)
-        total = my_inspections.count()
-        pending = my_inspections.filter(status=Inspection.Status.PENDING).count()
-        scheduled = my_inspections.filter(status=Inspection.Status.SCHEDULED).count()
-        in_progress = my_inspections.filter(status=Inspection.Status.IN_PROGRESS).count()
-        completed = my_inspections.filter(status=Inspection.Status.COMPLETED).count()
-        
-        # Results
-        approved = my_inspections.filter(result=Inspection.Result.APPROVED).count()
-        conditional = my_inspections.filter(result=Inspection.Result.CONDITIONAL).count()
-        rejected = my_inspections.filter(result=Inspection.Result.REJECTED).count()
+        # My inspections, by status and result in a single query
+        my_inspections = InspectionStatsService.scope(user=user)
+        summary = InspectionStatsService.summary(my_inspections)
+        by_status = summary['status']
+        by_result = summary['result']
         
         # Next scheduled inspection
         next_inspection = my_inspections.filter(
             scheduled_date__gte=timezone.now(),
             status__in=[Inspection.Status.SCHEDULED, Inspection.Status.PENDING]
-        ).order_by('scheduled_date').first()
+        ).select_related('inspector').order_by('scheduled_date').first()
         
         next_inspection_data = None
         if next_inspection:
@@ -252,16 +262,16 @@ class DashboardViewSet(viewsets.ViewSet):
         
         stats = {
             'totals': {
-                'all': total,
-                'pending': pending,
-                'scheduled': scheduled,
-                'in_progress': in_progress,
-                'completed': completed
+                'all': summary['total'],
+                'pending': by_status[Inspection.Status.PENDING],
+                'scheduled': by_status[Inspection.Status.SCHEDULED],
+                'in_progress': by_status[Inspection.Status.IN_PROGRESS],
+                'completed': by_status[Inspection.Status.COMPLETED]
             },
             'by_result': {
-                'approved': approved,
-                'conditional': conditional,
-                'rejected': rejected
+                'approved': by_result[Inspection.Result.APPROVED],
+                'conditional': by_result[Inspection.Result.CONDITIONAL],
+                'rejected': by_result[Inspection.Result.REJECTED]
             },
             'next_inspection': next_inspection_data,
             'recent_inspections': recent_data,
@@ -274,118 +284,55 @@ class DashboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def chart_data(self, request):
         """Get chart data for dashboard visualizations"""
-        user = request.user
-        
-        if user.is_admin:
-            return self._get_admin_chart_data(request)
-        elif user.is_inspector:
-            return self._get_inspector_chart_data(request)
-        else:
-            return self._get_user_chart_data(request)
+        return self._cached(request, 'chart_data', {
+            CacheManager.DASHBOARD_ADMIN: self._get_admin_chart_data,
+            CacheManager.DASHBOARD_INSPECTOR: self._get_inspector_chart_data,
+            CacheManager.DASHBOARD_USER: self._get_user_chart_data,
+        })
     
     def _get_admin_chart_data(self, request):
         """Get chart data for admin"""
-        # Inspections per month (last 12 months)
-        months_data = []
-        for i in range(11, -1, -1):
-            month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0) - timedelta(days=30 * i)
-            month_end = month_start + timedelta(days=30)
-            
-            count = Inspection.objects.filter(
-                created_at__gte=month_start,
-                created_at__lt=month_end
-            ).count()
-            
-            months_data.append({
-                'month': month_start.strftime('%b %Y'),
-                'count': count
-            })
-        
-        # Status distribution
-        status_data = []
-        for status in Inspection.Status.choices:
-            count = Inspection.objects.filter(status=status[0]).count()
-            status_data.append({
-                'status': status[1],
-                'count': count
-            })
-        
-        # Result distribution
-        result_data = []
-        for result in Inspection.Result.choices:
-            count = Inspection.objects.filter(result=result[0]).count()
-            result_data.append({
-                'result': result[1],
-                'count': count
-            })
+        # Inspections per month (last 12 months) plus distributions, one query
+        if self._use_rollups():
+            data = InspectionStatsService.rollup_summary(
+                **InspectionStatsService.monthly_counts('day', 12, measure='count', dates=True)
+            )
+        else:
+            data = InspectionStatsService.summary(
+                InspectionStatsService.scope(),
+                **InspectionStatsService.monthly_counts('created_at', 12)
+            )
         
         return APIResponse.success({
-            'monthly_inspections': months_data,
-            'status_distribution': status_data,
-            'result_distribution': result_data
+            'monthly_inspections': InspectionStatsService.monthly_series(data, 12),
+            'status_distribution': as_distribution(data['status'], Inspection.Status.choices, 'status'),
+            'result_distribution': as_distribution(data['result'], Inspection.Result.choices, 'result')
         })
     
     def _get_inspector_chart_data(self, request):
         """Get chart data for inspector"""
-        inspector = request.user
-        my_inspections = Inspection.objects.filter(inspector=inspector)
-        
-        # Completions per month (last 6 months)
-        months_data = []
-        for i in range(5, -1, -1):
-            month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0) - timedelta(days=30 * i)
-            month_end = month_start + timedelta(days=30)
-            
-            count = my_inspections.filter(
-                completed_at__gte=month_start,
-                completed_at__lt=month_end
-            ).count()
-            
-            months_data.append({
-                'month': month_start.strftime('%b %Y'),
-                'count': count
-            })
-        
-        # Result distribution
-        result_data = []
-        for result in Inspection.Result.choices:
-            count = my_inspections.filter(result=result[0]).count()
-            result_data.append({
-                'result': result[1],
-                'count': count
-            })
+        # Completions per month (last 6 months) plus result distribution, one query
+        data = InspectionStatsService.summary(
+            InspectionStatsService.scope(inspector=request.user),
+            **InspectionStatsService.monthly_counts('completed_at', 6)
+        )
         
         return APIResponse.success({
-            'monthly_completions': months_data,
-            'result_distribution': result_data
+            'monthly_completions': InspectionStatsService.monthly_series(data, 6),
+            'result_distribution': as_distribution(data['result'], Inspection.Result.choices, 'result')
         })
     
     def _get_user_chart_data(self, request):
         """Get chart data for user"""
-        user = request.user
-        my_inspections = Inspection.objects.filter(user=user)
-        
-        # Status distribution
-        status_data = []
-        for status in Inspection.Status.choices:
-            count = my_inspections.filter(status=status[0]).count()
-            if count > 0:
-                status_data.append({
-                    'status': status[1],
-                    'count': count
-                })
-        
-        # Result distribution
-        result_data = []
-        for result in Inspection.Result.choices:
-            count = my_inspections.filter(result=result[0]).count()
-            if count > 0:
-                result_data.append({
-                    'result': result[1],
-                    'count': count
-                })
+        data = InspectionStatsService.summary(
+            InspectionStatsService.scope(user=request.user)
+        )
         
         return APIResponse.success({
-            'status_distribution': status_data,
-            'result_distribution': result_data
+            'status_distribution': as_distribution(
+                data['status'], Inspection.Status.choices, 'status', skip_empty=True
+            ),
+            'result_distribution': as_distribution(
+                data['result'], Inspection.Result.choices, 'result', skip_empty=True
+            )
         })
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:07
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('inspections', '0004_alter_inspection_neighborhood'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inspection',
+            index=models.Index(fields=['status', 'scheduled_date'], name='insp_status_sched_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inspection',
+            index=models.Index(fields=['inspector', 'status', '-scheduled_date'], name='insp_inspector_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inspection',
+            index=models.Index(fields=['user', 'status', '-scheduled_date'], name='insp_user_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inspection',
+            index=models.Index(fields=['scheduled_date'], name='insp_scheduled_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inspection',
+            index=models.Index(fields=['-created_at'], name='insp_created_idx'),
+        ),
+        # Indexes created by hand from the former SUGGESTED_INDEXES script,
+        # now covered by the ones above or by the foreign key indexes
+        migrations.RunSQL(
+            [
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_user',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_inspector',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_status',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_date',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_created',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_status_date',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_user_status_date',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_inspections_inspector_status_date',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
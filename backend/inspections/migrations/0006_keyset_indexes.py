@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:10
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('inspections', '0005_inspection_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inspection',
+            index=models.Index(fields=['-created_at', '-id'], name='insp_created_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='inspection',
+            name='insp_created_idx',
+        ),
+    ]
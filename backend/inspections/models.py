@@ -67,6 +67,14 @@ class Inspection(ONACInspectionMixin, models.Model):
         verbose_name = 'Inspección'
         verbose_name_plural = 'Inspecciones'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'scheduled_date'], name='insp_status_sched_idx'),
+            models.Index(fields=['inspector', 'status', '-scheduled_date'], name='insp_inspector_status_idx'),
+            models.Index(fields=['user', 'status', '-scheduled_date'], name='insp_user_status_idx'),
+            models.Index(fields=['scheduled_date'], name='insp_scheduled_idx'),
+            # Keyset pagination key (core.utils.pagination)
+            models.Index(fields=['-created_at', '-id'], name='insp_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"Inspección {self.id} - {self.address}"
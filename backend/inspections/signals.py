@@ -0,0 +1,21 @@
+"""
+Signals dropping cached inspection listings when inspections change
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.cache import CacheManager
+from .models import Inspection
+
+# Appointment listings embed the linked inspection's status and progress
+LISTING_CACHES = ('inspections', 'appointments')
+
+
+@receiver(post_save, sender=Inspection)
+@receiver(post_delete, sender=Inspection)
+def invalidate_inspection_listings(sender, instance, **kwargs):
+    """Drop every cached inspection/appointment listing once the write commits"""
+    def invalidate():
+        for name in LISTING_CACHES:
+            CacheManager.invalidate_view_cache(name)
+    transaction.on_commit(invalidate)
@@ -17,6 +17,8 @@ from .serializers import (
 )
 from core.utils.permissions import IsAdmin, IsAdminOrInspector, IsOwnerOrInspectorOrAdmin
 from core.utils.response import APIResponse
+from core.cache import cache_view, role_scope
+from django.utils.decorators import method_decorator
 from django.utils import timezone
 
 
@@ -56,6 +58,11 @@ class InspectionViewSet(viewsets.ModelViewSet):
             return [IsAdminOrInspector()]
         return super().get_permissions()
 
+    @method_decorator(cache_view(key_prefix='inspections', scope=role_scope('ADMIN')))
+    def list(self, request, *args, **kwargs):
+        """List inspections (cached per role/user, query string and Accept header)"""
+        return super().list(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         """Create a new inspection - automatically assigns inspector if user is inspector"""
         serializer = self.get_serializer(data=request.data)
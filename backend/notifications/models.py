@@ -80,6 +80,7 @@ class Notification(models.Model):
             models.Index(fields=['user', 'status', 'created_at']),
             models.Index(fields=['notification_type', 'status']),
             models.Index(fields=['inspection']),
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_user_created_idx'),
         ]
     
     def __str__(self):
@@ -0,0 +1,51 @@
+"""
+Tests for Notifications app
+"""
+import pytest
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .models import Notification
+from .views import NotificationViewSet
+
+User = get_user_model()
+
+
+@pytest.fixture
+def regular_user(db):
+    return User.objects.create_user(
+        username='user',
+        email='user@test.com',
+        password='testpass123',
+        first_name='User',
+        last_name='Test',
+        role=User.Role.USER
+    )
+
+
+@pytest.mark.django_db
+class TestNotificationStats:
+    """Test notification statistics"""
+
+    def test_stats_single_query(self, regular_user, django_assert_num_queries):
+        """Status and type breakdowns come from one aggregate query"""
+        for status_value in Notification.Status.values:
+            Notification.objects.create(
+                user=regular_user,
+                status=status_value,
+                title='Aviso',
+                message='Mensaje'
+            )
+
+        view = NotificationViewSet.as_view({'get': 'stats'})
+        request = APIRequestFactory().get('/api/notifications/stats/')
+        force_authenticate(request, user=regular_user)
+
+        with django_assert_num_queries(1):
+            response = view(request)
+
+        data = response.data['data']
+        assert data['total'] == 4
+        assert data['unread'] == 2
+        assert data['read'] == 1
+        assert data['failed'] == 1
+        assert data['by_type'][Notification.Type.IN_APP] == 4
@@ -4,9 +4,12 @@ Views for Notifications app
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import Count
 from django.utils import timezone
+from core.cache import CacheManager
 from core.utils.permissions import IsAdmin
 from core.utils.response import APIResponse
+from core.utils.aggregation import aggregate_breakdowns
 from .models import Notification, EmailTemplate
 from .serializers import (
     NotificationSerializer, NotificationMarkReadSerializer,
@@ -61,6 +64,10 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
             read_at=timezone.now()
         )
         
+        # Bulk update bypasses signals: refresh the user's dashboard explicitly
+        if updated:
+            CacheManager.invalidate_dashboards([str(request.user.id)], include_admin=False)
+        
         return APIResponse.success(
             {'updated_count': updated},
             message=f"{updated} notificaciones marcadas como leídas"
@@ -83,21 +90,25 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get notification statistics"""
-        queryset = self.get_queryset()
+        # Status and type breakdowns in a single query
+        data = aggregate_breakdowns(
+            self.get_queryset(),
+            {
+                'status': Notification.Status.choices,
+                'notification_type': Notification.Type.choices,
+            },
+            total=Count('pk')
+        )
+        by_status = data['status']
         
         stats = {
-            'total': queryset.count(),
-            'unread': queryset.filter(status__in=[Notification.Status.PENDING, Notification.Status.SENT]).count(),
-            'read': queryset.filter(status=Notification.Status.READ).count(),
-            'failed': queryset.filter(status=Notification.Status.FAILED).count(),
-            'by_type': {}
+            'total': data['total'],
+            'unread': by_status[Notification.Status.PENDING] + by_status[Notification.Status.SENT],
+            'read': by_status[Notification.Status.READ],
+            'failed': by_status[Notification.Status.FAILED],
+            'by_type': data['notification_type']
         }
         
-        # Count by type
-        for notif_type in Notification.Type.choices:
-            count = queryset.filter(notification_type=notif_type[0]).count()
-            stats['by_type'][notif_type[0]] = count
-        
         return APIResponse.success(stats)
 
 
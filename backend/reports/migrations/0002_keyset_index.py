@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 09:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='report',
+            index=models.Index(fields=['-created_at', '-id'], name='report_created_id_idx'),
+        ),
+    ]
@@ -72,6 +72,7 @@ class Report(models.Model):
         indexes = [
             models.Index(fields=['inspection', 'created_at']),
             models.Index(fields=['status']),
+            models.Index(fields=['-created_at', '-id'], name='report_created_id_idx'),
         ]
     
     def __str__(self):
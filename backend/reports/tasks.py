@@ -0,0 +1,59 @@
+"""
+Background tasks for Reports app
+
+A report is created PENDING and queued once its transaction commits; the
+worker moves it to GENERATING, renders the PDF and leaves it COMPLETED
+(with file and file_size) or FAILED (with error_message). Clients follow
+the job through the report's status endpoint.
+"""
+from celery import shared_task
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from .models import Report
+from .services import InspectionReportGenerator
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_report(report):
+    """Queue the PDF of a PENDING report after the current transaction commits"""
+    def send():
+        try:
+            generate_report.delay(str(report.pk))
+        except Exception as e:
+            # Broker down: fail the job now instead of leaving it PENDING
+            logger.error(f"Cannot queue report {report.pk}: {str(e)}")
+            Report.objects.filter(pk=report.pk, status=Report.Status.PENDING).update(
+                status=Report.Status.FAILED,
+                error_message=f'No se pudo encolar la generación: {e}',
+                updated_at=timezone.now(),
+            )
+
+    transaction.on_commit(send)
+
+
+@shared_task(ignore_result=True)
+def generate_report(report_id):
+    """Render the PDF of a queued report and record the outcome"""
+    # Only a PENDING report is taken, so a redelivered job does nothing
+    claimed = Report.objects.filter(pk=report_id, status=Report.Status.PENDING).update(
+        status=Report.Status.GENERATING, error_message='', updated_at=timezone.now(),
+    )
+    if not claimed:
+        return
+
+    report = Report.objects.select_related('inspection').get(pk=report_id)
+    try:
+        pdf_data = InspectionReportGenerator(report.inspection).generate()
+        report.file.save(f"reporte_{report.report_number}.pdf", ContentFile(pdf_data), save=False)
+        report.file_size = len(pdf_data)
+        report.status = Report.Status.COMPLETED
+        report.error_message = ''
+        logger.info(f"Report {report.report_number} generated")
+    except Exception as e:
+        logger.exception(f"Error generating report {report.id}: {str(e)}")
+        report.status = Report.Status.FAILED
+        report.error_message = str(e)
+    report.save(update_fields=['file', 'file_size', 'status', 'error_message', 'updated_at'])
@@ -0,0 +1,152 @@
+"""
+Tests for Reports app
+"""
+import pytest
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.celery import app as celery_app
+from inspections.models import Inspection
+from .models import Report
+from .services import InspectionReportGenerator
+from .tasks import generate_report
+from .views import ReportViewSet
+
+User = get_user_model()
+
+
+@pytest.fixture
+def factory():
+    return APIRequestFactory()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture
+def eager(monkeypatch):
+    """Run queued jobs in-process, with no broker"""
+    # Namespaced key: the app reads its config from the CELERY_* settings
+    monkeypatch.setitem(celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', True)
+
+
+@pytest.fixture
+def admin_user(db):
+    return User.objects.create_user(
+        username='admin', email='admin@test.com', password='testpass123',
+        first_name='Admin', last_name='Test', role=User.Role.ADMIN,
+    )
+
+
+@pytest.fixture
+def inspector_user(db):
+    return User.objects.create_user(
+        username='inspector', email='inspector@test.com', password='testpass123',
+        first_name='Inspector', last_name='Test', role=User.Role.INSPECTOR,
+    )
+
+
+@pytest.fixture
+def inspection(db, inspector_user):
+    client = User.objects.create_user(
+        username='cliente', email='cliente@test.com', password='testpass123',
+        first_name='Cliente', last_name='Test', role=User.Role.USER,
+    )
+    return Inspection.objects.create(
+        user=client,
+        inspector=inspector_user,
+        address='Calle 1',
+        status=Inspection.Status.COMPLETED,
+        result=Inspection.Result.APPROVED,
+        total_score=95,
+        scheduled_date=timezone.now(),
+        completed_at=timezone.now(),
+    )
+
+
+def call(factory, user, action, method='post', data=None, pk=None):
+    view = ReportViewSet.as_view({method: action})
+    url = f'/api/reports/{pk}/{action}/' if pk else '/api/reports/'
+    request = getattr(factory, method)(url, data, format='json')
+    force_authenticate(request, user=user)
+    return view(request, pk=pk) if pk else view(request)
+
+
+@pytest.mark.django_db
+class TestReportJobs:
+    """Test queued PDF generation and its job status"""
+
+    def test_create_queues_and_worker_completes(self, factory, admin_user, inspector_user, inspection, eager,
+                                                django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            response = call(factory, inspector_user, 'create', data={'inspection': str(inspection.id)})
+        assert response.status_code == 202
+        job = response.data['data']
+        assert job['status'] == Report.Status.PENDING
+        # Nothing is rendered before the transaction commits
+        assert Report.objects.get(pk=job['job_id']).status == Report.Status.PENDING
+
+        polled = call(factory, admin_user, 'job_status', method='get', pk=job['job_id'])
+        assert polled['Retry-After'] == '2'
+
+        for callback in callbacks:
+            callback()
+        report = Report.objects.get(pk=job['job_id'])
+        assert report.status == Report.Status.COMPLETED
+        assert report.file_size == report.file.size > 0
+
+        polled = call(factory, admin_user, 'job_status', method='get', pk=report.pk)
+        assert polled.data['data']['status'] == Report.Status.COMPLETED
+        assert polled.data['data']['file_size'] == report.file_size
+        assert not polled.has_header('Retry-After')
+
+    def test_worker_records_failures(self, factory, inspector_user, inspection, eager, monkeypatch,
+                                     django_capture_on_commit_callbacks):
+        def broken(self):
+            raise ValueError('sin fotos')
+        monkeypatch.setattr(InspectionReportGenerator, 'generate', broken)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = call(factory, inspector_user, 'create', data={'inspection': str(inspection.id)})
+
+        report = Report.objects.get(pk=response.data['data']['job_id'])
+        assert report.status == Report.Status.FAILED
+        assert report.error_message == 'sin fotos'
+
+    def test_unreachable_broker_fails_the_job(self, factory, inspector_user, inspection, monkeypatch,
+                                              django_capture_on_commit_callbacks):
+        def unreachable(*args, **kwargs):
+            raise ConnectionError('broker down')
+        monkeypatch.setattr(generate_report, 'delay', unreachable)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = call(factory, inspector_user, 'create', data={'inspection': str(inspection.id)})
+
+        report = Report.objects.get(pk=response.data['data']['job_id'])
+        assert report.status == Report.Status.FAILED
+        assert 'broker down' in report.error_message
+
+    def test_regenerate(self, factory, admin_user, inspector_user, inspection, eager,
+                        django_capture_on_commit_callbacks):
+        report = Report.objects.create(inspection=inspection, generated_by=inspector_user,
+                                       status=Report.Status.GENERATING)
+
+        assert call(factory, admin_user, 'regenerate', pk=report.pk).status_code == 409
+
+        # A job that outlived the worker time limit was lost
+        Report.objects.filter(pk=report.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        with django_capture_on_commit_callbacks(execute=True):
+            response = call(factory, admin_user, 'regenerate', pk=report.pk)
+        assert response.status_code == 202
+        report.refresh_from_db()
+        assert report.status == Report.Status.COMPLETED
+
+    def test_redelivered_job_does_nothing(self, inspector_user, inspection):
+        report = Report.objects.create(inspection=inspection, generated_by=inspector_user,
+                                       status=Report.Status.COMPLETED, file_size=10)
+        generate_report(str(report.pk))
+        report.refresh_from_db()
+        assert (report.status, report.file_size) == (Report.Status.COMPLETED, 10)
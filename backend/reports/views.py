@@ -4,13 +4,15 @@ Views for Reports app
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.http import FileResponse
-from django.core.files.base import ContentFile
+from django.utils import timezone
 from core.utils.permissions import IsAdminOrInspector, IsOwnerOrInspectorOrAdmin
 from core.utils.response import APIResponse
 from .models import Report
 from .serializers import ReportSerializer, ReportCreateSerializer
-from .services import InspectionReportGenerator
+from .tasks import enqueue_report
+from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,8 @@ class ReportViewSet(viewsets.ModelViewSet):
     """
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
+    # Jobs a worker has not finished yet (reports.tasks)
+    IN_PROGRESS = (Report.Status.PENDING, Report.Status.GENERATING)
     
     def get_permissions(self):
         if self.action in ['create', 'generate']:
@@ -47,43 +51,41 @@ class ReportViewSet(viewsets.ModelViewSet):
         return ReportSerializer
     
     def create(self, request, *args, **kwargs):
-        """Create and generate a report"""
+        """Create a report and queue its PDF; 202 with the job to follow"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Create report
-        report = serializer.save(generated_by=request.user, status=Report.Status.GENERATING)
+        report = serializer.save(generated_by=request.user, status=Report.Status.PENDING)
+        enqueue_report(report)
+        logger.info(f"Report {report.report_number} queued by {request.user.email}")
         
-        try:
-            # Generate PDF
-            generator = InspectionReportGenerator(report.inspection)
-            pdf_data = generator.generate()
-            
-            # Save PDF file
-            filename = f"reporte_{report.report_number}.pdf"
-            report.file.save(filename, ContentFile(pdf_data), save=False)
-            report.file_size = len(pdf_data)
-            report.status = Report.Status.COMPLETED
-            report.save()
-            
-            logger.info(f"Report {report.report_number} generated successfully by {request.user.email}")
-            
-            return APIResponse.created(
-                ReportSerializer(report).data,
-                message="Reporte generado exitosamente"
-            )
-            
-        except Exception as e:
-            logger.error(f"Error generating report {report.id}: {str(e)}")
-            report.status = Report.Status.FAILED
-            report.error_message = str(e)
-            report.save()
-            
-            return APIResponse.error(
-                message="Error al generar el reporte",
-                details=str(e),
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        return APIResponse.success(
+            self.job_data(report),
+            message="Reporte en cola de generación",
+            status_code=status.HTTP_202_ACCEPTED
+        )
+    
+    @staticmethod
+    def job_data(report):
+        """Job status of a report; poll it at <id>/status/"""
+        return {
+            'job_id': str(report.id),
+            'report_number': report.report_number,
+            'status': report.status,
+            'status_display': report.get_status_display(),
+            'file_size': report.file_size,
+            'error_message': report.error_message,
+        }
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def job_status(self, request, pk=None):
+        """Poll a report's generation job"""
+        report = self.get_object()
+        response = APIResponse.success(self.job_data(report), message=report.get_status_display())
+        if report.status in self.IN_PROGRESS:
+            # Hint for pollers
+            response['Retry-After'] = '2'
+        return response
     
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
@@ -119,7 +121,7 @@ class ReportViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def regenerate(self, request, pk=None):
-        """Regenerate a report"""
+        """Queue a report's PDF again; 202 with the job to follow"""
         report = self.get_object()
         
         # Check permissions
@@ -128,37 +130,22 @@ class ReportViewSet(viewsets.ModelViewSet):
                 message="No tiene permisos para regenerar este reporte"
             )
         
-        try:
-            report.status = Report.Status.GENERATING
-            report.save()
-            
-            # Generate PDF
-            generator = InspectionReportGenerator(report.inspection)
-            pdf_data = generator.generate()
-            
-            # Update PDF file
-            filename = f"reporte_{report.report_number}.pdf"
-            report.file.save(filename, ContentFile(pdf_data), save=False)
-            report.file_size = len(pdf_data)
-            report.status = Report.Status.COMPLETED
-            report.error_message = ''
-            report.save()
-            
-            logger.info(f"Report {report.report_number} regenerated by {request.user.email}")
-            
-            return APIResponse.success(
-                ReportSerializer(report).data,
-                message="Reporte regenerado exitosamente"
-            )
-            
-        except Exception as e:
-            logger.error(f"Error regenerating report {report.id}: {str(e)}")
-            report.status = Report.Status.FAILED
-            report.error_message = str(e)
-            report.save()
-            
+        # A job still running blocks a new one, unless it outlived the worker time limit
+        stale_before = timezone.now() - timedelta(seconds=settings.CELERY_TASK_TIME_LIMIT)
+        if report.status in self.IN_PROGRESS and report.updated_at > stale_before:
             return APIResponse.error(
-                message="Error al regenerar el reporte",
-                details=str(e),
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+                message="El reporte ya se está generando",
+                status_code=status.HTTP_409_CONFLICT
             )
+        
+        report.status = Report.Status.PENDING
+        report.error_message = ''
+        report.save(update_fields=['status', 'error_message', 'updated_at'])
+        enqueue_report(report)
+        logger.info(f"Report {report.report_number} queued for regeneration by {request.user.email}")
+        
+        return APIResponse.success(
+            self.job_data(report),
+            message="Reporte en cola de regeneración",
+            status_code=status.HTTP_202_ACCEPTED
+        )
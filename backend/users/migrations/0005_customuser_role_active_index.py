@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:07
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0004_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customuser',
+            index=models.Index(fields=['role', 'is_active'], name='user_role_active_idx'),
+        ),
+        # Indexes created by hand from the former SUGGESTED_INDEXES script,
+        # now covered by the ones above or by the foreign key indexes
+        migrations.RunSQL(
+            [
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_users_email',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_users_role',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_users_active',
+                'DROP INDEX CONCURRENTLY IF EXISTS idx_users_role_active',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
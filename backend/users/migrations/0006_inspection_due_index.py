@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-16 23:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0005_customuser_role_active_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customuser',
+            index=models.Index(
+                fields=['role', 'is_active', 'next_inspection_due'],
+                include=('last_inspection_date',),
+                name='user_inspection_due_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-17 10:12
+
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0006_inspection_due_index'),
+    ]
+
+    # Both are prefixes of user_inspection_due_idx
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='customuser',
+            name='users_custo_role_6a37b1_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='customuser',
+            name='user_role_active_idx',
+        ),
+    ]
@@ -4,6 +4,7 @@ Custom User Model with role-based authentication
 """
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.core.validators import RegexValidator
 from phonenumber_field.modelfields import PhoneNumberField
 from core.utils.validators import validate_dni
@@ -153,7 +154,15 @@ class CustomUser(AbstractUser):
         indexes = [
             models.Index(fields=['email']),
             models.Index(fields=['dni']),
-            models.Index(fields=['role']),
+            # Due-client lists (appointments.services.DueClientService): the
+            # range on next_inspection_due and the last_inspection_date
+            # fallback are both answered from the index. Its (role) and
+            # (role, is_active) prefixes also serve the role filters
+            models.Index(
+                fields=['role', 'is_active', 'next_inspection_due'],
+                include=['last_inspection_date'],
+                name='user_inspection_due_idx',
+            ),
         ]
     
     def __str__(self):
@@ -232,7 +241,8 @@ class AuditLog(models.Model):
     object_id = models.CharField(max_length=100, blank=True, null=True)
     description = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the action happens: rows are written later, in batches
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-timestamp']
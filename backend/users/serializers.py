@@ -1,6 +1,8 @@
 # users/serializers.py
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import CustomUser
+from .tokens import RoleRefreshToken
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -43,3 +45,8 @@ class InspectorSerializer(serializers.ModelSerializer):
             "full_name",
             "phone_number",
         ]
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair with the ``role`` claim (SIMPLE_JWT['TOKEN_OBTAIN_SERIALIZER'])"""
+    token_class = RoleRefreshToken
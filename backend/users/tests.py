@@ -1,3 +1,191 @@
-from django.test import TestCase
+"""
+Tests for Users app
+"""
+import pytest
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import AccessToken
+from appointments.models import Appointment
+from core.middleware.performance import identify_request
+from .serializers import RoleTokenObtainPairSerializer
+from .views import inspector_history, inspector_leaderboard
 
-# Create your tests here.
+User = get_user_model()
+
+# Arrival against the scheduled time and visit length, in seconds
+VISITS = [
+    (-600, 3600),   # early
+    (-330, 2700),   # -5.5 min truncates to -5: early
+    (-270, 0),      # on time, zero-minute visit
+    (659, 1830),    # 10.98 min truncates to 10: on time
+    (660, 5400),    # late by 11
+    (3000, None),   # late, still open
+    (None, None),   # never started
+]
+
+
+@pytest.fixture
+def factory():
+    return APIRequestFactory()
+
+
+@pytest.fixture
+def admin_user(db):
+    return User.objects.create_user(
+        username='admin', email='admin@test.com', password='testpass123',
+        first_name='Admin', last_name='Test', role=User.Role.ADMIN,
+    )
+
+
+def make_inspector(name):
+    return User.objects.create_user(
+        username=name, email=f'{name}@test.com', password='testpass123',
+        first_name=name.title(), last_name='Test', role=User.Role.INSPECTOR,
+    )
+
+
+def complete(inspector, day, start_offset, length, hour=9):
+    scheduled = timezone.make_aware(datetime.combine(day, time(hour)))
+    start = scheduled + timedelta(seconds=start_offset) if start_offset is not None else None
+    end = start + timedelta(seconds=length) if start is not None and length is not None else None
+    return Appointment.objects.create(
+        client_name='Cliente', client_phone='3000000000', address='Calle 1',
+        scheduled_date=day, scheduled_time=time(hour), inspector=inspector,
+        status=Appointment.Status.COMPLETED, actual_start_time=start, actual_end_time=end,
+    )
+
+
+@pytest.fixture
+def inspector(db):
+    inspector = make_inspector('veterano')
+    for index, (offset, length) in enumerate(VISITS):
+        complete(inspector, date(2026, 3, 1) + timedelta(days=index), offset, length)
+    # Not completed: outside the history
+    Appointment.objects.create(
+        client_name='Cliente', client_phone='3000000000', address='Calle 1',
+        scheduled_date=date(2026, 4, 1), scheduled_time=time(9), inspector=inspector,
+        actual_start_time=timezone.now(),
+    )
+    return inspector
+
+
+def get(factory, view, user, query='', **kwargs):
+    request = factory.get(f'/api/users/admin/inspectors/{query}')
+    force_authenticate(request, user=user)
+    return view(request, **kwargs)
+
+
+@pytest.mark.django_db
+class TestInspectorHistory:
+    """Test the SQL-computed punctuality of inspector_history"""
+
+    def test_matches_the_model_properties(self, factory, admin_user, inspector):
+        with CaptureQueriesContext(connection) as queries:
+            response = get(factory, inspector_history, admin_user, inspector_id=inspector.id)
+        # Inspector, statistics, history
+        assert len(queries) == 3
+
+        appointments = {
+            str(apt.id): apt for apt in Appointment.objects.filter(inspector=inspector, status='COMPLETED')
+        }
+        history = response.data['history']
+        assert len(history) == len(VISITS)
+        for item in history:
+            apt = appointments[item['id']]
+            assert item['punctuality_minutes'] == apt.punctuality_minutes
+            assert item['punctuality_status'] == apt.punctuality_status
+            assert item['duration_minutes'] == apt.duration_minutes
+        assert [item['punctuality_status'] for item in reversed(history)] == [
+            'EARLY', 'EARLY', 'ON_TIME', 'ON_TIME', 'LATE', 'LATE', 'NOT_STARTED',
+        ]
+
+        assert response.data['statistics'] == {
+            'total_completed': 7,
+            'total_with_tracking': 6,
+            'on_time_count': 2,
+            'early_count': 2,
+            'late_count': 2,
+            'punctuality_rate': 66.7,
+            'avg_delay_minutes': 30.5,
+            # The zero-minute visit is left out
+            'avg_duration_minutes': round((60 + 45 + 30 + 90) / 4, 1),
+        }
+
+    def test_cursor_pages(self, factory, admin_user, inspector):
+        full = get(factory, inspector_history, admin_user, inspector_id=inspector.id).data['history']
+
+        seen = []
+        query = '?cursor=&page_size=3'
+        while query:
+            response = get(factory, inspector_history, admin_user, query, inspector_id=inspector.id)
+            seen.extend(response.data['history']['results'])
+            assert response.data['statistics']['total_completed'] == 7
+            following = response.data['history']['next']
+            query = '?' + following.split('?', 1)[1] if following else None
+        assert seen == full
+
+    def test_admin_only(self, factory, inspector):
+        assert get(factory, inspector_history, inspector, inspector_id=inspector.id).status_code == 403
+
+
+@pytest.mark.django_db
+class TestInspectorLeaderboard:
+    """Test the cross-inspector punctuality ranking"""
+
+    def test_ranking_from_one_query(self, factory, admin_user, inspector):
+        punctual = make_inspector('puntual')
+        for day in range(3):
+            complete(punctual, date(2026, 3, 1) + timedelta(days=day), 0, 3600)
+        late = make_inspector('tarde')
+        complete(late, date(2026, 3, 1), 1800, 3600)
+        make_inspector('nuevo')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = get(factory, inspector_leaderboard, admin_user)
+        assert len(queries) == 1
+
+        ranking = response.data['leaderboard']
+        assert [row['inspector_id'] for row in ranking] == [str(punctual.id), str(inspector.id), str(late.id)]
+        assert [row['position'] for row in ranking] == [1, 2, 3]
+        assert ranking[0]['punctuality_rate'] == 100.0
+        assert ranking[0]['full_name'] == 'Puntual Test'
+        assert ranking[1] == {
+            'inspector_id': str(inspector.id), 'full_name': 'Veterano Test', 'position': 2,
+            **get(factory, inspector_history, admin_user, inspector_id=inspector.id).data['statistics'],
+        }
+
+        response = get(factory, inspector_leaderboard, admin_user, '?date_from=2026-03-02&min_tracked=2')
+        assert [row['inspector_id'] for row in response.data['leaderboard']] == [str(punctual.id), str(inspector.id)]
+
+    def test_invalid_parameters(self, factory, admin_user, inspector):
+        assert get(factory, inspector_leaderboard, admin_user, '?date_from=ayer').status_code == 400
+        assert get(factory, inspector_leaderboard, inspector).status_code == 403
+
+
+@pytest.mark.django_db
+class TestRoleClaim:
+    """Test the role claim RateLimitMiddleware reads from access tokens"""
+
+    @pytest.mark.parametrize('rotate', [True, False])
+    def test_refreshed_access_token_keeps_the_role(self, monkeypatch, rotate):
+        """Access tokens from a refresh carry the role, with or without rotation"""
+        make_inspector('rotado')
+        pair = RoleTokenObtainPairSerializer(data={'email': 'rotado@test.com', 'password': 'testpass123'})
+        assert pair.is_valid(), pair.errors
+        assert AccessToken(pair.validated_data['access'])['role'] == User.Role.INSPECTOR
+
+        # The serializer holds its own reference to the token settings
+        monkeypatch.setattr('rest_framework_simplejwt.serializers.api_settings.ROTATE_REFRESH_TOKENS', rotate)
+        refreshed = TokenRefreshSerializer(data={'refresh': pair.validated_data['refresh']})
+        assert refreshed.is_valid(), refreshed.errors
+        assert ('refresh' in refreshed.validated_data) is rotate
+
+        access = refreshed.validated_data['access']
+        request = RequestFactory().get('/api/appointments/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        assert identify_request(request)[1] == User.Role.INSPECTOR
@@ -0,0 +1,16 @@
+# users/tokens.py
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's ``role``. Access tokens copy the claims
+    of the refresh token they come from (at login and on every refresh), so
+    middleware can apply per-role limits without a query.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        return token
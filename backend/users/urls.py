@@ -15,6 +15,7 @@ from .views import (
     list_inspectors,
     list_clients,
     inspector_history,
+    inspector_leaderboard,
 )
 
 urlpatterns = [
@@ -34,6 +35,7 @@ urlpatterns = [
     path("admin/users/<uuid:user_id>/", manage_user, name="manage_user"),
     path("admin/users/<uuid:user_id>/reset-password/", reset_user_password, name="reset_user_password"),
     path("admin/inspectors/<uuid:inspector_id>/history/", inspector_history, name="inspector_history"),
+    path("admin/inspectors/leaderboard/", inspector_leaderboard, name="inspector_leaderboard"),
 
     # Password Management
     path("change-password/", change_password, name="change_password"),
@@ -8,9 +8,10 @@ from django.http import JsonResponse
 from .decorators import role_required
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.core.mail import send_mail
+from django.db import transaction
 from django.utils.crypto import get_random_string
 from django.utils.decorators import method_decorator
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RoleRefreshToken
 from .utils import generate_temp_password
 
 
@@ -41,7 +42,7 @@ def login_view(request):
     login(request, user)
     
     # Generate JWT tokens
-    refresh = RefreshToken.for_user(user)
+    refresh = RoleRefreshToken.for_user(user)
     access_token = str(refresh.access_token)
     
     redirect_to = "home"
@@ -88,6 +89,7 @@ class InspectorPanelView(View):
         return JsonResponse({"message": "Bienvenido Inspector"})
 
 # ------------------ REGISTRO POR INSPECTOR ------------------
+@transaction.non_atomic_requests
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_client(request):
@@ -117,7 +119,9 @@ def create_client(request):
     # Serializar
     serializer = UserSerializer(data=data)
     if serializer.is_valid():
-        user = serializer.save()
+        # Commit before sending the email, which can take seconds
+        with transaction.atomic():
+            user = serializer.save()
         try:
             # Enviar correo
             send_mail(
@@ -491,7 +495,11 @@ def list_clients(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def inspector_history(request, inspector_id):
-    """Admin can view history and statistics for an inspector"""
+    """
+    Admin can view history and statistics for an inspector.
+    The history is paginated with ?cursor= or ?page=; without them the
+    full list is returned.
+    """
     if request.user.role != 'ADMIN':
         return Response({"error": "No autorizado"}, status=403)
     
@@ -500,32 +508,17 @@ def inspector_history(request, inspector_id):
     except User.DoesNotExist:
         return Response({"error": "Inspector no encontrado"}, status=404)
     
-    from appointments.models import Appointment
-    from django.db.models import Avg, Count, Q
-    from datetime import timedelta
+    from appointments.services import PunctualityService
+    from appointments.views import AppointmentPagination
     
-    # Obtener todas las citas completadas del inspector
-    appointments = Appointment.objects.filter(
-        inspector=inspector,
-        status='COMPLETED'
-    ).order_by('-scheduled_date', '-scheduled_time')
+    # Puntualidad y duración calculadas en la consulta (appt_inspector_completed_idx)
+    appointments = PunctualityService.completed(inspector=inspector).only(
+        'id', 'client_name', 'address', 'scheduled_date', 'scheduled_time',
+        'actual_start_time', 'actual_end_time',
+    ).order_by('-scheduled_date', '-scheduled_time', '-id')
     
-    # Estadísticas de puntualidad
-    completed_with_start = appointments.filter(actual_start_time__isnull=False)
-    
-    total_completed = appointments.count()
-    total_with_tracking = completed_with_start.count()
-    
-    # Calcular puntualidad
-    on_time_count = 0
-    early_count = 0
-    late_count = 0
-    total_delay_minutes = 0
-    
-    history_list = []
-    
-    for apt in appointments:
-        history_item = {
+    def history_item(apt):
+        return {
             'id': str(apt.id),
             'client_name': apt.client_name,
             'address': apt.address,
@@ -533,29 +526,10 @@ def inspector_history(request, inspector_id):
             'scheduled_time': apt.scheduled_time.strftime('%H:%M'),
             'actual_start_time': apt.actual_start_time.isoformat() if apt.actual_start_time else None,
             'actual_end_time': apt.actual_end_time.isoformat() if apt.actual_end_time else None,
-            'punctuality_minutes': apt.punctuality_minutes,
-            'punctuality_status': apt.punctuality_status,
-            'duration_minutes': apt.duration_minutes,
+            'punctuality_minutes': apt.punctuality_delay,
+            'punctuality_status': apt.punctuality_state,
+            'duration_minutes': apt.worked_minutes,
         }
-        history_list.append(history_item)
-        
-        # Contar estadísticas
-        if apt.punctuality_status == 'ON_TIME':
-            on_time_count += 1
-        elif apt.punctuality_status == 'EARLY':
-            early_count += 1
-        elif apt.punctuality_status == 'LATE':
-            late_count += 1
-            if apt.punctuality_minutes:
-                total_delay_minutes += apt.punctuality_minutes
-    
-    # Calcular porcentajes y promedios
-    punctuality_rate = round((on_time_count + early_count) / total_with_tracking * 100, 1) if total_with_tracking > 0 else 0
-    avg_delay = round(total_delay_minutes / late_count, 1) if late_count > 0 else 0
-    
-    # Duración promedio
-    durations = [apt.duration_minutes for apt in appointments if apt.duration_minutes]
-    avg_duration = round(sum(durations) / len(durations), 1) if durations else 0
     
     # Información del inspector
     inspector_data = {
@@ -567,21 +541,52 @@ def inspector_history(request, inspector_id):
         'date_joined': inspector.date_joined.isoformat(),
     }
     
-    # Estadísticas
-    statistics = {
-        'total_completed': total_completed,
-        'total_with_tracking': total_with_tracking,
-        'on_time_count': on_time_count,
-        'early_count': early_count,
-        'late_count': late_count,
-        'punctuality_rate': punctuality_rate,
-        'avg_delay_minutes': avg_delay,
-        'avg_duration_minutes': avg_duration,
-    }
+    # Estadísticas en una sola consulta de agregación
+    statistics = PunctualityService.statistics(inspector.id)
+    
+    if AppointmentPagination.requested(request):
+        paginator = AppointmentPagination()
+        page = paginator.paginate_queryset(appointments, request)
+        history = paginator.get_paginated_response([history_item(apt) for apt in page]).data
+    else:
+        history = [history_item(apt) for apt in appointments]
     
     return Response({
         "success": True,
         "inspector": inspector_data,
         "statistics": statistics,
-        "history": history_list
+        "history": history
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def inspector_leaderboard(request):
+    """
+    Admin ranking of inspectors by punctuality, from one grouped query.
+    Optional ?date_from=, ?date_to= (YYYY-MM-DD) and ?min_tracked=.
+    """
+    if request.user.role != 'ADMIN':
+        return Response({"error": "No autorizado"}, status=403)
+    
+    from appointments.services import PunctualityService
+    from datetime import datetime
+    
+    try:
+        date_from, date_to = (
+            datetime.strptime(request.GET[name], '%Y-%m-%d').date() if request.GET.get(name) else None
+            for name in ('date_from', 'date_to')
+        )
+        min_tracked = int(request.GET.get('min_tracked', 1))
+    except ValueError:
+        return Response({"error": "Parámetros inválidos: fechas YYYY-MM-DD y min_tracked entero"}, status=400)
+    
+    ranking = PunctualityService.leaderboard(date_from=date_from, date_to=date_to, min_tracked=min_tracked)
+    for position, row in enumerate(ranking, start=1):
+        row['position'] = position
+    
+    return Response({
+        "success": True,
+        "total": len(ranking),
+        "leaderboard": ranking
     })